@@ -31,5 +31,18 @@ __url__         = 'https://github.com/makotoon/git_bundle_manager'
 import sys
 from gitbundle.gitbundlemng import *
 from gitbundle.gitrepo import *
+from gitbundle.bundlecatalog import *
+from gitbundle.tipledger import *
+from gitbundle.refsnapshot import *
+from gitbundle.bundleheader import *
+from gitbundle.refreader import *
+from gitbundle.origincache import *
+from gitbundle.bundlechunk import *
+from gitbundle.bundlemanifest import *
+from gitbundle.scriptemitter import *
+from gitbundle.runmetrics import *
+from gitbundle.repodiscovery import *
+from gitbundle.bundleretention import *
+from gitbundle.jsonstate import *
 
 
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+#
+# gitbundle/bundlecatalog.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# ======================================================================================
+# Copyright (c) 2021 Makoto Maeda
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense,and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# ======================================================================================
+
+
+import bisect
+import gitbundle
+import json
+import os
+
+class bundlecatalog:
+    """
+    Bundle catalog module.
+
+    Scans a bundle directory once and keeps an in-memory index of the bundle files
+    keyed by (repository_name, branch_name), so that the bundles of a repository can be
+    looked up without re-scanning the directory for every configured repository.
+
+    The bundles of each (repository_name, branch_name) pair are kept ordered by their
+    bundle_datetime, the last entry being the most recent bundle. A bundle holding multiple
+    branches is listed under each branch, with 'branch_name' set to that branch.
+
+    Optionally, the parsed file information can be persisted to an index file. On refresh
+    only the files whose name or mtime differ from the index entry are parsed again.
+    An index written with another INDEX_VERSION is discarded.
+    """
+
+    # Version of the index file format, to be incremented whenever the parsed information changes
+    INDEX_VERSION = 1
+
+    def __init__(self, bundle_dir:str, parse_bundle_name, index_file:str=''):
+        """
+        Parameters
+        ----------
+            bundle_dir : str
+                directory containing bundle files
+            parse_bundle_name : callable
+                function parsing a bundle file name into bundle information dictionary.
+                (see gitbundlemng.parse_bundle_name())
+            index_file : str
+                path to the on-disk index file. The index is kept in memory only if empty.
+        """
+        self._bundle_dir  = bundle_dir
+        self._parse       = parse_bundle_name
+        self._index_file  = index_file
+        self._files       = {}
+        self._sizes       = {}
+        self._index       = {}
+        self._repo_index  = {}
+
+        self.__load_index()
+        self.refresh()
+
+
+    def refresh(self):
+        """
+        Rescans the bundle directory and updates the catalog.
+        Only new files and files with modified mtime are parsed.
+        """
+        files     = {}
+        sizes     = {}
+        manifests = []
+        updated   = False
+
+        if os.path.isdir(self._bundle_dir):
+            with os.scandir(self._bundle_dir) as it:
+                for entry in it:
+                    if entry.name.endswith('.bundle.chunks.json'):
+                        manifests.append(entry.name)
+                        continue
+                    if not(entry.name.endswith('.bundle')) or not(entry.is_file()):
+                        continue
+
+                    sizes[entry.name] = entry.stat().st_size
+                    mtime  = entry.stat().st_mtime
+                    cached = self._files.get(entry.name)
+                    if (cached is not None) and (cached['mtime'] == mtime):
+                        files[entry.name] = cached
+                        continue
+
+                    try:
+                        info = self._parse(entry.name)
+                    except (AssertionError, AttributeError):
+                        # Not a bundle file following the naming convention
+                        info = None
+
+                    files[entry.name] = {'mtime': mtime, 'info': info}
+                    updated = True
+
+        # Bundles split into chunks (see bundlechunk) are ignored until they are complete
+        for manifest in manifests:
+            file_name = manifest[:-len('.chunks.json')]
+            if (file_name in files) and not(self.__is_complete(manifest, sizes[file_name])):
+                del files[file_name]
+
+        if files.keys() != self._files.keys():
+            updated = True
+
+        self._files = files
+        self._sizes = sizes
+        self.__build_index()
+
+        if updated:
+            self.__save_index()
+
+
+    def find(self, repository_name:str, branch_name:str) -> dict:
+        """
+        Finds the most recent bundle for the specified repository and branch.
+
+        Parameters
+        ----------
+            repository_name : str
+                name of repository
+            branch_name : str
+                name of branch
+
+        Returns
+        ----------
+            bundle_info : dict
+                bundle information dictionary (see gitbundlemng.parse_bundle_name()).
+                None if there is no bundle for the repository and branch.
+        """
+        bundle_infos = self._index.get((repository_name, branch_name))
+        if not(bundle_infos):
+            return None
+
+        return bundle_infos[-1][2]
+
+
+    def find_all(self, repository_name:str, branch_name:str) -> list:
+        """
+        Finds all bundles for the specified repository and branch.
+
+        Returns
+        ----------
+            bundle_info_list : list
+                list of bundle information dictionary ordered from the oldest to the most recent.
+        """
+        return [bundle_info for _, _, bundle_info in self._index.get((repository_name, branch_name), [])]
+
+
+    def find_repository(self, repository_name:str) -> list:
+        """
+        Finds the most recent bundle of every branch for the specified repository.
+
+        Parameters
+        ----------
+            repository_name : str
+                name of repository
+
+        Returns
+        ----------
+            bundle_info_list : list
+                list of bundle information dictionary, one per branch.
+        """
+        return [self.find(repository_name, branch_name)
+                for branch_name in self._repo_index.get(repository_name, [])]
+
+
+    def get_bundle_list(self) -> list:
+        """
+        Retrieves the most recent bundle of every repository and branch in the catalog.
+
+        Returns
+        ----------
+            bundle_info_list : list
+                list of bundle information dictionary.
+        """
+        return [bundle_infos[-1][2] for bundle_infos in self._index.values()]
+
+
+    def get_file_list(self) -> list:
+        """
+        Retrieves every bundle file in the catalog, including the older bundles of each branch.
+
+        Returns
+        ----------
+            bundle_info_list : list
+                list of bundle information dictionary, with the file size in bytes as 'size',
+                ordered from the oldest to the most recent.
+        """
+        bundle_infos = [dict(file_entry['info'], size=self._sizes[file_name])
+                        for file_name, file_entry in self._files.items() if file_entry['info'] is not None]
+
+        return sorted(bundle_infos, key=lambda bundle_info: (bundle_info['bundle_datetime'], bundle_info['file_name']))
+
+
+    def __build_index(self):
+        self._index      = {}
+        self._repo_index = {}
+
+        for file_name, file_entry in self._files.items():
+            info = file_entry['info']
+            if info is None:
+                continue
+
+            # A bundle holding multiple branches is indexed under each of them
+            for branch_name in info.get('branch_names', [info['branch_name']]):
+                branch_info = dict(info, branch_name=branch_name)
+                key = (info['repository_name'], branch_name)
+                bisect.insort(self._index.setdefault(key, []),
+                              (info['bundle_datetime'], file_name, branch_info))
+                self._repo_index.setdefault(info['repository_name'], []).append(branch_name)
+
+        for repository_name in self._repo_index:
+            self._repo_index[repository_name] = sorted(set(self._repo_index[repository_name]))
+
+
+    def __is_complete(self, manifest, size):
+        try:
+            with open(os.path.join(self._bundle_dir, manifest), 'r') as fr:
+                return json.load(fr)['size'] == size
+        except (OSError, ValueError, KeyError):
+            return False
+
+
+    def __load_index(self):
+        if not(self._index_file):
+            return
+
+        # A broken index reads as empty and is rebuilt from scratch
+        index = gitbundle.jsonstate(self._index_file).load()
+        if (index.get('version') == self.INDEX_VERSION) and (index.get('bundle_dir') == self._bundle_dir):
+            self._files = index.get('files', {})
+
+
+    def __save_index(self):
+        if not(self._index_file):
+            return
+
+        gitbundle.jsonstate(self._index_file).save({'version': self.INDEX_VERSION, 'bundle_dir': self._bundle_dir, 'files': self._files})
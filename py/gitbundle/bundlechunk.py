@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+#
+# gitbundle/bundlechunk.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# ======================================================================================
+# Copyright (c) 2021 Makoto Maeda
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense,and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# ======================================================================================
+
+
+import hashlib
+import json
+import os
+
+class bundlechunk:
+    """
+    Bundle chunk module.
+
+    Splits bundle files into fixed-size chunks for transfer over size-limited media and
+    reassembles them on the other side. Files are streamed, so a bundle is never held in memory.
+
+    Splitting a bundle <file_name> writes the chunks <file_name>.part0001, <file_name>.part0002, ...
+    and then the manifest <file_name>.chunks.json holding the size and SHA-256 of the bundle and
+    of every chunk.
+
+    Reassembly verifies every chunk against the manifest while writing it at its offset into
+    <file_name>.partial in the output directory, and records the verified chunks in
+    <file_name>.partial.json. Missing or broken chunks are reported so that only they have to be
+    copied again; the next run then only processes the chunks not verified yet.
+    The bundle is renamed to <file_name> once all chunks are verified and the SHA-256 of the
+    whole bundle matches the manifest, so an incomplete bundle never appears as a *.bundle file.
+    """
+
+    BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, chunk_size:int=1024 * 1024 * 1024):
+        """
+        Parameters
+        ----------
+            chunk_size : int
+                maximum size of a chunk in bytes.
+        """
+        self._chunk_size = chunk_size
+
+
+    def split(self, bundle_file:str, chunk_dir:str) -> str:
+        """
+        Splits a bundle file into chunks.
+
+        Parameters
+        ----------
+            bundle_file : str
+                File path to the bundle file to split.
+            chunk_dir : str
+                directory to write the chunks and the manifest to.
+
+        Returns
+        ----------
+            manifest_file : str
+                File path to the manifest.
+        """
+        file_name = os.path.basename(bundle_file)
+        manifest  = {
+            'file_name'  : file_name,
+            'size'       : 0,
+            'sha256'     : '',
+            'chunk_size' : self._chunk_size,
+            'chunks'     : []
+        }
+        bundle_hash = hashlib.sha256()
+
+        with open(bundle_file, 'rb') as frb:
+            while True:
+                chunk_name = '{0}.part{1:04d}'.format(file_name, len(manifest['chunks']) + 1)
+                chunk_hash = hashlib.sha256()
+                chunk_len  = 0
+
+                with open(os.path.join(chunk_dir, chunk_name), 'wb') as fwb:
+                    while chunk_len < self._chunk_size:
+                        data = frb.read(min(self.BUFFER_SIZE, self._chunk_size - chunk_len))
+                        if not(data):
+                            break
+                        fwb.write(data)
+                        chunk_hash.update(data)
+                        bundle_hash.update(data)
+                        chunk_len += len(data)
+
+                if (chunk_len == 0) and (manifest['chunks'] != []):
+                    os.remove(os.path.join(chunk_dir, chunk_name))
+                    break
+
+                manifest['chunks'].append({'file_name': chunk_name, 'size': chunk_len, 'sha256': chunk_hash.hexdigest()})
+                manifest['size'] += chunk_len
+
+                if chunk_len < self._chunk_size:
+                    break
+
+        manifest['sha256'] = bundle_hash.hexdigest()
+
+        # The manifest is written last. Its presence means all chunks have been written.
+        manifest_file = os.path.join(chunk_dir, file_name + '.chunks.json')
+        with open(manifest_file, 'w') as fw:
+            json.dump(manifest, fw, indent=1)
+
+        return manifest_file
+
+
+    def split_dir(self, bundle_dir:str, chunk_dir:str) -> list:
+        """
+        Splits every bundle file (*.bundle) in a directory that hasn't been split yet.
+
+        Parameters
+        ----------
+            bundle_dir : str
+                directory containing bundle files
+            chunk_dir : str
+                directory to write the chunks and the manifests to.
+
+        Returns
+        ----------
+            manifest_files : list
+                File paths to the manifests written.
+        """
+        manifest_files = []
+
+        with os.scandir(bundle_dir) as it:
+            bundle_files = sorted(entry.path for entry in it if entry.name.endswith('.bundle') and entry.is_file())
+
+        for bundle_file in bundle_files:
+            if os.path.isfile(os.path.join(chunk_dir, os.path.basename(bundle_file) + '.chunks.json')):
+                continue
+            manifest_files.append(self.split(bundle_file, chunk_dir))
+
+        return manifest_files
+
+
+    def assemble(self, manifest_file:str, output_dir:str) -> list:
+        """
+        Verifies the chunks listed in a manifest and reassembles the bundle file.
+
+        Parameters
+        ----------
+            manifest_file : str
+                File path to the manifest. The chunks are read from the same directory.
+            output_dir : str
+                directory to write the bundle file to.
+
+        Returns
+        ----------
+            bad_chunks : list
+                names of the chunks that are missing or broken and have to be copied again.
+                All chunks if the reassembled bundle doesn't match the manifest, as the verified
+                chunks can't be told from the broken ones then.
+                Empty if the bundle file has been reassembled.
+        """
+        with open(manifest_file, 'r') as fr:
+            manifest = json.load(fr)
+
+        chunk_dir     = os.path.dirname(manifest_file)
+        bundle_file   = os.path.join(output_dir, manifest['file_name'])
+        partial_file  = bundle_file + '.partial'
+        progress_file = bundle_file + '.partial.json'
+
+        if os.path.isfile(bundle_file) and (os.path.getsize(bundle_file) == manifest['size']) and \
+           (self.__hash_file(bundle_file) == manifest['sha256']):
+            return []
+
+        verified = []
+        if os.path.isfile(partial_file) and os.path.isfile(progress_file):
+            with open(progress_file, 'r') as fr:
+                progress = json.load(fr)
+            if progress.get('sha256') == manifest['sha256']:
+                verified = progress['verified']
+        else:
+            open(partial_file, 'wb').close()
+
+        bad_chunks = []
+        with open(partial_file, 'r+b') as fwb:
+            for index, chunk in enumerate(manifest['chunks']):
+                if chunk['file_name'] in verified:
+                    continue
+
+                if self.__copy_chunk(os.path.join(chunk_dir, chunk['file_name']), chunk,
+                                     fwb, index * manifest['chunk_size']):
+                    verified.append(chunk['file_name'])
+                else:
+                    bad_chunks.append(chunk['file_name'])
+
+            fwb.truncate(manifest['size'])
+
+        if bad_chunks != []:
+            with open(progress_file, 'w') as fw:
+                json.dump({'sha256': manifest['sha256'], 'verified': verified}, fw, indent=1)
+            return bad_chunks
+
+        # The chunks verified by a previous run may have been overwritten in the partial file since
+        if self.__hash_file(partial_file) != manifest['sha256']:
+            os.remove(partial_file)
+            if os.path.isfile(progress_file):
+                os.remove(progress_file)
+            return [chunk['file_name'] for chunk in manifest['chunks']]
+
+        os.replace(partial_file, bundle_file)
+        if os.path.isfile(progress_file):
+            os.remove(progress_file)
+
+        return []
+
+
+    def assemble_dir(self, chunk_dir:str, output_dir:str) -> dict:
+        """
+        Reassembles every bundle file whose manifest (*.chunks.json) is in a directory.
+
+        Parameters
+        ----------
+            chunk_dir : str
+                directory containing the chunks and the manifests.
+            output_dir : str
+                directory to write the bundle files to.
+
+        Returns
+        ----------
+            bad_chunks : dict
+                key = bundle file name, value = names of the chunks to copy again.
+                Only bundles that couldn't be reassembled are listed.
+        """
+        bad_chunks = {}
+
+        with os.scandir(chunk_dir) as it:
+            manifest_files = sorted(entry.path for entry in it if entry.name.endswith('.chunks.json'))
+
+        for manifest_file in manifest_files:
+            bad = self.assemble(manifest_file, output_dir)
+            if bad != []:
+                bad_chunks[os.path.basename(manifest_file)[:-len('.chunks.json')]] = bad
+
+        return bad_chunks
+
+
+    def __copy_chunk(self, chunk_file, chunk, fwb, offset):
+        # Copies a chunk to its offset while hashing it. False if the chunk is missing or broken.
+        try:
+            if os.path.getsize(chunk_file) != chunk['size']:
+                return False
+
+            chunk_hash = hashlib.sha256()
+            fwb.seek(offset)
+            with open(chunk_file, 'rb') as frb:
+                while True:
+                    data = frb.read(self.BUFFER_SIZE)
+                    if not(data):
+                        break
+                    fwb.write(data)
+                    chunk_hash.update(data)
+        except OSError:
+            return False
+
+        return chunk_hash.hexdigest() == chunk['sha256']
+
+
+    def __hash_file(self, file_path):
+        # SHA-256 of a file, streamed
+        file_hash = hashlib.sha256()
+        with open(file_path, 'rb') as frb:
+            while True:
+                data = frb.read(self.BUFFER_SIZE)
+                if not(data):
+                    break
+                file_hash.update(data)
+
+        return file_hash.hexdigest()
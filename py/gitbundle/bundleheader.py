@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+#
+# gitbundle/bundleheader.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# ======================================================================================
+# Copyright (c) 2021 Makoto Maeda
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense,and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# ======================================================================================
+
+
+import concurrent.futures
+import os
+
+class bundleheader:
+    """
+    Bundle header reader module.
+
+    Reads the header of git bundle files (v2 and v3) without touching the pack data.
+    The header is read line by line and the number of bytes read is capped, so a broken
+    file never makes the reader scan into a multi-GB pack.
+
+    See https://git-scm.com/docs/gitformat-bundle for the format.
+    """
+
+    SIGNATURES = {
+        b'# v2 git bundle\n' : 2,
+        b'# v3 git bundle\n' : 3
+    }
+
+    def __init__(self, max_header_bytes:int=1024 * 1024):
+        """
+        Parameters
+        ----------
+            max_header_bytes : int
+                maximum number of bytes read from a bundle file before giving up on the header.
+        """
+        self._max_header_bytes = max_header_bytes
+
+
+    def read(self, bundle_file:str) -> dict:
+        """
+        Reads the header of a bundle file.
+
+        Parameters
+        ----------
+            bundle_file : str
+                File path to the git bundle file to analyze.
+
+        Returns
+        ----------
+            header : dict
+                key = 'version' (2 or 3),
+                      'capabilities' (dict of v3 capabilities, e.g. {'object-format': 'sha1'}),
+                      'prerequisites' (list of [commit id, comment]),
+                      'refs' (list of [commit id, ref name]),
+                      'pack_offset' (offset in bytes of the pack data)
+
+        Raises
+        ----------
+            ValueError
+                if the file is not a git bundle or the header is broken or too large.
+        """
+        header = {
+            'version'       : 0,
+            'capabilities'  : {},
+            'prerequisites' : [],
+            'refs'          : [],
+            'pack_offset'   : 0
+        }
+
+        with open(bundle_file, 'rb') as frb:
+            remaining = self._max_header_bytes
+
+            line = frb.readline(remaining)
+            remaining -= len(line)
+            if not(line in self.SIGNATURES):
+                raise ValueError('Illegal bundle header (signature). file={0}'.format(bundle_file))
+            header['version'] = self.SIGNATURES[line]
+
+            while True:
+                line = frb.readline(remaining)
+                remaining -= len(line)
+                if not(line.endswith(b'\n')):
+                    raise ValueError('Illegal bundle header (truncated or too large). file={0}'.format(bundle_file))
+
+                line = line[:-1].decode('utf-8', errors='replace')
+                if line == '':
+                    # blank line separating the header from the pack data
+                    break
+                elif line.startswith('@') and (header['version'] == 3) and (header['refs'] == []):
+                    key, _, value = line[1:].partition('=')
+                    header['capabilities'][key] = value
+                elif line.startswith('-'):
+                    commit_id, _, comment = line[1:].partition(' ')
+                    header['prerequisites'].append([commit_id, comment])
+                else:
+                    commit_id, _, ref_name = line.partition(' ')
+                    if ref_name == '':
+                        raise ValueError('Illegal bundle header (ref). file={0}'.format(bundle_file))
+                    header['refs'].append([commit_id, ref_name])
+
+            header['pack_offset'] = frb.tell()
+
+        return header
+
+
+    def read_files(self, bundle_files:list, workers:int=8) -> dict:
+        """
+        Reads the headers of bundle files concurrently.
+
+        Parameters
+        ----------
+            bundle_files : list
+                File paths to the git bundle files to analyze.
+            workers : int
+                maximum number of files read concurrently.
+
+        Returns
+        ----------
+            headers : dict
+                key = bundle file path, value = header dictionary (see read()).
+                The value is None if the header could not be read.
+        """
+        headers = {}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.read, bundle_file): bundle_file for bundle_file in bundle_files}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    headers[futures[future]] = future.result()
+                except (OSError, ValueError):
+                    headers[futures[future]] = None
+
+        return headers
+
+
+    def read_dir(self, bundle_dir:str, workers:int=8) -> dict:
+        """
+        Reads the headers of all bundle files (*.bundle) in a directory concurrently.
+
+        Parameters
+        ----------
+            bundle_dir : str
+                directory containing bundle files
+            workers : int
+                maximum number of files read concurrently.
+
+        Returns
+        ----------
+            headers : dict
+                key = bundle file name, value = header dictionary (see read()).
+                The value is None if the header could not be read.
+        """
+        with os.scandir(bundle_dir) as it:
+            bundle_files = {entry.path: entry.name for entry in it
+                            if entry.name.endswith('.bundle') and entry.is_file()}
+
+        return {bundle_files[bundle_file]: header
+                for bundle_file, header in self.read_files(list(bundle_files), workers).items()}
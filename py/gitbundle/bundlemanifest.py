@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+#
+# gitbundle/bundlemanifest.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# ======================================================================================
+# Copyright (c) 2021 Makoto Maeda
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense,and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# ======================================================================================
+
+
+
+import concurrent.futures
+import hashlib
+import mmap
+import os
+
+import gitbundle
+
+class bundlemanifest:
+    """
+    Bundle manifest module.
+
+    Writes a manifest of the bundle files in a directory on the export side, holding the
+    SHA-256, the size and the header refs of every bundle, and verifies the bundle files against
+    it on the import side before they are merged.
+
+    Bundles are hashed concurrently through memory-mapped reads (hashlib releases the GIL while
+    hashing, so threads scale with the disks). Both sides are incremental: a bundle whose size and
+    mtime match the previous manifest entry or the verified cache is not hashed again.
+    """
+
+    def __init__(self, workers:int=8, buffer_size:int=8 * 1024 * 1024):
+        """
+        Parameters
+        ----------
+            workers : int
+                maximum number of files hashed concurrently.
+            buffer_size : int
+                number of bytes passed to the hash function at once.
+        """
+        self._workers     = workers
+        self._buffer_size = buffer_size
+
+
+    def hash_file(self, bundle_file:str) -> str:
+        """
+        Computes the SHA-256 of a file.
+
+        Parameters
+        ----------
+            bundle_file : str
+                File path to the file to hash.
+
+        Returns
+        ----------
+            sha256 : str
+                SHA-256 of the file content in hex.
+        """
+        file_hash = hashlib.sha256()
+
+        with open(bundle_file, 'rb') as frb:
+            size = os.fstat(frb.fileno()).st_size
+            try:
+                if size == 0:
+                    return file_hash.hexdigest()
+
+                with mmap.mmap(frb.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                    for offset in range(0, size, self._buffer_size):
+                        file_hash.update(view[offset:offset + self._buffer_size])
+            except (OSError, ValueError, OverflowError):
+                # File can't be mapped (e.g. larger than the address space). Read it instead.
+                file_hash = hashlib.sha256()
+                frb.seek(0)
+                while True:
+                    data = frb.read(self._buffer_size)
+                    if not(data):
+                        break
+                    file_hash.update(data)
+
+        return file_hash.hexdigest()
+
+
+    def write(self, bundle_dir:str, manifest_file:str) -> dict:
+        """
+        Writes the manifest of every bundle file (*.bundle) in a directory.
+        Entries of the previous manifest are kept for bundles whose size and mtime haven't changed.
+
+        Parameters
+        ----------
+            bundle_dir : str
+                directory containing bundle files
+            manifest_file : str
+                path to the manifest file.
+
+        Returns
+        ----------
+            manifest : dict
+                key = bundle file name,
+                value = dictionary with key = 'size', 'mtime', 'sha256',
+                        'refs' and 'prerequisites' (see bundleheader.read())
+        """
+        previous = gitbundle.jsonstate(manifest_file).load()
+        manifest = {}
+        pending  = {}
+
+        with os.scandir(bundle_dir) as it:
+            for entry in it:
+                if not(entry.name.endswith('.bundle')) or not(entry.is_file()):
+                    continue
+
+                stat   = entry.stat()
+                cached = previous.get(entry.name)
+                if (cached is not None) and (cached['size'] == stat.st_size) and (cached['mtime'] == stat.st_mtime):
+                    manifest[entry.name] = cached
+                else:
+                    pending[entry.path] = {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+        headers = gitbundle.bundleheader().read_files(list(pending), self._workers)
+        for bundle_file, sha256 in self.__hash_files(list(pending)).items():
+            if (sha256 is None) or (headers[bundle_file] is None):
+                # Bundle creation failed or is still in progress
+                continue
+
+            manifest[os.path.basename(bundle_file)] = dict(pending[bundle_file],
+                                                           sha256=sha256,
+                                                           refs=headers[bundle_file]['refs'],
+                                                           prerequisites=headers[bundle_file]['prerequisites'])
+
+        # Written atomically, as the import side may be watching the directory it is copied to
+        gitbundle.jsonstate(manifest_file).save(manifest)
+
+        return manifest
+
+
+    def verify(self, bundle_dir:str, manifest_file:str, file_names:list, cache_file:str='') -> dict:
+        """
+        Verifies bundle files against the manifest.
+
+        Parameters
+        ----------
+            bundle_dir : str
+                directory containing bundle files
+            manifest_file : str
+                path to the manifest file written on the export side.
+            file_names : list
+                names of the bundle files to verify.
+            cache_file : str
+                path to the verified cache. Bundles whose size and mtime match a cache entry with
+                the same SHA-256 as the manifest are not hashed again, and those missing from the
+                manifest (verified against the manifest of an earlier drop) pass. Not used if empty.
+
+        Returns
+        ----------
+            failures : dict
+                key = bundle file name, value = reason of the failure.
+                Only bundles that failed verification are listed.
+        """
+        manifest = gitbundle.jsonstate(manifest_file).load()
+        cache    = gitbundle.jsonstate(cache_file).load() if cache_file else {}
+        failures = {}
+        pending  = {}
+
+        for file_name in file_names:
+            try:
+                stat = os.stat(os.path.join(bundle_dir, file_name))
+            except OSError:
+                failures[file_name] = 'not found'
+                continue
+
+            cached    = cache.get(file_name)
+            unchanged = (cached is not None) and (cached['size'] == stat.st_size) and (cached['mtime'] == stat.st_mtime)
+
+            expected = manifest.get(file_name)
+            if expected is None:
+                # Each drop comes with the manifest of its own bundles only. Bundles of earlier drops
+                # verified against their manifest stay valid while unchanged.
+                if not(unchanged):
+                    failures[file_name] = 'not listed in the manifest'
+                continue
+
+            if stat.st_size != expected['size']:
+                failures[file_name] = 'size mismatch ({0} bytes, {1} expected)'.format(stat.st_size, expected['size'])
+                continue
+
+            if unchanged and (cached['sha256'] == expected['sha256']):
+                continue
+
+            pending[os.path.join(bundle_dir, file_name)] = {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+        headers = gitbundle.bundleheader().read_files(list(pending), self._workers)
+        for bundle_file, sha256 in self.__hash_files(list(pending)).items():
+            file_name = os.path.basename(bundle_file)
+            expected  = manifest[file_name]
+
+            if sha256 != expected['sha256']:
+                failures[file_name] = 'content hash mismatch'
+            elif (headers[bundle_file] is None) or (headers[bundle_file]['refs'] != expected['refs']) or \
+                 (headers[bundle_file]['prerequisites'] != expected['prerequisites']):
+                failures[file_name] = 'header refs mismatch'
+            else:
+                cache[file_name] = dict(pending[bundle_file], sha256=sha256)
+
+        # Only bundles verified successfully are cached
+        for file_name in failures:
+            cache.pop(file_name, None)
+
+        if cache_file:
+            gitbundle.jsonstate(cache_file).save(cache)
+
+        return failures
+
+
+    def __hash_files(self, bundle_files):
+        # Hashes files concurrently. The value is None if the file could not be read.
+        hashes = {}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self._workers) as executor:
+            futures = {executor.submit(self.hash_file, bundle_file): bundle_file for bundle_file in bundle_files}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    hashes[futures[future]] = future.result()
+                except OSError:
+                    hashes[futures[future]] = None
+
+        return hashes
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# gitbundle/bundleretention.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# ======================================================================================
+# Copyright (c) 2021 Makoto Maeda
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense,and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# ======================================================================================
+
+
+import datetime
+
+class bundleretention:
+    """
+    Bundle retention module.
+
+    Selects the bundle files of a directory to prune according to retention policies:
+    keep at most the newest keep_count bundles of each repository and branch, drop the bundles
+    older than max_age_days (by the date and time in their file name), and keep the total size
+    of the directory within max_bytes by dropping the oldest bundles first. A policy set to 0
+    is not applied.
+
+    Protected bundles (see find_chains()) are never selected and count against the byte budget.
+    """
+
+    def __init__(self, keep_count:int=0, max_age_days:int=0, max_bytes:int=0):
+        """
+        Parameters
+        ----------
+            keep_count : int
+                number of bundles kept per repository and branch.
+            max_age_days : int
+                maximum age of a bundle in days.
+            max_bytes : int
+                maximum total size of the bundles of the directory in bytes.
+        """
+        self._keep_count   = keep_count
+        self._max_age_days = max_age_days
+        self._max_bytes    = max_bytes
+
+
+    def find_chains(self, catalog) -> dict:
+        """
+        Finds the bundles a receiver may still need to catch up with each branch: the most recent
+        bundle of each repository and branch, and every link of the incremental chain it builds on,
+        back to the most recent full bundle of the branch. The links are protected whatever policy
+        is applied, as a range bundle is unusable without the bundles before it. The bundles before
+        the most recent full bundle are not needed.
+
+        Parameters
+        ----------
+            catalog : bundlecatalog
+                catalog of the directory.
+
+        Returns
+        ----------
+            protected : dict
+                key = bundle file name, value = reason to keep the bundle.
+        """
+        protected = {}
+
+        for latest in catalog.get_bundle_list():
+            bundle_infos = catalog.find_all(latest['repository_name'], latest['branch_name'])
+            protected.setdefault(latest['file_name'], 'latest bundle of ' + latest['branch_name'])
+            if latest['prerequisite'] == '':
+                continue
+
+            for bundle_info in reversed(bundle_infos[:-1]):
+                protected.setdefault(bundle_info['file_name'], 'prerequisite of ' + latest['file_name'])
+                if bundle_info['prerequisite'] == '':
+                    break
+
+        return protected
+
+
+    def select(self, catalog, protected:dict, now:datetime.datetime=None) -> dict:
+        """
+        Selects the bundles to prune.
+
+        Parameters
+        ----------
+            catalog : bundlecatalog
+                catalog of the directory.
+            protected : dict
+                key = bundle file name never to prune, value = reason (see find_chains()).
+            now : datetime
+                current date and time for max_age_days. The current time of the bundle file names
+                (see gitbundlemng.make_bundlename()) if None.
+
+        Returns
+        ----------
+            pruned : dict
+                key = bundle file name, value = reason to prune the bundle.
+        """
+        bundle_infos = catalog.get_file_list()
+        pruned       = {}
+
+        if self._keep_count > 0:
+            # A bundle holding multiple branches is kept if it is among the newest of any of them
+            kept = set()
+            for latest in catalog.get_bundle_list():
+                kept.update(bundle_info['file_name'] for bundle_info in
+                            catalog.find_all(latest['repository_name'], latest['branch_name'])[-self._keep_count:])
+            for bundle_info in bundle_infos:
+                if bundle_info['file_name'] not in kept:
+                    pruned[bundle_info['file_name']] = 'beyond the newest {0} of the branch'.format(self._keep_count)
+
+        if self._max_age_days > 0:
+            limit = self.__age_limit(now)
+            for bundle_info in bundle_infos:
+                if bundle_info['bundle_datetime'] < limit:
+                    pruned.setdefault(bundle_info['file_name'], 'older than {0} days'.format(self._max_age_days))
+
+        for file_name in protected:
+            pruned.pop(file_name, None)
+
+        if self._max_bytes > 0:
+            total = sum(bundle_info['size'] for bundle_info in bundle_infos if bundle_info['file_name'] not in pruned)
+            for bundle_info in bundle_infos:
+                if total <= self._max_bytes:
+                    break
+                if (bundle_info['file_name'] in pruned) or (bundle_info['file_name'] in protected):
+                    continue
+                pruned[bundle_info['file_name']] = 'over {0} bytes'.format(self._max_bytes)
+                total -= bundle_info['size']
+
+        return pruned
+
+
+    def __age_limit(self, now):
+        # Date and time (yyyymmddHHMMSS) of the oldest bundle within max_age_days. Empty if not applied.
+        if self._max_age_days <= 0:
+            return ''
+        if now is None:
+            now = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9)))
+
+        return (now - datetime.timedelta(days=self._max_age_days)).strftime('%Y%m%d%H%M%S')
@@ -23,11 +23,16 @@
 # ======================================================================================
 
 
+import concurrent.futures
 import json
 import os
+import subprocess
+import tempfile
 import re
-import glob
 import datetime
+import fnmatch
+import shutil
+import time
 import gitbundle
 
 class gitbundlemng:
@@ -41,122 +46,1025 @@ class gitbundlemng:
     Repository pairs need to be defined in the json file and there's no limitation on the number
     of repository pairs to be defined.
 
-    This module itself only outputs windows batch files and does not offer direct git operation
-    as it is intended for use in restricted environments.
+    This module mainly outputs windows batch files as it is intended for use in restricted 
+    environments. Bundle files can also be created by running git directly (see run_export()).
 
-    Current implementation supports synchronization of one branch per json configuration.
-    Multiple branches synchronization support is under consideration and may be supported 
-    in future versions.
+    Multiple branches can be synchronized per json configuration by listing them in
+    target_branch. All the branches of a repository are then exported into a single bundle
+    so that their shared history is packed once.
+
+    A config_detail entry with "discover_root" stands for every git repository found under
+    that directory (see repodiscovery) and is expanded on load (see __init__()).
     """
 
+    # Ref namespace bundle refs are fetched into by run_import()
+    IMPORT_NAMESPACE = 'refs/gitbundle/'
+
+    # Prerequisite field of the name of incremental bundles holding multiple branches
+    INCREMENTAL_MARKER = 'INC'
+
     def __init__(self, cfg_file:str):
         # Read json configurations file specified by the first argument
         fr = open(cfg_file, 'r')
         self._cfg = json.load(fr)
         fr.close()
 
+        self.__discover_repositories()
+
+        # Metrics of the runs, written to "metrics_output" if set
+        self._metrics = gitbundle.runmetrics(self._cfg['config_common'].get('metrics_output', '') != '')
+
+        # git executable run by run_export() and run_import(), resolved on first use
+        self._git_executable = None
+
+
+    def __discover_repositories(self):
+        # Replaces each config_detail entry with "discover_root" by an entry per repository found
+        # under the root whose relative path matches "discover_pattern" (fnmatch, '*' by default).
+        # The other keys of the entry apply to every repository found. The repository name is
+        # the relative path with '/' replaced by '+', prefixed by "repository_name" if set.
+        # Repositories configured explicitly, or found by an earlier entry (e.g. under an overlapping
+        # root), are not added again.
+        config_common = self._cfg['config_common']
+        config_detail = {}
+        discovery     = None
+
+        # Paths are compared after resolving symbolic links, so that a repository reached through
+        # two roots is found once
+        known_paths = set(self.__path_key(os.path.realpath(detail['path']))
+                          for detail in self._cfg['config_detail'].values() if 'discover_root' not in detail)
+
+        for cfg, detail in self._cfg['config_detail'].items():
+            if 'discover_root' not in detail:
+                config_detail[cfg] = detail
+                continue
+
+            if discovery is None:
+                discovery = gitbundle.repodiscovery(config_common.get('discover_cache', ''),
+                                                    config_common.get('run_workers', 0) or os.cpu_count())
+
+            root_dir = detail['discover_root'].rstrip('/\\')
+            for rel_path in discovery.discover(root_dir):
+                if not(fnmatch.fnmatchcase(rel_path, detail.get('discover_pattern', '*'))):
+                    continue
+
+                repo_path = root_dir + '/' + rel_path
+                if self.__path_key(os.path.realpath(repo_path)) in known_paths:
+                    continue
+                known_paths.add(self.__path_key(os.path.realpath(repo_path)))
+
+                repository_name = rel_path.replace('/', '+')
+                if detail.get('repository_name', '') != '':
+                    repository_name = detail['repository_name'] + '+' + repository_name
+
+                entry = {key: value for key, value in detail.items() if not(key.startswith('discover_'))}
+                entry['path']            = repo_path
+                entry['repository_name'] = repository_name
+                config_detail['{0}/{1}'.format(cfg, rel_path)] = entry
+
+        if discovery is not None:
+            discovery.save()
+
+        self._cfg['config_detail'] = config_detail
+
 
     def create_batch(self):
         """ 
-        Creates windows batch files for repository synchronization.
+        Creates scripts for repository synchronization, git_bundle_out and git_bundle_in.
+
+        "script_format" in config_common selects the script syntax: 'bat' (Windows batch files,
+        by default) or 'sh' (POSIX shell scripts running up to "script_jobs" repositories 
+        concurrently, see shemitter). If "estimate_cost" is true, the bundles are estimated
+        (see plan_export()) and the largest repositories are exported first.
         """
 
+        self._metrics.reset('genbat')
         self.__create_dir(self._cfg['config_common']['batch_output'])
         self.__create_dir(self._cfg['config_common']['bundle_output'])
 
-        fwo = open("{0}/git_bundle_out.bat".format(self._cfg['config_common']['batch_output']), "w")
-        fwi = open("{0}/git_bundle_in.bat".format(self._cfg['config_common']['batch_output']), "w")
+        emitter = {'bat': gitbundle.batemitter, 'sh': gitbundle.shemitter}[self._cfg['config_common'].get('script_format', 'bat')]
+        jobs    = self._cfg['config_common'].get('script_jobs', 0) or self._cfg['config_common'].get('run_workers', 0) or os.cpu_count()
+
+        timing  = self._cfg['config_common'].get('script_timing', False)
+
+        fwo = emitter(self._cfg['config_common']['git_path'], jobs, timing)
+        fwi = emitter(self._cfg['config_common']['git_path'], jobs, timing)
+        fwo.open(self._cfg['config_common']['batch_output'], 'git_bundle_out')
+        fwi.open(self._cfg['config_common']['batch_output'], 'git_bundle_in')
         
-        gbr=gitbundle.gitrepo()
+        with gitbundle.gitrepo(metrics=self._metrics) as gbr:
+            # Scan the merge input directory once for all repositories
+            with self._metrics.stage('catalog_scan'):
+                catalog = gitbundle.bundlecatalog(self._cfg['config_common']['merge_input'],
+                                                  self.parse_bundle_name,
+                                                  self._cfg['config_common'].get('catalog_index', ''))
+
+            ### Bundle output batch generation 
+            # The scripts can't record what they export. Learn it from the bundles they left in bundle_output.
+            if self._cfg['config_common'].get('bundle_mode', 'full') == 'incremental':
+                ledger = gitbundle.tipledger(self._cfg['config_common']['tip_ledger'])
+                self.__update_tip_ledger(ledger)
+                ledger.save()
+
+            estimate_cost = self._cfg['config_common'].get('estimate_cost', False)
+            with self._metrics.stage('plan_export'):
+                export_plan = self.plan_export(gbr, estimate_cost)
+
+            # Configurations sharing a repository share its working tree, so they go into one unit
+            units = {}
+            for export in export_plan:
+                if export['skipped']:
+                    fwo.write_comment('{0} is unchanged since the previous export'.format( export['name'] ))
+                    continue
+
+                unit = units.setdefault(self.__path_key(export['path']), {'names': [], 'commands': [], 'guards': {}, 'bytes': 0})
+                unit['names'].append(export['name'])
+                unit['commands'] += export['commands']
+                if export['guard'] is not None:
+                    unit['guards'][len(unit['commands']) - 1] = export['guard']
+                if estimate_cost:
+                    unit['bytes'] += max(0, export['estimate']['bytes'])
+
+            # Largest repositories first, so that the longest units don't start last
+            schedule = list(units.values())
+            if estimate_cost:
+                schedule.sort(key=lambda unit: unit['bytes'], reverse=True)
+
+            for unit in schedule:
+                fwo.write_unit(' '.join(unit['names']), unit['commands'], unit['guards'])
+
+            ### Bundle input batch generation 
+            # The bundles of a repository are merged in one unit, as they can't be merged concurrently
+            units = {}
+            with self._metrics.stage('plan_import'):
+                import_plan = self.plan_import(gbr, catalog)
+            for entry in import_plan:
+                if entry['status'] != 'import':
+                    fwi.write_comment('{0} {1} skipped: {2}'.format( entry['name'],
+                                                                     entry['bundle_info']['file_name'],
+                                                                     entry['reason'] ))
+                    continue
+
+                unit = units.setdefault(self.__path_key(entry['path']), {'names': [], 'commands': []})
+                if not(entry['name'] in unit['names']):
+                    unit['names'].append(entry['name'])
+                unit['commands'] += entry['commands']
+
+            for unit in units.values():
+                fwi.write_unit(' '.join(unit['names']), unit['commands'])
+
+        fwo.close()
+        fwi.close()
+
+        self.__count_import(import_plan)
+        self.__save_metrics()
+
+
+
+    def plan_export(self, gbr=None, estimate:bool=False) -> list:
+        """
+        Plans the git commands to create bundle files for the configured repositories.
+
+        Parameters
+        ----------
+            gbr : gitrepo
+                git repository manager to inspect the repositories with. A new one is created if None.
+            estimate : bool
+                True to estimate the content of every bundle (see gitrepo.estimate_bundle()) from the
+                target branches and their upstreams, fetched beforehand.
+
+        Returns
+        ----------
+            export_plan : list
+                list of export dictionary, one per repository configuration in the configuration order.
+                key = 'name' (repository configuration name), 'path', 'bundle_name',
+                      'commands' (list of git command argument lists to run in order),
+                      'guard' (git command counting the commits of an incremental bundle after the pull.
+                               The bundle creation, i.e. the last command, is skipped if there is none.
+                               None for full bundles),
+                      'skipped' (True if the repository is unchanged since the previous export),
+                      'refs' (refs snapshot of the repository. None if change detection is disabled),
+                      'maintained' (True if the commands maintain the repository before bundle creation),
+                      'estimate' (see gitrepo.estimate_bundle(). None if not estimated or skipped)
+        """
+        own_gbr = gbr is None
+        if own_gbr:
+            gbr = gitbundle.gitrepo(metrics=self._metrics)
+
+        # Incremental mode exports only the commits added since the tip recorded in the ledger
+        incremental = (self._cfg['config_common'].get('bundle_mode', 'full') == 'incremental')
+        if incremental:
+            ledger = gitbundle.tipledger(self._cfg['config_common']['tip_ledger'])
 
-        fwo.write('set PATH={0};%PATH%'.format(self._cfg['config_common']['git_path']))
-        fwi.write('set PATH={0};%PATH%'.format(self._cfg['config_common']['git_path']))
+        # Repositories whose refs haven't moved since the previous export are skipped
+        skip_unchanged = (self._cfg['config_common'].get('ref_snapshot', '') != '')
+        if skip_unchanged:
+            snapshot = gitbundle.refsnapshot(self._cfg['config_common']['ref_snapshot'])
+            self.__update_snapshot(snapshot, gbr)
+            snapshot.save()
+        skipped = 0
+
+        # Upstreams are fetched first, so that the commits the pull will bring in count as changes
+        # and are part of the estimates
+        if skip_unchanged or estimate:
+            self.__fetch_upstreams(gbr)
+
+        # Resolved branch origins are kept across runs. In memory only if origin_cache is not set.
+        origins = gitbundle.origincache(self._cfg['config_common'].get('origin_cache', ''))
+
+        export_plan = []
+        rev_args    = {}
 
         for cfg in self._cfg['config_detail'].keys():
-            if self._cfg['config_detail'][cfg]['branch_origin'] == '':
-                branch_origin =  gbr.find_branch_origin( self._cfg['config_detail'][cfg]['path'] , 
-                                                         self._cfg['config_detail'][cfg]['target_branch'] )
+            export = {
+                'name'        : cfg,
+                'path'        : self._cfg['config_detail'][cfg]['path'],
+                'bundle_name' : '',
+                'commands'    : [],
+                'guard'       : None,
+                'skipped'     : False,
+                'refs'        : None,
+                'maintained'  : False,
+                'estimate'    : None
+            }
+            export_plan.append(export)
+
+            if skip_unchanged:
+                export['refs'] = gbr.list_refs(self._cfg['config_detail'][cfg]['path'], self.__snapshot_patterns(gbr, cfg))
+                if (export['refs'] != {}) and snapshot.is_unchanged(cfg, export['refs']):
+                    export['skipped'] = True
+                    skipped += 1
+                    continue
+
+            branches = self.__target_branches(cfg)
+
+            if len(branches) > 1:
+                # The origins of multiple branches don't fit in a bundle name
+                branch_origin = 'NOORIGIN'
+            elif self._cfg['config_detail'][cfg]['branch_origin'] == '':
+                # The reflog is read first, without starting git. It also tells the new origin of a
+                # branch created again since its origin was cached.
+                branch_origin = gbr.find_branch_origin(self._cfg['config_detail'][cfg]['path'], branches[0])
+                if branch_origin == 'NOORIGIN':
+                    # The reflog has expired or the branch was not created here
+                    branch_origin = origins.get_origin(self._cfg['config_detail'][cfg]['path'], branches[0])
+                if branch_origin == '':
+                    branch_origin = gbr.find_branch_origin( self._cfg['config_detail'][cfg]['path'] , 
+                                                            branches[0],
+                                                            self._cfg['config_detail'][cfg].get('origin_base',
+                                                                self._cfg['config_common'].get('origin_base', '')) )
+                origins.record(self._cfg['config_detail'][cfg]['path'], branches[0], branch_origin)
             else:
                 branch_origin = self._cfg['config_detail'][cfg]['branch_origin']
 
-            ### Bundle output batch generation 
-            fwo.write('@rem ### git bundle commands for {0} \n'.format( cfg ))
-            
+            for branch_name in branches:
+                export['commands'].append(self.__git_command(cfg, 'checkout', branch_name))
+                export['commands'].append(self.__git_command(cfg, 'pull'))
 
-            fwo.write('git {0} {1} checkout {2} \n'.format( 
-                                                           self._cfg['config_common']['git_option'],
-                                                           self._cfg['config_detail'][cfg]['path'],
-                                                           self._cfg['config_detail'][cfg]['target_branch']
-                                                          ))
-
-            fwo.write('git {0} {1} pull \n'.format( 
-                                                   self._cfg['config_common']['git_option'],
-                                                   self._cfg['config_detail'][cfg]['path']
-                                                   ))
-                                                     
-            bundle_name   =  self.make_bundlename(
-                                                  self._cfg['config_detail'][cfg]['repository_name'], 
-                                                  self._cfg['config_detail'][cfg]['target_branch'],
-                                                  branch_origin
-                                                 )
-            
-            fwo.write('git {0} {1} bundle create {2}/{3} {4} {5} \n\n'.format(  
-                                                                              self._cfg['config_common']['git_option'],
-                                                                              self._cfg['config_detail'][cfg]['path'],
-                                                                              self._cfg['config_common']['bundle_output'],
-                                                                              bundle_name,
-                                                                              self._cfg['config_common']['bundle_option'],
-                                                                              self._cfg['config_detail'][cfg]['target_branch']
-                                                                              ))
-            
-            ### Bundle input batch generation 
-            bundle_info_list = self.get_bundle_list(self._cfg['config_common']['merge_input'])
-
-            for bundle_info in bundle_info_list:
-                if bundle_info['repository_name'] == self._cfg['config_detail'][cfg]['repository_name']:
-                    # Create and switch to the branch to modify if the branch doesn't exist. Just switch otherwise.
-                    if gbr.find_branch(self._cfg['config_detail'][cfg]['path'], bundle_info['branch_name']):
-                        fwi.write('git {0} {1} checkout {2}\n'.format( 
-                                                                      self._cfg['config_common']['git_option'],
-                                                                      self._cfg['config_detail'][cfg]['path'],
-                                                                      bundle_info['branch_name']
-                                                                     ))
-                    else:
-                        fwi.write('git {0} {1} checkout {2} -b {3} \n'.format( 
-                                                                              self._cfg['config_common']['git_option'],
-                                                                              self._cfg['config_detail'][cfg]['path'],
-                                                                              bundle_info['branch_origin'],
-                                                                              bundle_info['branch_name']
-                                                                             ))
-
-                    # fetch bundle content 
-                    fwi.write('git {0} {1} fetch {2} {3}/{4} {5}\n'.format( 
-                                                                           self._cfg['config_common']['git_option'],
-                                                                           self._cfg['config_detail'][cfg]['path'],
-                                                                           "",
-                                                                           #self._cfg['config_common']['fetch_option'],
-                                                                           self._cfg['config_common']['merge_input'],
-                                                                           bundle_info['file_name'],
-                                                                           self._cfg['config_detail'][cfg]['target_branch'],
-                                                                           ))
-                                                                                    
-                    # merge bundle content
-                    fwi.write('git {1} {2} merge FETCH_HEAD \n'.format( 
-                                                                       self._cfg['config_common']['git_option'],
-                                                                       self._cfg['config_detail'][cfg]['path']
-                                                                      ))
-
-                    # push changes to the remote repository
-                    fwi.write('git {1} {2} push \n\n'.format( 
-                                                             self._cfg['config_common']['git_option'],
-                                                             self._cfg['config_detail'][cfg]['path']
-                                                            ))
+            # Fall back to a full bundle if the last exported tip is unknown or has been rewritten
+            prerequisites = []
+            if incremental:
+                for branch_name in branches:
+                    last_tip = ledger.get_tip(self._cfg['config_detail'][cfg]['repository_name'], branch_name)
+                    if (last_tip != '') and gbr.is_ancestor(self._cfg['config_detail'][cfg]['path'],
+                                                            last_tip,
+                                                            branch_name):
+                        prerequisites.append(last_tip)
+                prerequisites = sorted(set(prerequisites))
+
+            if prerequisites == []:
+                bundle_option = self.__get_option(cfg, 'bundle_option', '')
+                bundle_revs   = branches
+            elif len(branches) == 1:
+                bundle_option = self.__get_option(cfg, 'incremental_option', '')
+                bundle_revs   = ['{0}..{1}'.format(prerequisites[0], branches[0])]
+            else:
+                bundle_option = self.__get_option(cfg, 'incremental_option', '')
+                bundle_revs   = branches + ['--not'] + prerequisites
+
+            export['bundle_name'] = self.make_bundlename(
+                                                         self._cfg['config_detail'][cfg]['repository_name'], 
+                                                         branches,
+                                                         branch_origin,
+                                                         self.__prerequisite_field(branches, prerequisites)
+                                                        )
+
+            if estimate:
+                # The bundle will also hold what the pull merges from the upstreams
+                rev_args[cfg] = bundle_option.split() + branches + \
+                                list(gbr.find_upstreams(self._cfg['config_detail'][cfg]['path'], branches).values())
+                if prerequisites != []:
+                    rev_args[cfg] += ['--not'] + prerequisites
+
+            # Git refuses to create an empty bundle. Nothing to export if no branch has moved past its tip.
+            if prerequisites != []:
+                export['guard'] = self.__git_command(cfg, 'rev-list', '--count', *branches, '--not', *prerequisites)
+
+            # All branches go into one bundle so that their shared history is packed once
+            export['commands'].append(self.__git_command(cfg, *self.__pack_config(cfg), 'bundle', 'create',
+                                                         '{0}/{1}'.format(self._cfg['config_common']['bundle_output'],
+                                                                          export['bundle_name']),
+                                                         *bundle_option.split(),
+                                                         *bundle_revs))
+
+        if self._cfg['config_common'].get('origin_cache', '') != '':
+            origins.save()
+
+        if self._cfg['config_common'].get('maintenance', False):
+            self.__plan_maintenance(gbr, export_plan)
+
+        if estimate:
+            self.__estimate_exports(gbr, export_plan, rev_args)
+
+        if skip_unchanged:
+            print('{0} of {1} repositories unchanged, skipped.'.format(skipped, len(self._cfg['config_detail'])))
+
+        if own_gbr:
+            gbr.close()
+
+        return export_plan
+
+
+    def plan_import(self, gbr=None, catalog=None, repository_names:list=None) -> list:
+        """
+        Plans the git commands to merge the bundle files in merge_input into the configured 
+        repositories.
+
+        Every bundle of a repository is planned once, for the first configuration of the repository
+        path and name. Before any command is planned, the headers of the bundles are read and the ref tips and
+        prerequisites are looked up in the object database of each repository at once.
+        The bundles of a branch are chained from the most recent one applicable to the repository
+        as is (all prerequisites present), each next bundle requiring only commits of the
+        repository or of the bundles before it. Older bundles are covered by the chain and 
+        dropped as no-op, as are chains whose tips are all already merged. Bundles whose
+        prerequisites are missing, or which don't connect to the chain, are flagged as unusable.
+        The bundles of a chain are fetched in order, and the branch is merged and pushed once.
+        If "bundle_manifest" is set, bundles failing the verification against the manifest
+        (see bundlemanifest) are flagged as unusable as well.
+
+        Parameters
+        ----------
+            gbr : gitrepo
+                git repository manager to inspect the repositories with. A new one is created if None.
+            catalog : bundlecatalog
+                catalog of merge_input. A new one is created if None.
+            repository_names : list
+                names of the repositories to plan for. All configured repositories if None.
+
+        Returns
+        ----------
+            import_plan : list
+                list of import dictionary, one per bundle and branch in the configuration order, 
+                and from the oldest bundle within a repository.
+                key = 'name' (repository configuration name), 'path', 'bundle_info' (see parse_bundle_name()),
+                      'header' (see bundleheader.read()), 
+                      'status' ('import', 'noop' or 'unusable'), 'reason' (why the bundle is not imported),
+                      'missing' (prerequisites of an unusable bundle found neither in the repository
+                                 nor in the bundles before it, i.e. bundles still to arrive),
+                      'merge' (True for the last bundle of the chain of a branch, which is merged and pushed.
+                               The bundles before it are only fetched),
+                      'commands' (list of git command argument lists to run in order)
+        """
+        own_gbr = gbr is None
+        if own_gbr:
+            gbr = gitbundle.gitrepo(metrics=self._metrics)
+        if catalog is None:
+            with self._metrics.stage('catalog_scan'):
+                catalog = gitbundle.bundlecatalog(self._cfg['config_common']['merge_input'],
+                                                  self.parse_bundle_name,
+                                                  self._cfg['config_common'].get('catalog_index', ''))
+
+        import_plan = []
+        planned     = set()
+        for cfg in self._cfg['config_detail'].keys():
+            if (repository_names is not None) and not(self._cfg['config_detail'][cfg]['repository_name'] in repository_names):
+                continue
+            # Configurations of a repository per branch share its bundles. Plan them once.
+            repository = (self.__path_key(self._cfg['config_detail'][cfg]['path']), 
+                          self._cfg['config_detail'][cfg]['repository_name'])
+            if repository in planned:
+                continue
+            planned.add(repository)
+            entries = []
+            for latest in catalog.find_repository(self._cfg['config_detail'][cfg]['repository_name']):
+                for bundle_info in catalog.find_all(latest['repository_name'], latest['branch_name']):
+                    entries.append({
+                        'name'        : cfg,
+                        'path'        : self._cfg['config_detail'][cfg]['path'],
+                        'bundle_info' : bundle_info,
+                        'header'      : None,
+                        'status'      : 'import',
+                        'reason'      : '',
+                        'missing'     : [],
+                        'merge'       : False,
+                        'commands'    : []
+                    })
+
+            # Bundles are fetched from the oldest, so that each finds the prerequisites of the bundles before
+            entries.sort(key=lambda entry: (entry['bundle_info']['bundle_datetime'],
+                                            entry['bundle_info']['file_name'],
+                                            entry['bundle_info']['branch_name']))
+            import_plan += entries
+
+        # Read all bundle headers at once without paging in the packs
+        with self._metrics.stage('read_headers'):
+            headers = gitbundle.bundleheader().read_files(['{0}/{1}'.format(self._cfg['config_common']['merge_input'],
+                                                                            entry['bundle_info']['file_name'])
+                                                           for entry in import_plan])
+        for entry in import_plan:
+            entry['header'] = headers['{0}/{1}'.format(self._cfg['config_common']['merge_input'],
+                                                       entry['bundle_info']['file_name'])]
+
+        # Verify the bundles against the manifest written on the export side
+        if self._cfg['config_common'].get('bundle_manifest', '') != '':
+            with self._metrics.stage('verify'):
+                failures = gitbundle.bundlemanifest().verify(self._cfg['config_common']['merge_input'],
+                                                             '{0}/{1}'.format(self._cfg['config_common']['merge_input'],
+                                                                              self._cfg['config_common']['bundle_manifest']),
+                                                             sorted(set(entry['bundle_info']['file_name'] for entry in import_plan)),
+                                                             self._cfg['config_common'].get('verify_cache', ''))
+            for entry in import_plan:
+                if entry['bundle_info']['file_name'] in failures:
+                    entry['status'] = 'unusable'
+                    entry['reason'] = 'verification failed, {0}'.format(failures[entry['bundle_info']['file_name']])
+
+        for cfg in self._cfg['config_detail'].keys():
+            entries = [entry for entry in import_plan if entry['name'] == cfg]
+            if entries == []:
+                continue
+
+            # Resolve every tip and prerequisite of the repository in a single query
+            commit_ids = set()
+            for entry in entries:
+                if entry['header'] is not None:
+                    commit_ids.update(ref[0] for ref in entry['header']['refs'])
+                    commit_ids.update(prerequisite[0] for prerequisite in entry['header']['prerequisites'])
+            existing = gbr.find_commit_ids(self._cfg['config_detail'][cfg]['path'], list(commit_ids))
+
+            with self._metrics.stage('check_chains', self._cfg['config_detail'][cfg]['path']):
+                self.__check_chains(gbr, cfg, entries, existing)
+            for entry in entries:
+                if entry['status'] == 'unusable':
+                    print('{0}: {1} skipped, {2}'.format(cfg, entry['bundle_info']['file_name'], entry['reason']))
+
+            fetched_files = set()
+            for entry in entries:
+                if entry['status'] != 'import':
+                    continue
+
+                bundle_info = entry['bundle_info']
+                bundle_file = '{0}/{1}'.format(self._cfg['config_common']['merge_input'], bundle_info['file_name'])
+
+                if len(bundle_info.get('branch_names', [bundle_info['branch_name']])) > 1:
+                    # fetch all branches of a multiple branch bundle at once into the import namespace
+                    if not(bundle_info['file_name'] in fetched_files):
+                        fetched_files.add(bundle_info['file_name'])
+                        entry['commands'].append(self.__git_command(cfg, 'fetch', bundle_file,
+                            *['+refs/heads/{0}:{1}{0}'.format(other['bundle_info']['branch_name'], self.IMPORT_NAMESPACE)
+                              for other in entries 
+                              if (other['status'] == 'import') and (other['bundle_info']['file_name'] == bundle_info['file_name'])]))
                 else:
-                    # Skip bundle merge if bundle is not for the target repository 
+                    # fetch bundle content into the import namespace
+                    entry['commands'].append(self.__git_command(cfg, 'fetch', bundle_file,
+                        '+refs/heads/{0}:{1}{0}'.format(bundle_info['branch_name'], self.IMPORT_NAMESPACE)))
+
+                if not(entry['merge']):
+                    # Bundle in the middle of a chain. Only its objects are needed by the next bundles.
                     continue
 
-        fwo.close()
-        fwi.close()
+                # Merge into the branch, or create it at the fetched tip if it doesn't exist.
+                # The branch origin of the bundle name is a commit of the exporting repository, which
+                # may not be here (e.g. in an empty repository).
+                fetched_ref = self.IMPORT_NAMESPACE + bundle_info['branch_name']
+                # A tag of the same name doesn't make the branch exist
+                if gbr.find_branch(self._cfg['config_detail'][cfg]['path'], 'refs/heads/' + bundle_info['branch_name']):
+                    entry['commands'].append(self.__git_command(cfg, 'checkout', bundle_info['branch_name']))
+                    entry['commands'].append(self.__git_command(cfg, 'merge', fetched_ref))
+                else:
+                    entry['commands'].append(self.__git_command(cfg, 'checkout', '-b', bundle_info['branch_name'], fetched_ref))
+
+                # push changes to the remote repository. A branch just created has no upstream to push to.
+                entry['commands'].append(self.__push_command(cfg, bundle_info['branch_name']))
+
+        if own_gbr:
+            gbr.close()
+
+        return import_plan
+
+
+    def run_export(self, workers:int=0) -> dict:
+        """ 
+        Creates bundle files for the configured repositories by running git directly.
+
+        Repositories are processed concurrently by a bounded pool of workers. The commands of
+        each repository run in order and stop at the first failure, which doesn't affect the 
+        other repositories. Configurations sharing a repository path run one after another in
+        the same worker, as they share its working tree. If "estimate_cost" is true, the largest
+        repositories are started first.
+
+        Parameters
+        ----------
+            workers : int
+                maximum number of repositories processed concurrently.
+                "run_workers" in config_common (or the number of CPUs) is used if 0.
+
+        Returns
+        ----------
+            results : dict
+                key = repository configuration name, 
+                value = dictionary with key = 'returncode' (0 if succeeded or skipped), 'command' (failed command),
+                        'stderr' (stderr output of the repository commands),
+                        'skipped' (True if unchanged since the previous export, or if an incremental
+                                   bundle would have no new commits after the pull)
+        """
+        self._metrics.reset('export')
+        self.__create_dir(self._cfg['config_common']['bundle_output'])
+
+        if workers == 0:
+            workers = self._cfg['config_common'].get('run_workers', 0) or os.cpu_count()
+
+        with gitbundle.gitrepo(metrics=self._metrics) as gbr:
+            with self._metrics.stage('plan_export'):
+                export_plan = self.plan_export(gbr, self._cfg['config_common'].get('estimate_cost', False))
+            results     = {}
+
+            # Configurations sharing a repository share its working tree, so they run in one job, in order
+            repositories = {}
+            for export in export_plan:
+                if not(export['skipped']):
+                    repositories.setdefault(self.__path_key(export['path']), []).append(export)
+
+            # Largest repositories first, so that the longest jobs don't start last
+            schedule = list(repositories.values())
+            if self._cfg['config_common'].get('estimate_cost', False):
+                schedule.sort(key=lambda exports: sum(max(0, export['estimate']['bytes']) for export in exports), reverse=True)
+
+            # Each worker just waits on git child processes, so threads are enough to keep them busy
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(self.__run_exports, exports): exports for exports in schedule}
+
+                for future in concurrent.futures.as_completed(futures):
+                    for export, result in zip(futures[future], future.result()):
+                        results[export['name']] = result
+                        if result['skipped']:
+                            print('{0}: no new commits since the previous bundle, skipped'.format(export['name']))
+                            self._metrics.count('repositories_skipped')
+                        elif result['returncode'] == 0:
+                            print('{0}: created {1}'.format(export['name'], export['bundle_name']))
+                            self._metrics.count('repositories_exported')
+                            self._metrics.record_bundle(export['bundle_name'], 'bytes_written',
+                                                        os.path.getsize('{0}/{1}'.format(self._cfg['config_common']['bundle_output'],
+                                                                                         export['bundle_name'])))
+                        else:
+                            self._metrics.count('repositories_failed')
+                            print('{0}: failed ({1}) {2}'.format(export['name'], result['returncode'], ' '.join(result['command'])))
+                            print(result['stderr'])
+
+            for export in export_plan:
+                if export['skipped']:
+                    results[export['name']] = {'returncode': 0, 'command': [], 'stderr': '', 'skipped': True}
+                    self._metrics.count('repositories_skipped')
+
+            # Only repositories exported successfully count as exported for change detection.
+            # Their refs are listed again as pull may have moved them.
+            succeeded = [export for export in export_plan 
+                         if (results[export['name']]['returncode'] == 0) and not(export['skipped'])]
+            if self._cfg['config_common'].get('ref_snapshot', '') != '':
+                for export in succeeded:
+                    export['refs'] = gbr.list_refs(export['path'], self.__snapshot_patterns(gbr, export['name']))
+            self.__save_snapshot(succeeded, results)
+            self.__save_tip_ledger(succeeded, results)
+
+        if self._cfg['config_common'].get('bundle_manifest', '') != '':
+            with self._metrics.stage('write_manifest'):
+                self.write_manifest()
+
+        self.__save_metrics()
+
+        return results
+
+
+    def estimate_export(self) -> list:
+        """
+        Prints the export plan with the estimated content of every bundle without creating them
+        (dry run), and checks the total against "media_capacity" if set. The upstreams of the target
+        branches are fetched first, so that the commits the pull will bring in are estimated as well.
+        Incremental bundles without new commits are left out.
+
+        Returns
+        ----------
+            export_plan : list
+                see plan_export(), ordered from the largest bundle.
+        """
+        with gitbundle.gitrepo(metrics=self._metrics) as gbr:
+            export_plan = self.plan_export(gbr, True)
+
+        # Incremental bundles without new commits won't be created (see the guard in plan_export())
+        for export in export_plan:
+            if not(export['skipped']) and (export['guard'] is not None) and (export['estimate']['objects'] == 0):
+                print('{0}: no new commits since the previous bundle, skipped'.format(export['name']))
+
+        schedule = sorted([export for export in export_plan if not(export['skipped']) and 
+                           not((export['guard'] is not None) and (export['estimate']['objects'] == 0))],
+                          key=lambda export: export['estimate']['bytes'], reverse=True)
+
+        for export in schedule:
+            print('{0:>12} bytes {1:>10} objects  {2}: {3}'.format(export['estimate']['bytes'],
+                                                                   export['estimate']['objects'],
+                                                                   export['name'],
+                                                                   export['bundle_name']))
+
+        total    = sum(max(0, export['estimate']['bytes']) for export in schedule)
+        capacity = self._cfg['config_common'].get('media_capacity', 0)
+        print('{0:>12} bytes in {1} bundles (estimated upper bound)'.format(total, len(schedule)))
+        if any(export['estimate']['bytes'] < 0 for export in schedule):
+            print('Some bundles could not be estimated.')
+        if capacity and (total > capacity):
+            print('Estimated size exceeds media_capacity ({0} bytes).'.format(capacity))
+
+        return schedule
+
+
+    def run_import(self, workers:int=0) -> dict:
+        """ 
+        Applies the bundle files in merge_input to the configured repositories by running git
+        directly. The incremental chain of each branch (see plan_import()) is fetched in order,
+        from its oldest bundle, and the branch is merged once at the tip of the last one.
+
+        Bundle refs are fetched into a dedicated ref namespace (IMPORT_NAMESPACE) first.
+        Fast-forward updates then just move the branch ref, and only true merges use a working
+        tree (the one the branch is checked out in, or a temporary worktree), so branches are
+        never checked out. Fetches of the next repositories overlap with the merge and push of 
+        the repositories already fetched. Configurations sharing a repository path are fetched and
+        merged in one job.
+
+        Parameters
+        ----------
+            workers : int
+                maximum number of repositories fetched (and merged) concurrently.
+                "run_workers" in config_common (or the number of CPUs) is used if 0.
+
+        Returns
+        ----------
+            results : dict
+                key = repository configuration name, 
+                value = dictionary with key = 'returncode' (0 if succeeded), 'command' (failed command),
+                        'stderr' (stderr output of the repository commands), 'skipped'
+        """
+        if workers == 0:
+            workers = self._cfg['config_common'].get('run_workers', 0) or os.cpu_count()
+
+        self._metrics.reset('import')
+        with gitbundle.gitrepo(max(16, workers * 2), self._metrics) as gbr:
+            with self._metrics.stage('plan_import'):
+                import_plan = self.plan_import(gbr)
+            results     = self.__import_bundles(gbr, import_plan, workers)
+
+        self.__save_metrics()
+
+        return results
+
+
+    def watch_import(self, workers:int=0):
+        """ 
+        Watches merge_input and imports bundle files as they arrive, until interrupted (Ctrl+C).
+
+        merge_input is polled every "watch_interval" seconds (5 by default). A new or modified
+        bundle file is imported once its size and mtime haven't changed for "watch_settle" 
+        seconds (10 by default), together with the other settled bundles, into the repositories
+        they belong to only (see run_import()). The bundle catalog and the repository handles
+        are kept between imports.
+
+        Bundles found unusable (e.g. missing prerequisites or not in the manifest yet), including
+        by the import of the bundles already there at start, are retried with the next arrival.
+
+        Parameters
+        ----------
+            workers : int
+                maximum number of repositories fetched (and merged) concurrently.
+                "run_workers" in config_common (or the number of CPUs) is used if 0.
+        """
+        if workers == 0:
+            workers = self._cfg['config_common'].get('run_workers', 0) or os.cpu_count()
+
+        interval = self._cfg['config_common'].get('watch_interval', 5)
+        settle   = self._cfg['config_common'].get('watch_settle', 10)
+        manifest = self._cfg['config_common'].get('bundle_manifest', '')
+
+        # Observed before the first import, so that files arriving or still being copied
+        # meanwhile are seen as changed
+        observed = self.__observe_input()
+
+        self._metrics.reset('watch')
+        with gitbundle.gitrepo(max(16, workers * 2), self._metrics) as gbr:
+            catalog = gitbundle.bundlecatalog(self._cfg['config_common']['merge_input'],
+                                              self.parse_bundle_name,
+                                              self._cfg['config_common'].get('catalog_index', ''))
+
+            # Import what is already there first
+            import_plan = self.plan_import(gbr, catalog)
+            self.__import_bundles(gbr, import_plan, workers)
+            self.__save_metrics()
+
+            changed  = {}
+            retry    = set(entry['bundle_info']['file_name'] for entry in import_plan if entry['status'] == 'unusable')
+            print('Watching {0}'.format(self._cfg['config_common']['merge_input']))
+
+            try:
+                while True:
+                    time.sleep(interval)
+
+                    now     = time.monotonic()
+                    current = self.__observe_input()
+                    for file_name in current:
+                        if observed.get(file_name) != current[file_name]:
+                            changed[file_name] = now
+                    for file_name in list(changed):
+                        if not(file_name in current):
+                            del changed[file_name]
+                    observed = current
+
+                    # Wait until every file being copied has settled
+                    if (changed == {}) or any(now - changed_at < settle for changed_at in changed.values()):
+                        continue
+
+                    arrived = [file_name for file_name in changed if file_name != manifest]
+                    changed = {}
+
+                    repository_names = set()
+                    for file_name in arrived + list(retry):
+                        try:
+                            repository_names.add(self.parse_bundle_name(file_name)['repository_name'])
+                        except (AssertionError, AttributeError):
+                            pass
+
+                    # One metrics file per import
+                    self._metrics.reset('watch')
+                    with self._metrics.stage('catalog_scan'):
+                        catalog.refresh()
+                    with self._metrics.stage('plan_import'):
+                        import_plan = self.plan_import(gbr, catalog, list(repository_names))
+                    self.__import_bundles(gbr, import_plan, workers)
+                    self.__save_metrics()
+
+                    retry = set(entry['bundle_info']['file_name'] for entry in import_plan if entry['status'] == 'unusable')
+            except KeyboardInterrupt:
+                pass
+
+
+    def __import_bundles(self, gbr, import_plan, workers):
+        # Fetches and merges the bundles of an import plan (see run_import()).
+        # Configurations sharing a repository are imported in one job, as they share its refs and working tree.
+        results = {}
+
+        repos = {}
+        for entry in import_plan:
+            if entry['status'] == 'import':
+                repos.setdefault(self.__path_key(entry['path']), []).append(entry)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as fetchers, \
+             concurrent.futures.ThreadPoolExecutor(max_workers=workers) as mergers:
+            fetches = {fetchers.submit(self.__run_stage, 'fetch', entries[0]['name'], self.__fetch_bundles, entries): repo
+                       for repo, entries in repos.items()}
+            merges  = {}
+            repo_results = {}
+
+            for future in concurrent.futures.as_completed(fetches):
+                repo = fetches[future]
+                if future.result()['returncode'] != 0:
+                    repo_results[repo] = future.result()
+                    continue
+                merges[mergers.submit(self.__run_stage, 'merge', repos[repo][0]['name'], self.__merge_bundles, 
+                                      gbr, repos[repo], future.result())] = repo
+
+            for future in concurrent.futures.as_completed(merges):
+                repo_results[merges[future]] = future.result()
+
+        for repo, entries in repos.items():
+            names = []
+            for entry in entries:
+                if not(entry['name'] in names):
+                    names.append(entry['name'])
+            for cfg in names:
+                results[cfg] = repo_results[repo]
+
+            # The entries of a multiple branch bundle share its file
+            file_names = []
+            for entry in entries:
+                if not(entry['bundle_info']['file_name'] in file_names):
+                    file_names.append(entry['bundle_info']['file_name'])
+
+            if repo_results[repo]['returncode'] == 0:
+                print('{0}: imported {1}'.format(' '.join(names), ' '.join(file_names)))
+                self._metrics.count('repositories_imported')
+                for file_name in file_names:
+                    self._metrics.record_bundle(file_name, 'bytes_read', 
+                                                os.path.getsize('{0}/{1}'.format(self._cfg['config_common']['merge_input'],
+                                                                                 file_name)))
+            else:
+                self._metrics.count('repositories_failed')
+                print('{0}: failed ({1}) {2}'.format(' '.join(names), repo_results[repo]['returncode'],
+                                                     ' '.join(repo_results[repo]['command'])))
+                print(repo_results[repo]['stderr'])
+
+        self.__count_import(import_plan, results)
+
+        return results
+
+
+    def __run_exports(self, exports):
+        # Runs the exports of a repository one after another (see __run_export())
+        return [self.__run_export(export) for export in exports]
+
+
+    def __run_export(self, export):
+        # Runs the commands of an export. An incremental bundle is only created if its guard counts new commits.
+        if export['guard'] is None:
+            return self.__run_commands(export['name'], export['commands'])
+
+        result = self.__run_commands(export['name'], export['commands'][:-1])
+        if result['returncode'] != 0:
+            return result
+
+        start = time.perf_counter()
+        proc  = subprocess.run(self.__git_args(export['guard']), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self._metrics.record_command(export['path'], export['guard'], proc.returncode, time.perf_counter() - start)
+        if proc.stdout.decode().strip() == '0':
+            result['skipped'] = True
+            return result
+
+        return self.__run_commands(export['name'], export['commands'][-1:], result)
+
+
+    def __run_stage(self, name, cfg, func, *args):
+        # Runs func(*args) in a worker, timed as a stage of the repository
+        with self._metrics.stage(name, self._cfg['config_detail'][cfg]['path']):
+            return func(*args)
+
+
+    def __count_import(self, import_plan, results=None):
+        # Counts the bundles imported (or planned for import without results), failed, no-op and unusable
+        counters = {'import': 'bundles_imported', 'noop': 'bundles_noop', 'unusable': 'bundles_unusable'}
+        for entry in import_plan:
+            counter = counters[entry['status']]
+            if (entry['status'] == 'import') and (results is not None) and (results[entry['name']]['returncode'] != 0):
+                counter = 'bundles_failed'
+            self._metrics.count(counter)
+
+
+    def __save_metrics(self):
+        if self._cfg['config_common'].get('metrics_output', '') != '':
+            self._metrics.save(self._cfg['config_common']['metrics_output'])
+
+
+    def __observe_input(self):
+        # Size and mtime of the bundle files (and the manifest) in merge_input
+        observed = {}
+        if not(os.path.isdir(self._cfg['config_common']['merge_input'])):
+            return observed
+
+        with os.scandir(self._cfg['config_common']['merge_input']) as it:
+            for entry in it:
+                if (entry.name.endswith('.bundle') or (entry.name == self._cfg['config_common'].get('bundle_manifest', ''))) \
+                   and entry.is_file():
+                    stat = entry.stat()
+                    observed[entry.name] = (stat.st_size, stat.st_mtime)
+
+        return observed
+
+
+    def write_manifest(self) -> dict:
+        """
+        Writes the manifest "bundle_manifest" of the bundle files in bundle_output (see bundlemanifest),
+        to be transferred with the bundle files and verified on the import side.
+
+        Returns
+        ----------
+            manifest : dict
+                see bundlemanifest.write()
+        """
+        return gitbundle.bundlemanifest().write(self._cfg['config_common']['bundle_output'],
+                                                '{0}/{1}'.format(self._cfg['config_common']['bundle_output'],
+                                                                 self._cfg['config_common']['bundle_manifest']))
+
+
+    def split_bundles(self) -> list:
+        """
+        Splits the bundle files in bundle_output into chunks of "chunk_size" bytes in chunk_output
+        for transfer over size-limited media (see bundlechunk).
+
+        Returns
+        ----------
+            manifest_files : list
+                File paths to the chunk manifests written.
+        """
+        self.__create_dir(self._cfg['config_common']['chunk_output'])
+
+        chunker = gitbundle.bundlechunk(int(self._cfg['config_common'].get('chunk_size', 1024 * 1024 * 1024)))
+        return chunker.split_dir(self._cfg['config_common']['bundle_output'],
+                                 self._cfg['config_common']['chunk_output'])
+
+
+    def assemble_bundles(self) -> dict:
+        """
+        Verifies the chunks in chunk_input and reassembles the bundle files into merge_input
+        (see bundlechunk).
+
+        Returns
+        ----------
+            bad_chunks : dict
+                key = bundle file name, value = names of the chunks missing or broken, to copy again.
+        """
+        self.__create_dir(self._cfg['config_common']['merge_input'])
+
+        bad_chunks = gitbundle.bundlechunk().assemble_dir(self._cfg['config_common']['chunk_input'],
+                                                          self._cfg['config_common']['merge_input'])
+        for file_name in bad_chunks:
+            print('{0}: copy again {1}'.format(file_name, ' '.join(bad_chunks[file_name])))
+
+        return bad_chunks
+
+
+    def prune_bundles(self, dry_run:bool=False) -> list:
+        """
+        Prunes the bundle files in bundle_output and merge_input according to the retention policies
+        in config_common (see bundleretention): "retention_count" (bundles kept per repository and
+        branch), "retention_days" (maximum age in days) and "retention_bytes" (maximum total size of
+        each directory). Policies set to 0 or missing are not applied.
+
+        Bundles still needed are always kept: in bundle_output the most recent bundle of each branch and
+        every link of the incremental chain it builds on (see bundleretention.find_chains()), and in
+        merge_input every bundle not merged or covered yet (see plan_import()): the bundles to import and
+        the unusable ones, e.g. waiting for prerequisites that haven't arrived yet, failing verification
+        or still being copied. Each directory is scanned once.
+
+        Parameters
+        ----------
+            dry_run : bool
+                True to only report the bundles that would be pruned.
+
+        Returns
+        ----------
+            pruned : list
+                list of dictionary, one per bundle pruned (or to prune with dry_run).
+                key = 'path' (file path to the bundle), 'size' (bytes), 'reason'
+        """
+        self._metrics.reset('prune')
+
+        config_common = self._cfg['config_common']
+        retention     = gitbundle.bundleretention(int(config_common.get('retention_count', 0)),
+                                                  int(config_common.get('retention_days', 0)),
+                                                  int(config_common.get('retention_bytes', 0)))
+        pruned        = []
+
+        # The directories compare equal regardless of case (on Windows), separators and trailing slashes
+        inbox       = os.path.normcase(os.path.abspath(config_common['merge_input']))
+        bundle_dirs = [config_common['bundle_output']]
+        if inbox != os.path.normcase(os.path.abspath(config_common['bundle_output'])):
+            bundle_dirs.append(config_common['merge_input'])
+
+        for bundle_dir in bundle_dirs:
+            if not(os.path.isdir(bundle_dir)):
+                continue
+
+            is_inbox = (os.path.normcase(os.path.abspath(bundle_dir)) == inbox)
+            with self._metrics.stage('catalog_scan'):
+                catalog = gitbundle.bundlecatalog(bundle_dir, self.parse_bundle_name,
+                                                  config_common.get('catalog_index', '') if is_inbox else '')
+
+            if is_inbox:
+                # Only the bundles merged already or covered by a later bundle (no-op) can go, whatever
+                # chain they belong to. Bundles to import are kept, and so are the unusable ones, e.g.
+                # waiting for a missing link of their chain or still being copied.
+                protected = {}
+                with gitbundle.gitrepo(metrics=self._metrics) as gbr:
+                    for entry in self.plan_import(gbr, catalog):
+                        if entry['status'] == 'import':
+                            protected.setdefault(entry['bundle_info']['file_name'], 'to import into ' + entry['name'])
+                        elif entry['status'] == 'unusable':
+                            protected.setdefault(entry['bundle_info']['file_name'],
+                                                 'not imported into {0} yet, {1}'.format(entry['name'], entry['reason']))
+            else:
+                protected = retention.find_chains(catalog)
+
+            sizes = {bundle_info['file_name']: bundle_info['size'] for bundle_info in catalog.get_file_list()}
+            for file_name, reason in sorted(retention.select(catalog, protected).items()):
+                bundle_file = '{0}/{1}'.format(bundle_dir, file_name)
+                print('{0}: {1} ({2})'.format(bundle_file, 'to prune' if dry_run else 'pruned', reason))
+                if not(dry_run):
+                    os.remove(bundle_file)
+                    self._metrics.count('bundles_pruned')
+                    self._metrics.record_bundle(file_name, 'bytes_pruned', sizes[file_name])
+                pruned.append({'path': bundle_file, 'size': sizes[file_name], 'reason': reason})
+                del sizes[file_name]
+
+            print('{0}: {1} bundles kept, {2} bytes'.format(bundle_dir, len(sizes), sum(sizes.values())))
+            if 0 < int(config_common.get('retention_bytes', 0)) < sum(sizes.values()):
+                print('{0}: over retention_bytes, the remaining bundles are still needed'.format(bundle_dir))
+
+        self.__save_metrics()
+
+        return pruned
 
 
     def get_bundle_list(self, bundle_dir:str) -> list:
@@ -176,26 +1084,7 @@ class gitbundlemng:
                 list of bundle file information dictionary.
                 dictionary contents follows the return definition of the method parse_bundle_name()
         """
-        bundle_files = glob.glob(bundle_dir + '/*.bundle')
-        bundle_info_list  = []
-
-        for bundle_file in bundle_files:
-            file_name = bundle_file.replace(bundle_dir, '').replace('\\','')
-            info = self.parse_bundle_name(file_name)
-            try:
-                for bundle_info in bundle_info_list:
-                    if (    (bundle_info['repository_name'] == info['repository_name'])\
-                        and (bundle_info['branch_name']     == info['branch_name'])):
-
-                        if int(bundle_info['time']) > int(info['time']):
-                            bundle_info_list[bundle_info_list.index(bundle_info)] = bundle_file
-                            break
-                else:
-                    bundle_info_list.append(info)
-            except:
-                pass
-
-        return bundle_info_list
+        return gitbundle.bundlecatalog(bundle_dir, self.parse_bundle_name).get_bundle_list()
 
 
     def get_branch_name_in_bundle(self, bundle_file:str) -> list:
@@ -212,21 +1101,13 @@ class gitbundlemng:
             branch_list : list
                 List of branch names and SHA-1. Each list element holds a sublist with SHA-1 (element 0) and 
                 branch name (element 1) in string. 
+
+        Raises
+        ----------
+            ValueError
+                if the file is not a git bundle or the header is broken.
         """
-        with open(bundle_file, 'rb') as frb:
-            branch_list = []
-            while True:
-                line = frb.readline().decode().replace('\n', '')
-                if re.match("^#\s", line):
-                    # skip the first (header) line
-                    continue
-                else:
-                    if line == '':
-                        break
-                    else: 
-                        branch_list.append(line.split())
-        
-        return branch_list
+        return gitbundle.bundleheader().read(bundle_file)['refs']
 
         
     def get_config(self) -> dict:
@@ -254,26 +1135,31 @@ class gitbundlemng:
         ----------
         bundle_info : dict
             Bundle information. 
-            key = 'repository_name', 'branch_name', 'branch_origin' (commit hash id), 'branch_datetime' (yyyymmddHHMMSS), 'bundle_file_name'
+            key = 'repository_name', 'branch_name', 'branch_names' (list of all branch names in the bundle),
+                  'branch_origin' (commit hash id), 'branch_datetime' (yyyymmddHHMMSS), 
+                  'prerequisite' (commit hash id, or INCREMENTAL_MARKER for multiple branches), 'bundle_file_name'
             bundle_info['branch_origin'] value of 'NOORIGIN' means there was no root commit found for the branch
+            bundle_info['prerequisite'] value of '' means the bundle is a full (not incremental) bundle
         """
         bundle_info = {}
         bundle_name_sp = re.match('(.*).bundle', bundle_name).group().replace('.bundle', '').split('@')
 
-        assert len(bundle_name_sp)    == 4      ,  'Illegal bundle file name (1). len={0}'.format(len(bundle_name_sp))
+        assert len(bundle_name_sp) in (4, 5)    ,  'Illegal bundle file name (1). len={0}'.format(len(bundle_name_sp))
         assert len(bundle_name_sp[3]) == 14  or bundle_name_sp[3] == "NOORIGIN", 'Illegal bundle file name (2). len={0}'.format(len(bundle_name_sp[3]))
 
         bundle_info['repository_name'] = bundle_name_sp[0]
-        bundle_info['branch_name']     = bundle_name_sp[1].replace('+', '/')
+        bundle_info['branch_names']    = [branch_name.replace('+', '/') for branch_name in bundle_name_sp[1].split(',')]
+        bundle_info['branch_name']     = bundle_info['branch_names'][0]
         bundle_info['branch_origin']   = bundle_name_sp[2]
         bundle_info['bundle_datetime'] = bundle_name_sp[3]
+        bundle_info['prerequisite']    = bundle_name_sp[4] if len(bundle_name_sp) == 5 else ''
         bundle_info['file_name']       = bundle_name
 
         return bundle_info
 
             
 
-    def make_bundlename(self, repository_name:str, branch_name:str, branch_origin:str) -> str:
+    def make_bundlename(self, repository_name:str, branch_name:str, branch_origin:str, prerequisite:str='') -> str:
         """ 
         Generates bundle file name.
 
@@ -281,10 +1167,14 @@ class gitbundlemng:
         ----------
             repository_name : str
                 name of repository
-            branch_name   : str
-                name of branch
+            branch_name   : str or list
+                name of branch, or list of names of branches in the bundle
             branch_origin : str
                 commit id of branch origin
+            prerequisite : str
+                commit id of the last exported tip an incremental bundle is based on
+                (INCREMENTAL_MARKER for multiple branches).
+                empty for a full bundle.
 
         Returns
         ----------
@@ -296,25 +1186,47 @@ class gitbundlemng:
             bundle file naming convention
             
             <repository_name>@<branch_name>@<branch_origin>@<bundle_date>.bundle
+            <repository_name>@<branch_name>@<branch_origin>@<bundle_date>@<prerequisite>.bundle (incremental bundle)
             
             <repository_name>   : 
                 identification of the repsitory from which the bundle file was created.
             <branch_name>       : 
                 branch name of the bundle wherein "+" denotes "/", 
                 e.g. branch feature/func_1 being feature+func_1 
+                branch names are separated by "," if the bundle holds multiple branches.
             <branch_origin>     : 
                 commit ID (complete HASH without abbreviation) of the branch origin.
-                NOORIGIN if there is no origin or the origin is not found
+                NOORIGIN if there is no origin or the origin is not found, or for multiple branches
             <bundle_datetime>   : 
                 date and time of bundle generation (yyyymmddHHMMSS).
+            <prerequisite>      : 
+                commit ID (complete HASH without abbreviation) the incremental bundle requires,
+                i.e. the tip exported by the previous bundle of the branch.
+                INC for a bundle of multiple branches, whose prerequisites are only in the bundle header.
+
+        Raises
+        ----------
+            ValueError
+                if a branch name contains "," or "@", which separate the fields of the name.
         """
 
+        if not(isinstance(branch_name, list)):
+            branch_name = [branch_name]
+        for name in branch_name:
+            if (',' in name) or ('@' in name):
+                raise ValueError('Branch name with "," or "@" not supported in bundle names. repository={0}, branch={1}'.format(repository_name, name))
+        branch_name = ','.join(branch_name)
+
         date_time_now = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9))).strftime('%Y%m%d%H%M%S')
-        bundle_name = "{0}@{1}@{2}@{3}.bundle".format(repository_name, 
-                                                      branch_name.replace('/', '+'),
-                                                      branch_origin,
-                                                      date_time_now
-                                                      )
+        bundle_name = "{0}@{1}@{2}@{3}".format(repository_name, 
+                                               branch_name.replace('/', '+'),
+                                               branch_origin,
+                                               date_time_now
+                                               )
+        if prerequisite != '':
+            bundle_name += "@{0}".format(prerequisite)
+
+        bundle_name += ".bundle"
 
         return bundle_name
 
@@ -341,6 +1253,416 @@ class gitbundlemng:
         return is_my_repo
 
 
+    def __check_chains(self, gbr, cfg, entries, existing):
+        # Chains the bundles of each branch of a repository (entries ordered from the oldest bundle)
+        branches = {}
+        for entry in entries:
+            if entry['status'] != 'import':
+                continue
+            if entry['header'] is None:
+                entry['status'] = 'unusable'
+                entry['reason'] = 'bundle header is broken'
+                continue
+
+            branch_name = entry['bundle_info']['branch_name']
+            if not(any(ref[1] == 'refs/heads/' + branch_name for ref in entry['header']['refs'])):
+                if len(entry['bundle_info'].get('branch_names', [])) > 1:
+                    # Branches without new commits are left out of incremental multiple branch bundles
+                    entry['status'] = 'noop'
+                    entry['reason'] = 'branch {0} not updated'.format(branch_name)
+                else:
+                    entry['status'] = 'unusable'
+                    entry['reason'] = 'no ref for branch {0}'.format(branch_name)
+                continue
+
+            branches.setdefault(branch_name, []).append(entry)
+
+        # A chain starts from the most recent bundle applicable to the repository as is.
+        # The bundles before are covered by it.
+        for branch_name, branch_entries in branches.items():
+            starts = [index for index, entry in enumerate(branch_entries)
+                      if all(prerequisite[0] in existing for prerequisite in entry['header']['prerequisites'])]
+            if starts == []:
+                continue
+            for entry in branch_entries[:starts[-1]]:
+                entry['status'] = 'noop'
+                entry['reason'] = 'covered by {0}'.format(branch_entries[starts[-1]]['bundle_info']['file_name'])
+
+        # Every bundle needs commits of the repository or of the bundles fetched before it
+        known      = set(existing)
+        file_names = set()
+        for entry in entries:
+            if entry['status'] != 'import':
+                continue
+
+            missing = [prerequisite[0] for prerequisite in entry['header']['prerequisites'] 
+                       if not(prerequisite[0] in known)]
+            if missing != []:
+                entry['status']  = 'unusable'
+                entry['reason']  = 'missing prerequisites {0}'.format(' '.join(missing))
+                entry['missing'] = missing
+                continue
+
+            if not(entry['bundle_info']['file_name'] in file_names):
+                file_names.add(entry['bundle_info']['file_name'])
+                known.update(ref[0] for ref in entry['header']['refs'])
+
+        # The last bundle of each chain is merged, unless its tip is already merged
+        for branch_name, branch_entries in branches.items():
+            chain = [entry for entry in branch_entries if entry['status'] == 'import']
+            if chain == []:
+                continue
+
+            branch_tips = [ref[0] for ref in chain[-1]['header']['refs'] if ref[1] == 'refs/heads/' + branch_name]
+            if all(branch_tip in existing for branch_tip in branch_tips) and \
+               gbr.is_merged(self._cfg['config_detail'][cfg]['path'], branch_tips, branch_name):
+                for entry in chain:
+                    entry['status'] = 'noop'
+                    entry['reason'] = 'already merged'
+                continue
+
+            chain[-1]['merge'] = True
+
+
+    def __git_command(self, cfg, *args):
+        return ['git', self._cfg['config_common']['git_option'], self._cfg['config_detail'][cfg]['path']] + list(args)
+
+
+    def __push_command(self, cfg, branch_name):
+        # Pushes a branch to "push_remote" whether or not it has an upstream
+        return self.__git_command(cfg, 'push', self._cfg['config_common'].get('push_remote', 'origin'),
+                                  'refs/heads/{0}:refs/heads/{0}'.format(branch_name))
+
+
+    def __git_args(self, command):
+        # Runs the git of "git_path". On Windows, subprocess doesn't look the executable up in the PATH
+        # of the child environment, so it is resolved here once.
+        if self._git_executable is None:
+            git_path = self._cfg['config_common']['git_path']
+            if os.path.isfile(git_path):
+                self._git_executable = git_path
+            else:
+                self._git_executable = shutil.which('git', path=git_path) or 'git'
+
+        return [self._git_executable] + command[1:]
+
+
+    def __run_commands(self, cfg, commands, result=None):
+        # Runs commands of a repository in order and stops at the first failure
+        if result is None:
+            result = {'returncode': 0, 'command': [], 'stderr': '', 'skipped': False}
+
+        for command in commands:
+            start = time.perf_counter()
+            proc  = subprocess.run(self.__git_args(command), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            self._metrics.record_command(self._cfg['config_detail'][cfg]['path'], command, proc.returncode, time.perf_counter() - start)
+            result['stderr'] += proc.stderr.decode(errors='replace')
+            if proc.returncode != 0:
+                result['returncode'] = proc.returncode
+                result['command']    = command
+                break
+
+        return result
+
+
+    def __fetch_bundles(self, entries):
+        # Fetches the branch of every bundle of a repository into the import namespace
+        # Branches of a multiple branch bundle are fetched with a single fetch
+        refspecs = {}
+        for entry in entries:
+            refspecs.setdefault(entry['bundle_info']['file_name'], []).append(
+                '+refs/heads/{0}:{1}{0}'.format(entry['bundle_info']['branch_name'], self.IMPORT_NAMESPACE))
+
+        commands = []
+        for file_name in refspecs:
+            commands.append(self.__git_command(entries[0]['name'], 'fetch', '--no-write-fetch-head',
+                                               '{0}/{1}'.format(self._cfg['config_common']['merge_input'], file_name),
+                                               *refspecs[file_name]))
+
+        return self.__run_commands(entries[0]['name'], commands)
+
+
+    def __merge_bundles(self, gbr, entries, result):
+        # Moves the branches of a repository to the fetched tips and pushes them
+        cfg       = entries[0]['name']
+        path      = entries[0]['path']
+        worktrees = gbr.find_worktrees(path)
+
+        for entry in entries:
+            if not(entry['merge']):
+                # Only fetched for the bundles after it in the chain
+                continue
+
+            branch_name = entry['bundle_info']['branch_name']
+            fetched_ref = self.IMPORT_NAMESPACE + branch_name
+            fetched     = [ref[0] for ref in entry['header']['refs'] if ref[1] == 'refs/heads/' + branch_name][0]
+            local       = gbr.find_branch_tip(path, 'refs/heads/' + branch_name)
+
+            if local == '':
+                # New branch. Just create it at the fetched tip.
+                commands = [self.__git_command(cfg, 'update-ref', 'refs/heads/' + branch_name, fetched, '0' * 40)]
+            elif gbr.is_ancestor(path, fetched, local):
+                # Nothing to merge
+                commands = []
+            elif gbr.is_ancestor(path, local, fetched):
+                if branch_name in worktrees:
+                    # Keep the working tree of the checked out branch in sync
+                    commands = [['git', self._cfg['config_common']['git_option'], worktrees[branch_name],
+                                 'merge', '--ff-only', fetched_ref]]
+                else:
+                    commands = [self.__git_command(cfg, 'update-ref', 'refs/heads/' + branch_name, fetched, local)]
+            elif branch_name in worktrees:
+                commands = [['git', self._cfg['config_common']['git_option'], worktrees[branch_name],
+                             'merge', '--no-edit'] + self._cfg['config_common']['merge_option'].split() + [fetched_ref]]
+            else:
+                # True merge of a branch not checked out. Merge in a temporary worktree.
+                worktree = tempfile.mkdtemp(prefix='gitbundle-')
+                os.rmdir(worktree)
+                commands = [self.__git_command(cfg, 'worktree', 'add', '--quiet', worktree, branch_name),
+                            ['git', self._cfg['config_common']['git_option'], worktree,
+                             'merge', '--no-edit'] + self._cfg['config_common']['merge_option'].split() + [fetched_ref]]
+                self.__run_commands(cfg, commands, result)
+                commands = [self.__git_command(cfg, 'worktree', 'remove', '--force', worktree)] 
+                if result['returncode'] != 0:
+                    self.__run_commands(cfg, commands)
+                    return result
+
+            commands.append(self.__push_command(cfg, branch_name))
+            if self.__run_commands(cfg, commands, result)['returncode'] != 0:
+                return result
+
+        return result
+
+
+    def __save_snapshot(self, export_plan, results):
+        if self._cfg['config_common'].get('ref_snapshot', '') == '':
+            return
+
+        snapshot = gitbundle.refsnapshot(self._cfg['config_common']['ref_snapshot'])
+        for export in export_plan:
+            if export['refs'] is not None:
+                # No bundle is created when an incremental export has no new commits
+                snapshot.update(export['name'], export['refs'],
+                                None if results[export['name']]['skipped'] else export['bundle_name'])
+        snapshot.save()
+
+
+    def __prerequisite_field(self, branches, prerequisites):
+        # The tips of multiple branches would make the file name too long for Windows (MAX_PATH).
+        # The importer reads the prerequisites from the bundle header anyway.
+        if (prerequisites == []) or (len(branches) == 1):
+            return ''.join(prerequisites)
+
+        return self.INCREMENTAL_MARKER
+
+
+    def __update_snapshot(self, snapshot, gbr):
+        # Record the refs exported by the bundles the scripts generated since the previous run.
+        # The target branches are taken at their tip in the bundle, and tags at their commit in the
+        # bundle if it carries them. Remote-tracking branches already contained in the exported tip
+        # are taken as they are, as pulling them brings nothing the bundle doesn't have.
+        if not(os.path.isdir(self._cfg['config_common']['bundle_output'])):
+            return
+
+        catalog = gitbundle.bundlecatalog(self._cfg['config_common']['bundle_output'], self.parse_bundle_name)
+        bundle_files = {}
+        for cfg in self._cfg['config_detail'].keys():
+            bundle_info = catalog.find(self._cfg['config_detail'][cfg]['repository_name'], self.__target_branches(cfg)[0])
+            if (bundle_info is None) or (bundle_info['file_name'] == snapshot.get_file_name(cfg)):
+                continue
+            if (snapshot.get_file_name(cfg) != '') and \
+               (self.parse_bundle_name(snapshot.get_file_name(cfg))['bundle_datetime'] >= bundle_info['bundle_datetime']):
+                continue
+            bundle_files['{0}/{1}'.format(self._cfg['config_common']['bundle_output'], bundle_info['file_name'])] = cfg
+
+        for bundle_file, header in gitbundle.bundleheader().read_files(list(bundle_files)).items():
+            if header is None:
+                # Bundle creation failed or is still in progress
+                continue
+
+            cfg      = bundle_files[bundle_file]
+            exported = {ref[1]: ref[0] for ref in header['refs']}
+            refs     = gbr.list_refs(self._cfg['config_detail'][cfg]['path'], self.__snapshot_patterns(gbr, cfg))
+            upstreams = gbr.find_upstreams(self._cfg['config_detail'][cfg]['path'], self.__target_branches(cfg))
+            for ref_name in refs:
+                if ref_name.startswith('refs/tags/'):
+                    refs[ref_name] = exported.get(ref_name, refs[ref_name])
+                    continue
+                for branch_name in self.__target_branches(cfg):
+                    tip = exported.get('refs/heads/' + branch_name)
+                    if tip is None:
+                        continue
+                    if ref_name == 'refs/heads/' + branch_name:
+                        refs[ref_name] = tip
+                    elif (ref_name == upstreams.get(branch_name)) and \
+                         not(gbr.is_ancestor(self._cfg['config_detail'][cfg]['path'], refs[ref_name], tip)):
+                        refs[ref_name] = tip
+
+            snapshot.update(cfg, refs, os.path.basename(bundle_file))
+
+
+    def __fetch_upstreams(self, gbr):
+        # Fetches the upstreams of the target branches concurrently, once per repository.
+        # A repository whose fetch fails is compared with its local refs.
+        repositories = {}
+        for cfg in self._cfg['config_detail'].keys():
+            repository = repositories.setdefault(self.__path_key(self._cfg['config_detail'][cfg]['path']),
+                                                 (self._cfg['config_detail'][cfg]['path'], []))
+            repository[1].extend(self.__target_branches(cfg))
+
+        workers = self._cfg['config_common'].get('run_workers', 0) or os.cpu_count()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(gbr.fetch_upstreams, repo_path, branch_names): repo_path
+                       for repo_path, branch_names in repositories.values()}
+            for future in concurrent.futures.as_completed(futures):
+                if not(future.result()):
+                    print('{0}: fetch failed, compared with the local refs'.format(futures[future]))
+
+
+    def __plan_maintenance(self, gbr, export_plan):
+        # Writes the commit-graph (refs moved) and bitmaps (enough new objects) before bundle creation
+        # of the most changed repositories, up to "maintenance_budget" repositories per run.
+        # Staleness is read from the repository itself, so maintenance run by the scripts counts as well.
+        threshold  = self._cfg['config_common'].get('maintenance_objects', 10000)
+        candidates = []
+        planned    = set()
+
+        for export in export_plan:
+            if export['skipped'] or (self.__path_key(export['path']) in planned):
+                continue
+            planned.add(self.__path_key(export['path']))
+
+            maintenance = gbr.find_maintenance(export['path'])
+            if (maintenance is None) or (maintenance['bitmap'] == 0):
+                # Never maintained (or unknown). Write everything.
+                candidates.append((float('inf'), export, True, True))
+                continue
+
+            write_bitmap       = (maintenance['objects'] >= threshold)
+            write_commit_graph = (maintenance['commit_graph'] == 0) or (maintenance['refs'] > 0)
+            if write_bitmap or write_commit_graph:
+                candidates.append((maintenance['objects'], export, write_bitmap, write_commit_graph))
+
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        budget = self._cfg['config_common'].get('maintenance_budget', 0) or len(candidates)
+
+        for _, export, write_bitmap, write_commit_graph in candidates[:budget]:
+            commands = []
+            if write_bitmap:
+                commands.append(self.__git_command(export['name'], *self.__pack_config(export['name']),
+                                                   'repack', '-a', '-d', '-q', '--write-bitmap-index'))
+            if write_commit_graph:
+                commands.append(self.__git_command(export['name'], 'commit-graph', 'write', '--reachable', '--split'))
+
+            # Maintain right before bundle creation, after the pull
+            export['commands'][-1:-1] = commands
+            export['maintained'] = True
+
+        if len(candidates) > budget:
+            print('{0} of {1} repositories to maintain deferred to the next run.'.format(len(candidates) - budget,
+                                                                                        len(candidates)))
+
+
+    def __estimate_exports(self, gbr, export_plan, rev_args):
+        # Estimates the bundles concurrently. Each estimate waits on git rev-list processes.
+        workers = self._cfg['config_common'].get('run_workers', 0) or os.cpu_count()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(gbr.estimate_bundle, export['path'], rev_args[export['name']]): export
+                       for export in export_plan if not(export['skipped'])}
+            for future in concurrent.futures.as_completed(futures):
+                futures[future]['estimate'] = future.result()
+
+
+    def __get_option(self, cfg, key, default):
+        # Repository settings in config_detail override config_common
+        return self._cfg['config_detail'][cfg].get(key, self._cfg['config_common'].get(key, default))
+
+
+    def __pack_config(self, cfg):
+        # Pack tuning (e.g. pack.threads, pack.window, pack.depth) passed as git -c options.
+        # "pack_config" in config_detail overrides the keys of config_common.
+        pack_config = dict(self._cfg['config_common'].get('pack_config', {}))
+        pack_config.update(self._cfg['config_detail'][cfg].get('pack_config', {}))
+
+        args = []
+        for key, value in pack_config.items():
+            args += ['-c', '{0}={1}'.format(key, value)]
+
+        return args
+
+
+    def __target_branches(self, cfg):
+        # target_branch holds either a branch name or a list of branch names
+        if isinstance(self._cfg['config_detail'][cfg]['target_branch'], list):
+            return self._cfg['config_detail'][cfg]['target_branch']
+
+        return [self._cfg['config_detail'][cfg]['target_branch']]
+
+
+    def __snapshot_patterns(self, gbr, cfg):
+        # Refs compared for change detection: the target branches, their upstreams and tags if exported
+        patterns = []
+        for branch_name in self.__target_branches(cfg):
+            patterns.append('refs/heads/{0}'.format(branch_name))
+        patterns += gbr.find_upstreams(self._cfg['config_detail'][cfg]['path'], self.__target_branches(cfg)).values()
+        if '--tags' in self.__get_option(cfg, 'bundle_option', '').split():
+            patterns.append('refs/tags')
+
+        return patterns
+
+
+    def __update_tip_ledger(self, ledger):
+        # Record the tips of the bundles generated by the scripts since the previous run
+        if not(os.path.isdir(self._cfg['config_common']['bundle_output'])):
+            return
+
+        catalog = gitbundle.bundlecatalog(self._cfg['config_common']['bundle_output'], self.parse_bundle_name)
+        file_names = []
+        for bundle_info in catalog.get_bundle_list():
+            entry = ledger.get_entry(bundle_info['repository_name'], bundle_info['branch_name'])
+            if ((entry is None) or (entry['bundle_datetime'] < bundle_info['bundle_datetime'])) and \
+               not(bundle_info['file_name'] in file_names):
+                file_names.append(bundle_info['file_name'])
+
+        self.__record_tips(ledger, file_names)
+
+
+    def __save_tip_ledger(self, export_plan, results):
+        # Record the tips of the bundles just created, which may be moved to the media before the next run
+        if self._cfg['config_common'].get('bundle_mode', 'full') != 'incremental':
+            return
+
+        ledger = gitbundle.tipledger(self._cfg['config_common']['tip_ledger'])
+        self.__record_tips(ledger, [export['bundle_name'] for export in export_plan if not(results[export['name']]['skipped'])])
+        ledger.save()
+
+
+    def __record_tips(self, ledger, file_names):
+        # Record the tips of the branches in the headers of bundles in bundle_output
+        bundle_files = {'{0}/{1}'.format(self._cfg['config_common']['bundle_output'], file_name): file_name
+                        for file_name in file_names}
+
+        for bundle_file, header in gitbundle.bundleheader().read_files(list(bundle_files)).items():
+            if header is None:
+                # Bundle creation failed or is still in progress
+                continue
+
+            bundle_info = self.parse_bundle_name(bundle_files[bundle_file])
+            for ref in header['refs']:
+                for branch_name in bundle_info['branch_names']:
+                    if ref[1] == 'refs/heads/' + branch_name:
+                        ledger.record(bundle_info['repository_name'],
+                                      branch_name,
+                                      ref[0],
+                                      bundle_info['bundle_datetime'],
+                                      bundle_info['file_name'])
+
+
+    def __path_key(self, repo_path):
+        # Repository paths compare equal regardless of case (on Windows) and redundant separators
+        return os.path.normcase(os.path.normpath(repo_path))
+
+
     def __create_dir(self, dir_path):
         if os.path.isdir(dir_path):
             pass
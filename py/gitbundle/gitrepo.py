@@ -23,17 +23,72 @@
 # ======================================================================================
 
 
-import git
+import collections
+import contextlib
+import gitbundle
+import glob
+import os
 import re
+import struct
+import subprocess
+import threading
  
 class gitrepo:
     """
     Git repository manager module.
 
     This is a simple module to handle minor operations using GitPython.
+
+    Branches and tags are read directly from the repository files (see refreader) whenever
+    possible. GitPython is imported on first use only, for revision expressions and other
+    operations the ref reader can't answer.
+
+    Repository handles are cached (up to max_repos, least recently used ones are closed first)
+    together with a persistent git cat-file process per repository used for object lookups.
+    Handles in use by a thread are never closed. The cache grows past max_repos while more
+    repositories are in use, and shrinks back as they are released.
+    Call close() (or use the instance as a context manager) to release them at the end of a run.
     """
 
-    def find_branch_origin(self, repo_path, branch_name) -> str:
+    # Number of object names sent to cat-file per round-trip. Kept small enough that
+    # the answers never fill the pipe while the requests are being written.
+    CATFILE_CHUNK = 256
+
+    def __init__(self, max_repos:int=16, metrics=None):
+        """
+        Parameters
+        ----------
+            max_repos : int
+                maximum number of repository handles kept open.
+            metrics : runmetrics
+                metrics the lookups are timed into. Nothing is recorded if None.
+        """
+        self._max_repos = max_repos
+        self._metrics   = metrics if metrics is not None else gitbundle.runmetrics(False)
+        self._handles   = collections.OrderedDict()
+        self._lock      = threading.Lock()
+        self._refs      = gitbundle.refreader()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def close(self):
+        """
+        Closes all cached repository handles and their cat-file processes.
+        """
+        with self._lock:
+            while self._handles:
+                _, handle = self._handles.popitem(last=False)
+                self.__close_handle(handle)
+
+
+    def find_branch_origin(self, repo_path, branch_name, base_branch:str='') -> str:
         """
         Finds the HASH ID (SHA-1) of the commit from which a specified branch originated.
 
@@ -43,31 +98,59 @@ class gitrepo:
                 Directory path to the repository.
             branch_name : str
                 Branch name to check the origin.
+            base_branch : str
+                Branch name the branch is assumed to be forked from when the reflog doesn't tell.
+                The merge base of the two branches is used as the origin. Not used if empty.
 
         Returns
         ----------
             commit_id_origin : str
                 Commit ID (SHA-1 HASH) of the root origin of the specified branch.
+                'NOORIGIN' if the origin is not found.
 
         Notes
         ----------
             This implementation uses git reflog to determine the origin of 
             a branch and is subject to any limitations of the command.
+            The reflog file is read from the oldest entry and reading stops at the first
+            "branch: Created from" entry.
         """
 
-        repo        = git.Repo(repo_path)
+        with self._metrics.stage('find_branch_origin', repo_path):
+            ref_name = branch_name if branch_name.startswith('refs/') else 'refs/heads/' + branch_name
+            commit_id_origin = 'NOORIGIN'
+
+            try:
+                for entry in self._refs.iter_reflog(repo_path, ref_name):
+                    if entry[2].startswith('branch: Created from'):
+                        commit_id_origin = entry[1]
+                        break
+            except ValueError:
+                commit_id_origin = self.__find_branch_origin_reflog(repo_path, branch_name)
+
+            if (commit_id_origin == 'NOORIGIN') and (base_branch != '') and (base_branch != branch_name):
+                # The reflog has expired or the branch was not created here
+                try:
+                    with self.__repo(repo_path) as repo:
+                        commit_id_origin = repo.git.merge_base(base_branch, branch_name).strip() or 'NOORIGIN'
+                except:
+                    commit_id_origin = 'NOORIGIN'
+
+            return commit_id_origin
+
+
+    def __find_branch_origin_reflog(self, repo_path, branch_name):
+        # Fallback to git reflog for repositories the ref reader can't handle
         try:
-            reflog      = repo.git.reflog(('show','--no-abbrev', branch_name))
-            reflog_list = reflog.split("\n") 
-            for ref in reflog_list:
-                if re.search(r'branch: Created from', ref):
-                    commit_id_origin = ref.split()[0]
-            
-            if not('commit_id_origin' in locals()):
+            with self.__repo(repo_path) as repo:
+                reflog      = repo.git.reflog(('show','--no-abbrev', branch_name))
+                reflog_list = reflog.split("\n") 
                 commit_id_origin = 'NOORIGIN'
+                for ref in reflog_list:
+                    if re.search(r'branch: Created from', ref):
+                        commit_id_origin = ref.split()[0]
         except:
             commit_id_origin = 'NOORIGIN'
-            pass
                  
         return commit_id_origin
         
@@ -88,18 +171,45 @@ class gitrepo:
             exist : bool
                 True if specified branch exists in the repository. False otherwise.
         """
-        
-        repo        = git.Repo(repo_path)
-        
+
+        return self.find_branch_tip(repo_path, branch_name) != ''
+
+
+    def find_branch_tip(self, repo_path:str, branch_name:str) -> str:
+        """
+        Finds the commit ID the specified branch (or tag) points to.
+
+        Parameters
+        ----------
+            repo_path : str
+                Directory path to the repository.
+            branch_name : str
+                Branch name to check. Tags and revision expressions are accepted as well.
+
+        Returns
+        ----------
+            commit_id : str
+                Commit ID (SHA1 HASH). Empty string if the branch doesn't exist.
+        """
+
+        try:
+            commit_id = self._refs.resolve(repo_path, branch_name)
+            if commit_id is not None:
+                return commit_id
+            if not(self.__is_expression(branch_name)):
+                return ''
+        except ValueError:
+            pass
+
         try:
-            repo.rev_parse(branch_name)
-            exist = True
+            with self.__repo(repo_path) as repo:
+                commit_id = repo.rev_parse(branch_name).hexsha
         except:
-            exist = False
+            commit_id = ''
+
+        return commit_id
 
-        return exist
 
-        
     def find_commit_id(self, repo_path:str, commit_id:str) -> bool:
         """
         Finds if specified branch exists in the specified repository.
@@ -117,15 +227,446 @@ class gitrepo:
                 True if specified branch exists in the repository. False otherwise.
         """
         
-        repo        = git.Repo(repo_path)
-        
+        return commit_id in self.find_commit_ids(repo_path, [commit_id])
+
+
+    def is_ancestor(self, repo_path:str, ancestor:str, descendant:str) -> bool:
+        """
+        Checks if a commit is an ancestor of another commit in the specified repository.
+
+        Parameters
+        ----------
+            repo_path : str
+                Directory path to the repository.
+            ancestor : str
+                Commit ID (SHA1 HASH) or branch name of the ancestor candidate.
+            descendant : str
+                Commit ID (SHA1 HASH) or branch name of the descendant.
+
+        Returns
+        ----------
+            is_ancestor : bool
+                True if ancestor is an ancestor of (or the same commit as) descendant.
+                False otherwise, including the case either commit doesn't exist.
+        """
+
+        try:
+            with self.__repo(repo_path) as repo:
+                is_ancestor = repo.is_ancestor(ancestor, descendant)
+        except:
+            is_ancestor = False
+
+        return is_ancestor
+
+
+    def list_refs(self, repo_path:str, patterns:list) -> dict:
+        """
+        Lists refs matching the specified patterns with a single ref listing.
+
+        Parameters
+        ----------
+            repo_path : str
+                Directory path to the repository.
+            patterns : list
+                List of ref patterns (see git for-each-ref), e.g. 'refs/heads/master', 'refs/tags'.
+
+        Returns
+        ----------
+            refs : dict
+                key = ref name, value = Commit ID (SHA1 HASH) the ref points to.
+                Empty if the repository can't be read.
+        """
+
+        with self._metrics.stage('list_refs', repo_path):
+            try:
+                return self._refs.list_refs(repo_path, patterns)
+            except (OSError, ValueError):
+                pass
+
+            refs        = {}
+
+            try:
+                with self.__repo(repo_path) as repo:
+                    for line in repo.git.for_each_ref('--format=%(objectname) %(refname)', *patterns).splitlines():
+                        commit_id, ref_name = line.split(' ', 1)
+                        refs[ref_name] = commit_id
+            except:
+                refs = {}
+
+            return refs
+
+
+    def find_upstreams(self, repo_path:str, branch_names:list) -> dict:
+        """
+        Finds the upstream (remote-tracking) branches of the specified branches, i.e. what git pull merges.
+
+        Parameters
+        ----------
+            repo_path : str
+                Directory path to the repository.
+            branch_names : list
+                Branch names to check.
+
+        Returns
+        ----------
+            upstreams : dict
+                key = branch name, value = ref name of its upstream, e.g. 'refs/remotes/origin/master'.
+                Branches without a remote upstream are left out.
+        """
+        return {branch_name: upstream[1] for branch_name, upstream in self.__upstreams(repo_path, branch_names).items()}
+
+
+    def fetch_upstreams(self, repo_path:str, branch_names:list) -> bool:
+        """
+        Fetches the remotes the specified branches track with a single git fetch,
+        so that their upstream branches (see find_upstreams()) are up to date.
+
+        Parameters
+        ----------
+            repo_path : str
+                Directory path to the repository.
+            branch_names : list
+                Branch names whose upstreams to fetch.
+
+        Returns
+        ----------
+            fetched : bool
+                True if fetched (or if no branch has a remote upstream). False if the fetch failed.
+        """
+
+        with self._metrics.stage('fetch_upstreams', repo_path):
+            remotes = sorted(set(upstream[0] for upstream in self.__upstreams(repo_path, branch_names).values()))
+            if remotes == []:
+                return True
+
+            try:
+                with self.__repo(repo_path) as repo:
+                    repo.git.fetch('--quiet', '--multiple', *remotes)
+                    fetched = True
+            except:
+                fetched = False
+
+            return fetched
+
+
+    def find_commit_ids(self, repo_path:str, commit_ids:list) -> set:
+        """
+        Finds which of the specified commits exist in the specified repository.
+        All commits are looked up through the persistent git cat-file process of the repository.
+
+        Parameters
+        ----------
+            repo_path : str
+                Directory path to the repository.
+            commit_ids : list
+                Commit IDs (SHA1 HASH) to check.
+
+        Returns
+        ----------
+            existing : set
+                Commit IDs found in the repository.
+        """
+
+        with self._metrics.stage('find_commit_ids', repo_path):
+            existing    = set()
+            if commit_ids == []:
+                return existing
+
+            try:
+                with self.__use(repo_path) as handle, handle['catfile_lock']:
+                    if (handle['catfile'] is None) or (handle['catfile'].poll() is not None):
+                        handle['catfile'] = subprocess.Popen(['git', '-C', repo_path, 'cat-file', '--batch-check'],
+                                                             stdin=subprocess.PIPE, stdout=subprocess.PIPE, 
+                                                             stderr=subprocess.DEVNULL)
+                    catfile = handle['catfile']
+
+                    for i in range(0, len(commit_ids), self.CATFILE_CHUNK):
+                        chunk = commit_ids[i:i + self.CATFILE_CHUNK]
+                        catfile.stdin.write(''.join(commit_id + '\n' for commit_id in chunk).encode())
+                        catfile.stdin.flush()
+                        for commit_id in chunk:
+                            fields = catfile.stdout.readline().decode().split()
+                            if fields == []:
+                                raise OSError('cat-file terminated unexpectedly')
+                            if fields[-1] != 'missing':
+                                existing.add(commit_id)
+            except OSError:
+                existing = set()
+
+            return existing
+
+
+    def is_merged(self, repo_path:str, commit_ids:list, branch_name:str) -> bool:
+        """
+        Checks if all the specified commits are reachable from the specified branch.
+
+        Parameters
+        ----------
+            repo_path : str
+                Directory path to the repository.
+            commit_ids : list
+                Commit IDs (SHA1 HASH) to check.
+            branch_name : str
+                Branch name to check.
+
+        Returns
+        ----------
+            merged : bool
+                True if the branch exists and contains every commit. False otherwise.
+        """
+
+        with self._metrics.stage('is_merged', repo_path):
+            try:
+                with self.__repo(repo_path) as repo:
+                    merged      = (repo.git.rev_list('-n', '1', *commit_ids, '^refs/heads/' + branch_name, '--') == '')
+            except:
+                merged = False
+
+            return merged
+
+
+    def find_worktrees(self, repo_path:str) -> dict:
+        """
+        Finds the branches checked out in the working trees of the specified repository.
+
+        Parameters
+        ----------
+            repo_path : str
+                Directory path to the repository.
+
+        Returns
+        ----------
+            worktrees : dict
+                key = branch name, value = directory path to the working tree the branch is checked out in.
+        """
+        worktrees   = {}
+
         try:
-            repo.rev_parse(commit_id)
-            exist = True
+            with self.__repo(repo_path) as repo:
+                worktree    = ''
+                for line in repo.git.worktree('list', '--porcelain').splitlines():
+                    if line.startswith('worktree '):
+                        worktree = line[len('worktree '):]
+                    elif line.startswith('branch refs/heads/'):
+                        worktrees[line[len('branch refs/heads/'):]] = worktree
         except:
-            exist = False
+            worktrees = {}
+
+        return worktrees
+
+
+    def count_objects(self, repo_path:str) -> int:
+        """
+        Counts the objects (loose and packed) in the specified repository.
+
+        Parameters
+        ----------
+            repo_path : str
+                Directory path to the repository.
+
+        Returns
+        ----------
+            object_count : int
+                Number of objects. -1 if the repository can't be read.
+        """
+
+        with self._metrics.stage('count_objects', repo_path):
+            try:
+                with self.__repo(repo_path) as repo:
+                    counts       = dict(line.split(': ', 1) for line in repo.git.count_objects('-v').splitlines())
+                    object_count = int(counts['count']) + int(counts['in-pack'])
+            except:
+                object_count = -1
+
+            return object_count
+
+
+    def find_maintenance(self, repo_path:str) -> dict:
+        """
+        Finds how far the reachability bitmap and the commit-graph of the specified repository
+        lag behind, from the files in its object directory.
+
+        Parameters
+        ----------
+            repo_path : str
+                Directory path to the repository.
+
+        Returns
+        ----------
+            maintenance : dict
+                key = 'bitmap' (mtime of the newest pack bitmap, 0 if none),
+                      'objects' (number of objects outside the bitmapped pack, i.e. added since the bitmap was written),
+                      'commit_graph' (mtime of the commit-graph, 0 if none),
+                      'refs' (number of branches, remote-tracking branches and tags updated since the commit-graph was written)
+                None if the repository can't be read.
+        """
+
+        with self._metrics.stage('find_maintenance', repo_path):
+            try:
+                object_dir = os.path.join(self._refs.get_common_dir(repo_path), 'objects')
+            except (OSError, ValueError):
+                return None
+
+            maintenance = {'bitmap': 0, 'objects': 0, 'commit_graph': 0, 'refs': 0}
+            bitmapped   = 0
+
+            # repack -a -d --write-bitmap-index puts every object into the bitmapped pack
+            for bitmap_file in glob.glob(os.path.join(glob.escape(object_dir), 'pack', 'pack-*.bitmap')):
+                try:
+                    mtime = os.stat(bitmap_file).st_mtime
+                    if mtime > maintenance['bitmap']:
+                        bitmapped             = self.__count_pack_objects(bitmap_file[:-len('.bitmap')] + '.idx')
+                        maintenance['bitmap'] = mtime
+                except (OSError, ValueError):
+                    pass
+
+            object_count = self.count_objects(repo_path)
+            if object_count < 0:
+                return None
+            maintenance['objects'] = max(0, object_count - bitmapped)
+
+            for graph_file in [os.path.join(object_dir, 'info', 'commit-graph'),
+                               os.path.join(object_dir, 'info', 'commit-graphs', 'commit-graph-chain')]:
+                if os.path.isfile(graph_file):
+                    maintenance['commit_graph'] = max(maintenance['commit_graph'], os.stat(graph_file).st_mtime)
+
+            if maintenance['commit_graph'] > 0:
+                try:
+                    maintenance['refs'] = self._refs.count_updated(repo_path, ['refs/heads', 'refs/remotes', 'refs/tags'],
+                                                                   maintenance['commit_graph'])
+                except ValueError:
+                    return None
+
+            return maintenance
+
+
+    def estimate_bundle(self, repo_path:str, rev_args:list) -> dict:
+        """
+        Estimates the content of a bundle from the objects reachable by its revision arguments.
+
+        Parameters
+        ----------
+            repo_path : str
+                Directory path to the repository.
+            rev_args : list
+                Revision arguments and options given to git bundle create (see git rev-list),
+                e.g. ['--tags', 'master'] or ['<tip>..master'].
+
+        Returns
+        ----------
+            estimate : dict
+                key = 'objects' (number of objects), 'bytes' (their size on disk).
+                A value is -1 if it can't be estimated.
+
+        Notes
+        ----------
+            The size on disk of the objects is an upper bound of the pack size in the bundle
+            rather than its exact size, as objects are delta-compressed again on bundle creation.
+        """
+
+        with self._metrics.stage('estimate_bundle', repo_path):
+            estimate    = {'objects': -1, 'bytes': -1}
+
+            try:
+                with self.__repo(repo_path) as repo:
+                    estimate['objects'] = int(repo.git.rev_list('--objects', '--count', *rev_args, '--'))
+                    # --disk-usage needs git 2.31 or later
+                    estimate['bytes']   = int(repo.git.rev_list('--objects', '--disk-usage', *rev_args, '--'))
+            except:
+                pass
+
+            return estimate
+
+
+    def __upstreams(self, repo_path, branch_names):
+        # (remote name, upstream ref name) of every branch tracking a remote branch, from a single ref listing
+        upstreams   = {}
+
+        try:
+            with self.__repo(repo_path) as repo:
+                for line in repo.git.for_each_ref('--format=%(refname) %(upstream:remotename) %(upstream)',
+                                                  *['refs/heads/' + branch_name for branch_name in branch_names]).splitlines():
+                    fields = line.split(' ')
+                    if (len(fields) == 3) and fields[2].startswith('refs/remotes/'):
+                        upstreams[fields[0][len('refs/heads/'):]] = (fields[1], fields[2])
+        except:
+            upstreams = {}
+
+        return upstreams
+
+
+    def __count_pack_objects(self, idx_file):
+        # Number of objects of a pack from the last fanout entry of its index (version 1 or 2)
+        with open(idx_file, 'rb') as frb:
+            header = frb.read(8)
+            offset = 8 + 255 * 4 if header[:4] == b'\377tOc' else 255 * 4
+            frb.seek(offset)
+            fanout = frb.read(4)
+
+        if len(fanout) != 4:
+            raise ValueError('Broken pack index. path={0}'.format(idx_file))
+
+        return struct.unpack('>I', fanout)[0]
+
+
+    def __is_expression(self, name):
+        # Revision expressions and (abbreviated) object names need git to resolve
+        return (re.search(r'[~^:@{}*?\[\\\s]', name) is not None) or (re.fullmatch(r'[0-9a-fA-F]{4,64}', name) is not None)
+
+
+    @contextlib.contextmanager
+    def __repo(self, repo_path):
+        # GitPython repository of a handle, opened on first use: with self.__repo(repo_path) as repo: ...
+        with self.__use(repo_path) as handle:
+            with handle['repo_lock']:
+                if handle['repo'] is None:
+                    import git
+                    handle['repo'] = git.Repo(repo_path)
+
+            yield handle['repo']
+
+
+    @contextlib.contextmanager
+    def __use(self, repo_path):
+        # Pins the handle of a repository while in use, so that it isn't closed under the caller
+        handle = self.__handle(repo_path)
+        try:
+            yield handle
+        finally:
+            with self._lock:
+                handle['users'] -= 1
+                self.__evict()
+
+
+    def __handle(self, repo_path):
+        with self._lock:
+            if repo_path in self._handles:
+                self._handles.move_to_end(repo_path)
+            else:
+                self._handles[repo_path] = {'repo': None, 'repo_lock': threading.Lock(),
+                                            'catfile': None, 'catfile_lock': threading.Lock(), 'users': 0}
+            handle = self._handles[repo_path]
+            handle['users'] += 1
+            self.__evict()
+
+        return handle
+
 
-        return exist
+    def __evict(self):
+        # Closes the least recently used handles not in use, down to max_repos. Called with the lock held.
+        idle = [repo_path for repo_path, handle in self._handles.items() if handle['users'] == 0]
+        for repo_path in idle[:max(0, len(self._handles) - self._max_repos)]:
+            self.__close_handle(self._handles.pop(repo_path))
 
 
+    def __close_handle(self, handle):
+        if handle['catfile'] is not None:
+            with handle['catfile_lock']:
+                handle['catfile'].stdin.close()
+                handle['catfile'].wait()
+                handle['catfile'].stdout.close()
+                handle['catfile'] = None
 
+        if handle['repo'] is not None:
+            handle['repo'].close()
+            handle['repo'] = None
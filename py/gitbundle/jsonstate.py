@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+#
+# gitbundle/jsonstate.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# ======================================================================================
+# Copyright (c) 2021 Makoto Maeda
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense,and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# ======================================================================================
+
+
+import json
+import os
+import tempfile
+
+class jsonstate:
+    """
+    JSON state file module.
+
+    Reads and writes the json files state is kept in between runs (e.g. tip ledger, ref snapshot,
+    caches). A missing or broken file reads as empty, so that the state is rebuilt from scratch.
+    The file is written atomically: into a temporary file next to it, which then replaces it,
+    so that an interrupted run never leaves a truncated file behind.
+    """
+
+    def __init__(self, state_file:str):
+        """
+        Parameters
+        ----------
+            state_file : str
+                path to the state file.
+        """
+        self._state_file = state_file
+
+
+    def load(self) -> dict:
+        """
+        Reads the state file.
+
+        Returns
+        ----------
+            state : dict
+                content of the state file. Empty if the file doesn't exist or is broken.
+        """
+        if not(os.path.isfile(self._state_file)):
+            return {}
+
+        try:
+            with open(self._state_file, 'r') as fr:
+                state = json.load(fr)
+        except (OSError, ValueError):
+            return {}
+
+        return state if isinstance(state, dict) else {}
+
+
+    def save(self, state:dict):
+        """
+        Writes the state file atomically. The directory is created if it doesn't exist.
+
+        Parameters
+        ----------
+            state : dict
+                content to write.
+        """
+        state_dir = os.path.dirname(self._state_file)
+        if state_dir and not(os.path.isdir(state_dir)):
+            os.makedirs(state_dir, exist_ok=True)
+
+        fd, temp_file = tempfile.mkstemp(prefix=os.path.basename(self._state_file) + '.', suffix='.tmp',
+                                         dir=state_dir or '.')
+        try:
+            with os.fdopen(fd, 'w') as fw:
+                json.dump(state, fw, indent=1)
+            os.replace(temp_file, self._state_file)
+        except:
+            os.remove(temp_file)
+            raise
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+#
+# gitbundle/origincache.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# ======================================================================================
+# Copyright (c) 2021 Makoto Maeda
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense,and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# ======================================================================================
+
+
+import gitbundle
+
+class origincache:
+    """
+    Branch origin cache module.
+
+    Keeps the resolved branch origin (see gitrepo.find_branch_origin()) of each repository
+    and branch in a json state file, so that it is resolved only once.
+    Branches without a known origin ('NOORIGIN') are not cached and resolved again next time.
+
+    The cache stands in for the reflog once it has expired, and for the merge base with
+    "origin_base". The caller reads the reflog first (see gitbundlemng.plan_export()), as a
+    branch deleted and created again from another point keeps its name.
+    """
+
+    def __init__(self, cache_file:str):
+        """
+        Parameters
+        ----------
+            cache_file : str
+                path to the cache file. The cache starts empty if the file doesn't exist.
+        """
+        # A broken cache reads as empty. The origins are resolved again.
+        self._store      = gitbundle.jsonstate(cache_file)
+        self._cache      = self._store.load()
+        self._modified   = False
+
+
+    def get_origin(self, repo_path:str, branch_name:str) -> str:
+        """
+        Retrieves the cached origin of the specified repository and branch.
+
+        Returns
+        ----------
+            commit_id_origin : str
+                Commit ID (SHA-1 HASH) of the branch origin. Empty string if not cached.
+        """
+        return self._cache.get(repo_path, {}).get(branch_name, '')
+
+
+    def record(self, repo_path:str, branch_name:str, commit_id_origin:str):
+        """
+        Records the origin of the specified repository and branch.
+        'NOORIGIN' is not recorded, and drops the origin cached before.
+        """
+        if commit_id_origin == 'NOORIGIN':
+            if self.get_origin(repo_path, branch_name) != '':
+                del self._cache[repo_path][branch_name]
+                self._modified = True
+            return
+
+        if self.get_origin(repo_path, branch_name) == commit_id_origin:
+            return
+
+        self._cache.setdefault(repo_path, {})[branch_name] = commit_id_origin
+        self._modified = True
+
+
+    def save(self):
+        """
+        Writes the cache back to the cache file if modified.
+        """
+        if not(self._modified):
+            return
+
+        self._store.save(self._cache)
+        self._modified = False
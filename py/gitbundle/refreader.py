@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+#
+# gitbundle/refreader.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# ======================================================================================
+# Copyright (c) 2021 Makoto Maeda
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense,and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# ======================================================================================
+
+
+import fnmatch
+import os
+import threading
+
+class refreader:
+    """
+    Ref reader module.
+
+    Reads branches and tags directly from the loose refs and the packed-refs file of a
+    repository without running git or loading GitPython.
+    The parsed packed-refs file is cached and re-read only when its mtime or size changes.
+
+    Only plain ref names are resolved. Revision expressions (e.g. 'master~1') and repositories
+    using the reftable backend are left to git (ValueError is raised for the latter).
+    """
+
+    # Ref name candidates tried in order for a short name (see git rev-parse)
+    REF_RULES = ['{0}', 'refs/{0}', 'refs/tags/{0}', 'refs/heads/{0}', 'refs/remotes/{0}', 'refs/remotes/{0}/HEAD']
+
+    def __init__(self):
+        self._git_dirs    = {}
+        self._packed_refs = {}
+        self._lock        = threading.Lock()
+
+
+    def resolve(self, repo_path:str, ref_name:str) -> str:
+        """
+        Resolves a ref name into the commit ID it points to.
+
+        Parameters
+        ----------
+            repo_path : str
+                Directory path to the repository.
+            ref_name : str
+                Full ref name (e.g. 'refs/heads/master') or short name (e.g. 'master', 'v1.0', 'origin/master').
+
+        Returns
+        ----------
+            commit_id : str
+                Commit ID (SHA1 HASH) the ref points to. None if the ref doesn't exist.
+
+        Raises
+        ----------
+            ValueError
+                if the repository can't be read natively.
+        """
+        git_dir, common_dir = self.__git_dir(repo_path)
+
+        for rule in self.REF_RULES:
+            commit_id = self.__read_ref(git_dir, common_dir, rule.format(ref_name), 0)
+            if commit_id is not None:
+                return commit_id
+
+        return None
+
+
+    def list_refs(self, repo_path:str, patterns:list) -> dict:
+        """
+        Lists refs matching the specified patterns.
+
+        Parameters
+        ----------
+            repo_path : str
+                Directory path to the repository.
+            patterns : list
+                List of ref patterns matched as git for-each-ref does, i.e. either by fnmatch
+                or literally up to a slash (e.g. 'refs/heads/master', 'refs/remotes/*/master', 'refs/tags').
+
+        Returns
+        ----------
+            refs : dict
+                key = ref name, value = Commit ID (SHA1 HASH) the ref points to.
+
+        Raises
+        ----------
+            ValueError
+                if the repository can't be read natively.
+        """
+        git_dir, common_dir = self.__git_dir(repo_path)
+
+        refs = dict(self.__packed_refs(common_dir))
+
+        refs_dir = os.path.join(common_dir, 'refs')
+        for dir_path, _, file_names in os.walk(refs_dir):
+            for file_name in file_names:
+                ref_name = os.path.relpath(os.path.join(dir_path, file_name), common_dir).replace(os.sep, '/')
+                commit_id = self.__read_ref(git_dir, common_dir, ref_name, 0)
+                if commit_id is not None:
+                    refs[ref_name] = commit_id
+
+        return {ref_name: commit_id for ref_name, commit_id in refs.items()
+                if any(self.__match(ref_name, pattern) for pattern in patterns)}
+
+
+    def count_updated(self, repo_path:str, patterns:list, since:float) -> int:
+        """
+        Counts the refs updated after the specified time from the mtimes of the ref files.
+        Refs are not read. An updated packed-refs file counts as one ref.
+
+        Parameters
+        ----------
+            repo_path : str
+                Directory path to the repository.
+            patterns : list
+                List of ref directories to check, e.g. 'refs/heads', 'refs/tags'.
+            since : float
+                time in seconds since the epoch (see os.stat()).
+
+        Returns
+        ----------
+            count : int
+                number of ref files modified after since.
+
+        Raises
+        ----------
+            ValueError
+                if the repository can't be read natively.
+        """
+        _, common_dir = self.__git_dir(repo_path)
+
+        count = 0
+        try:
+            if os.stat(os.path.join(common_dir, 'packed-refs')).st_mtime > since:
+                count += 1
+        except OSError:
+            pass
+
+        for pattern in patterns:
+            for dir_path, _, file_names in os.walk(os.path.join(common_dir, *pattern.split('/'))):
+                for file_name in file_names:
+                    try:
+                        if os.stat(os.path.join(dir_path, file_name)).st_mtime > since:
+                            count += 1
+                    except OSError:
+                        pass
+
+        return count
+
+
+    def get_common_dir(self, repo_path:str) -> str:
+        """
+        Retrieves the directory holding the refs and objects of a repository, shared by its worktrees.
+
+        Raises
+        ----------
+            ValueError
+                if the repository can't be read natively.
+        """
+        return self.__git_dir(repo_path)[1]
+
+
+    def iter_reflog(self, repo_path:str, ref_name:str):
+        """
+        Iterates over the reflog entries of a ref from the oldest to the most recent.
+        The reflog file is read lazily, so the caller can stop as soon as it finds what it needs.
+
+        Parameters
+        ----------
+            repo_path : str
+                Directory path to the repository.
+            ref_name : str
+                Full ref name (e.g. 'refs/heads/master').
+
+        Returns
+        ----------
+            entries : generator
+                yields [old commit id, new commit id, message] per entry. Nothing if there is no reflog.
+
+        Raises
+        ----------
+            ValueError
+                if the repository can't be read natively.
+        """
+        git_dir, common_dir = self.__git_dir(repo_path)
+
+        log_dir = common_dir if ref_name.startswith('refs/') else git_dir
+        try:
+            frb = open(os.path.join(log_dir, 'logs', *ref_name.split('/')), 'rb')
+        except OSError:
+            return
+
+        with frb:
+            for line in frb:
+                entry, _, message = line.decode('utf-8', errors='replace').rstrip('\n').partition('\t')
+                fields = entry.split(' ', 2)
+                if len(fields) == 3:
+                    yield [fields[0], fields[1], message]
+
+
+    def __match(self, ref_name, pattern):
+        if fnmatch.fnmatchcase(ref_name, pattern):
+            return True
+
+        pattern = pattern.rstrip('/')
+        return (ref_name == pattern) or ref_name.startswith(pattern + '/')
+
+
+    def __git_dir(self, repo_path):
+        # Returns (git dir, common dir) of a repository. Worktrees share the refs of the common dir.
+        if repo_path in self._git_dirs:
+            return self._git_dirs[repo_path]
+
+        dot_git = os.path.join(repo_path, '.git')
+        if os.path.isdir(dot_git):
+            git_dir = dot_git
+        elif os.path.isfile(dot_git):
+            with open(dot_git, 'r') as fr:
+                content = fr.read().strip()
+            if not(content.startswith('gitdir:')):
+                raise ValueError('Illegal .git file. path={0}'.format(dot_git))
+            git_dir = os.path.join(repo_path, content[len('gitdir:'):].strip())
+        elif os.path.isfile(os.path.join(repo_path, 'HEAD')) and os.path.isdir(os.path.join(repo_path, 'objects')):
+            # bare repository
+            git_dir = repo_path
+        else:
+            raise ValueError('Not a git repository. path={0}'.format(repo_path))
+
+        common_dir = git_dir
+        if os.path.isfile(os.path.join(git_dir, 'commondir')):
+            with open(os.path.join(git_dir, 'commondir'), 'r') as fr:
+                common_dir = os.path.join(git_dir, fr.read().strip())
+
+        if os.path.isdir(os.path.join(common_dir, 'reftable')):
+            raise ValueError('reftable is not supported. path={0}'.format(repo_path))
+
+        self._git_dirs[repo_path] = (os.path.normpath(git_dir), os.path.normpath(common_dir))
+        return self._git_dirs[repo_path]
+
+
+    def __read_ref(self, git_dir, common_dir, ref_name, depth):
+        if depth > 5:
+            return None
+
+        # Pseudo refs like HEAD live in the git dir (of the worktree), the others in the common dir
+        ref_dir = common_dir if ref_name.startswith('refs/') else git_dir
+        try:
+            with open(os.path.join(ref_dir, *ref_name.split('/')), 'r') as fr:
+                content = fr.readline().strip()
+        except (OSError, UnicodeDecodeError):
+            return self.__packed_refs(common_dir).get(ref_name)
+
+        if content.startswith('ref:'):
+            return self.__read_ref(git_dir, common_dir, content[len('ref:'):].strip(), depth + 1)
+        elif len(content) in (40, 64):
+            return content
+
+        return None
+
+
+    def __packed_refs(self, common_dir):
+        packed_refs_file = os.path.join(common_dir, 'packed-refs')
+        try:
+            stat = os.stat(packed_refs_file)
+        except OSError:
+            return {}
+
+        with self._lock:
+            cached = self._packed_refs.get(common_dir)
+            if (cached is not None) and (cached[0] == (stat.st_mtime_ns, stat.st_size)):
+                return cached[1]
+
+        refs = {}
+        with open(packed_refs_file, 'r') as fr:
+            for line in fr:
+                if line.startswith('#') or line.startswith('^'):
+                    # header and peeled tag lines
+                    continue
+                fields = line.split()
+                if len(fields) == 2:
+                    refs[fields[1]] = fields[0]
+
+        with self._lock:
+            self._packed_refs[common_dir] = ((stat.st_mtime_ns, stat.st_size), refs)
+
+        return refs
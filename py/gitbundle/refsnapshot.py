@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#
+# gitbundle/refsnapshot.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# ======================================================================================
+# Copyright (c) 2021 Makoto Maeda
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense,and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# ======================================================================================
+
+
+import gitbundle
+
+class refsnapshot:
+    """
+    Ref snapshot module.
+
+    Keeps the refs (ref name and commit ID) of every configured repository as of the
+    previous export in a json state file, so that repositories whose refs haven't moved
+    since can be skipped. The name of the bundle file of that export is kept with them.
+    """
+
+    def __init__(self, snapshot_file:str):
+        """
+        Parameters
+        ----------
+            snapshot_file : str
+                path to the snapshot file. The snapshot starts empty if the file doesn't exist.
+        """
+        # A broken snapshot reads as empty. Every repository is treated as changed.
+        self._store         = gitbundle.jsonstate(snapshot_file)
+        self._snapshot      = self._store.load()
+        self._modified      = False
+
+
+    def is_unchanged(self, cfg_name:str, refs:dict) -> bool:
+        """
+        Checks if the refs of a repository are identical to the previous snapshot.
+
+        Parameters
+        ----------
+            cfg_name : str
+                name of the repository configuration
+            refs : dict
+                current refs of the repository. key = ref name, value = commit id
+
+        Returns
+        ----------
+            unchanged : bool
+                True if a previous snapshot exists and is identical to refs.
+        """
+        return (cfg_name in self._snapshot) and (self._snapshot[cfg_name]['refs'] == refs)
+
+
+    def get_file_name(self, cfg_name:str) -> str:
+        """
+        Retrieves the name of the bundle file of the previous export of a repository.
+
+        Returns
+        ----------
+            file_name : str
+                bundle file name. Empty string if not recorded.
+        """
+        if cfg_name not in self._snapshot:
+            return ''
+
+        return self._snapshot[cfg_name]['file_name']
+
+
+    def update(self, cfg_name:str, refs:dict, file_name:str=None):
+        """
+        Replaces the snapshot of a repository.
+
+        Parameters
+        ----------
+            cfg_name : str
+                name of the repository configuration
+            refs : dict
+                current refs of the repository. key = ref name, value = commit id
+            file_name : str
+                name of the bundle file exporting the refs. The recorded name is kept if None.
+        """
+        if file_name is None:
+            file_name = self.get_file_name(cfg_name)
+
+        entry = {'refs': refs, 'file_name': file_name}
+        if (cfg_name not in self._snapshot) or (self._snapshot[cfg_name] != entry):
+            self._snapshot[cfg_name] = entry
+            self._modified = True
+
+
+    def save(self):
+        """
+        Writes the snapshot back to the snapshot file if modified.
+        """
+        if not(self._modified):
+            return
+
+        self._store.save(self._snapshot)
+        self._modified = False
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+# gitbundle/repodiscovery.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# ======================================================================================
+# Copyright (c) 2021 Makoto Maeda
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense,and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# ======================================================================================
+
+
+import concurrent.futures
+import gitbundle
+import os
+
+class repodiscovery:
+    """
+    Repository discovery module.
+
+    Finds the git repositories (working trees and bare repositories) under a root directory.
+    Directories are scanned concurrently. The walk stops at each repository found, so neither
+    the .git directory nor the object store of a repository is ever listed.
+
+    The repositories found under each root are kept in a json cache file together with the
+    mtimes of the root and of its top-level directories. A root is walked again only when one
+    of these mtimes has changed, i.e. when a top-level directory has been added, removed or
+    renamed, or an entry directly inside one of them has. Remove the cache file to force a walk.
+    """
+
+    def __init__(self, cache_file:str='', workers:int=8):
+        """
+        Parameters
+        ----------
+            cache_file : str
+                path to the cache file. Nothing is cached if empty.
+            workers : int
+                maximum number of directories scanned concurrently.
+        """
+        # A broken cache reads as empty. The roots are walked again.
+        self._store      = gitbundle.jsonstate(cache_file) if cache_file else None
+        self._workers    = max(1, workers)
+        self._cache      = self._store.load() if cache_file else {}
+        self._modified   = False
+
+
+    def discover(self, root_dir:str) -> list:
+        """
+        Finds the git repositories under a root directory.
+
+        Parameters
+        ----------
+            root_dir : str
+                directory to search. The root directory itself is not reported.
+
+        Returns
+        ----------
+            repositories : list
+                paths of the repositories relative to root_dir with '/' as separator, sorted.
+                Empty if root_dir doesn't exist.
+        """
+        mtimes = self.__top_mtimes(root_dir)
+        cached = self._cache.get(root_dir)
+        if (cached is not None) and (cached['mtimes'] == mtimes):
+            return cached['repositories']
+
+        repositories = sorted(self.__walk(root_dir))
+
+        self._cache[root_dir] = {'mtimes': mtimes, 'repositories': repositories}
+        self._modified = True
+
+        return repositories
+
+
+    def save(self):
+        """
+        Writes the cache back to the cache file if modified.
+        """
+        if (self._store is None) or not(self._modified):
+            return
+
+        self._store.save(self._cache)
+        self._modified = False
+
+
+    def __top_mtimes(self, root_dir):
+        # mtimes of the root ('') and of its top-level directories
+        try:
+            mtimes = {'': os.stat(root_dir).st_mtime}
+            with os.scandir(root_dir) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False) and (entry.name != '.git'):
+                        mtimes[entry.name] = entry.stat(follow_symlinks=False).st_mtime
+        except OSError:
+            mtimes = {}
+
+        return mtimes
+
+
+    def __walk(self, root_dir):
+        repositories = []
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self._workers) as executor:
+            pending = {executor.submit(self.__scan, root_dir, '')}
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    for rel_path, is_repository in future.result():
+                        if is_repository:
+                            repositories.append(rel_path)
+                        else:
+                            pending.add(executor.submit(self.__scan, root_dir, rel_path))
+
+        return repositories
+
+
+    def __scan(self, root_dir, rel_path):
+        # Lists the subdirectories of a directory relative to root_dir as (path, is repository).
+        # Symbolic links are not followed.
+        sub_dirs = []
+        try:
+            with os.scandir(os.path.join(root_dir, rel_path)) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False) and (entry.name != '.git'):
+                        sub_dirs.append((entry.name if rel_path == '' else rel_path + '/' + entry.name,
+                                         self.__is_repository(entry.path)))
+        except OSError:
+            pass
+
+        return sub_dirs
+
+
+    def __is_repository(self, dir_path):
+        # A working tree has a .git directory (or a .git file for linked worktrees and submodules).
+        # A bare repository has HEAD, objects and refs.
+        if os.path.exists(os.path.join(dir_path, '.git')):
+            return True
+
+        return (os.path.isfile(os.path.join(dir_path, 'HEAD')) and os.path.isdir(os.path.join(dir_path, 'objects'))
+                and os.path.isdir(os.path.join(dir_path, 'refs')))
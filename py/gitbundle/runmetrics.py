@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+#
+# gitbundle/runmetrics.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# ======================================================================================
+# Copyright (c) 2021 Makoto Maeda
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense,and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# ======================================================================================
+
+
+
+import contextlib
+import datetime
+import json
+import os
+import threading
+import time
+
+class runmetrics:
+    """
+    Run metrics module.
+
+    Collects the metrics of an export or import run: the time spent in each stage 
+    (in total and per repository), the duration of every git command, the bytes of the
+    bundles written or read and counters (e.g. bundles imported or skipped).
+    The metrics are written to a json file per run.
+
+    All methods are thread safe. A disabled instance records nothing.
+    """
+
+    def __init__(self, enabled:bool=True):
+        """
+        Parameters
+        ----------
+            enabled : bool
+                False to record nothing.
+        """
+        self._enabled = enabled
+        self._lock    = threading.Lock()
+        self.reset()
+
+
+    def reset(self, mode:str=''):
+        """
+        Clears the metrics at the beginning of a run.
+
+        Parameters
+        ----------
+            mode : str
+                name of the run (e.g. 'export', 'import'), recorded in the metrics and their file name.
+        """
+        with self._lock:
+            self._mode     = mode
+            # Same time zone as the bundle file names (see gitbundlemng.make_bundlename())
+            self._started  = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9)))
+            self._clock    = time.perf_counter()
+            self._stages   = {}
+            self._commands = []
+            self._counters = {}
+            self._bundles  = {}
+
+
+    @contextlib.contextmanager
+    def stage(self, name:str, repository:str=''):
+        """
+        Times the enclosed block as a stage: with metrics.stage('fetch', repository): ...
+
+        Parameters
+        ----------
+            name : str
+                name of the stage
+            repository : str
+                directory path to the repository the stage works on. Empty if none.
+        """
+        if not(self._enabled):
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                stage = self._stages.setdefault(name, {'count': 0, 'seconds': 0.0, 'repositories': {}})
+                stage['count']   += 1
+                stage['seconds'] += seconds
+                if repository:
+                    stage['repositories'][repository] = stage['repositories'].get(repository, 0.0) + seconds
+
+
+    def record_command(self, repository:str, command:list, returncode:int, seconds:float):
+        """
+        Records a git command run.
+
+        Parameters
+        ----------
+            repository : str
+                directory path to the repository
+            command : list
+                git command argument list
+            returncode : int
+                exit status of the command
+            seconds : float
+                duration of the command
+        """
+        if not(self._enabled):
+            return
+
+        with self._lock:
+            self._commands.append({'repository': repository, 'command': ' '.join(command),
+                                   'returncode': returncode, 'seconds': seconds})
+
+
+    def count(self, name:str, value:int=1):
+        """
+        Adds value to a counter, e.g. 'bundles_imported'.
+        """
+        if not(self._enabled):
+            return
+
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+
+    def record_bundle(self, file_name:str, key:str, value:int):
+        """
+        Records a value of a bundle, e.g. record_bundle(file_name, 'bytes_written', size).
+        """
+        if not(self._enabled):
+            return
+
+        with self._lock:
+            self._bundles.setdefault(file_name, {})[key] = value
+
+
+    def to_dict(self) -> dict:
+        """
+        Returns the metrics collected since reset().
+
+        Returns
+        ----------
+            metrics : dict
+                key = 'mode', 'started' (yyyymmddHHMMSS), 'seconds' (since reset()),
+                      'stages' (key = stage name, value = dictionary with key = 'count', 'seconds',
+                                'repositories' (key = repository, value = seconds)),
+                      'commands' (list of dictionary with key = 'repository', 'command', 'returncode', 'seconds'),
+                      'counters' (key = counter name, value = count),
+                      'bundles' (key = bundle file name, value = dictionary of the recorded values)
+        """
+        with self._lock:
+            return {
+                'mode'     : self._mode,
+                'started'  : self._started.strftime('%Y%m%d%H%M%S'),
+                'seconds'  : time.perf_counter() - self._clock,
+                'stages'   : json.loads(json.dumps(self._stages)),
+                'commands' : list(self._commands),
+                'counters' : dict(self._counters),
+                'bundles'  : json.loads(json.dumps(self._bundles))
+            }
+
+
+    def save(self, metrics_dir:str) -> str:
+        """
+        Writes the metrics to metrics_<mode>_<started>.json in a directory.
+
+        Returns
+        ----------
+            metrics_file : str
+                File path to the metrics file. Empty if disabled.
+        """
+        if not(self._enabled):
+            return ''
+
+        if not(os.path.isdir(metrics_dir)):
+            os.makedirs(metrics_dir, exist_ok=True)
+
+        metrics      = self.to_dict()
+        metrics_file = os.path.join(metrics_dir, 'metrics_{0}_{1}.json'.format(metrics['mode'], metrics['started']))
+        with open(metrics_file, 'w') as fw:
+            json.dump(metrics, fw, indent=1)
+
+        return metrics_file
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+#
+# gitbundle/scriptemitter.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# ======================================================================================
+# Copyright (c) 2021 Makoto Maeda
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense,and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# ======================================================================================
+
+
+
+import abc
+import os
+import re
+import shlex
+
+class scriptemitter(abc.ABC):
+    """
+    Script emitter module.
+
+    Base class of the emitters writing the git commands planned by gitbundlemng into a script.
+    The commands of a repository are written as one unit, and units are written in order,
+    each followed by comments for the repositories or bundles left out.
+
+    With timing enabled, the script appends a line per git command to a timing log:
+    <repository> <command index> <git command> <timing> <exit status>
+    where <timing> depends on the script syntax (see batemitter and shemitter).
+
+    Subclasses implement the script syntax (see batemitter and shemitter).
+    """
+
+    EXTENSION = ''
+
+    def __init__(self, git_path:str, jobs:int=1, timing:bool=False):
+        """
+        Parameters
+        ----------
+            git_path : str
+                directory path to git, prepended to PATH by the script.
+            jobs : int
+                maximum number of units run concurrently, if supported by the script syntax.
+            timing : bool
+                True to record the duration of every command in a timing log.
+        """
+        self._git_path = git_path
+        self._jobs     = max(1, jobs)
+        self._timing   = timing
+        self._fw       = None
+        self._units    = []
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def open(self, script_dir:str, script_name:str) -> str:
+        """
+        Creates the script and writes its header.
+
+        Parameters
+        ----------
+            script_dir : str
+                directory to write the script to.
+            script_name : str
+                file name of the script without extension.
+
+        Returns
+        ----------
+            script_file : str
+                File path to the script.
+        """
+        script_file       = '{0}/{1}.{2}'.format(script_dir, script_name, self.EXTENSION)
+        self._script_name = script_name
+        self._units       = []
+        self._fw          = open(script_file, 'w', newline=self.newline())
+        self.write_header()
+
+        return script_file
+
+
+    def close(self):
+        """
+        Writes the footer of the script and closes it.
+        """
+        if self._fw is None:
+            return
+
+        self.write_footer()
+        self._fw.close()
+        self._fw = None
+
+
+    def newline(self) -> str:
+        """
+        Returns the line ending of the script (see open()). None for the platform default.
+        """
+        return None
+
+
+    def command_name(self, command:list) -> str:
+        """
+        Returns the git command (e.g. 'fetch') of a git command argument list for the timing log.
+        """
+        # git <git_option> <path> [-c key=value ...] <command> ...
+        index = 3
+        while (index < len(command) - 1) and (command[index] == '-c'):
+            index += 2
+
+        return command[index] if index < len(command) else ''
+
+
+    @abc.abstractmethod
+    def write_header(self):
+        """
+        Writes the beginning of the script, e.g. the PATH setting.
+        """
+
+
+    def write_footer(self):
+        """
+        Writes the end of the script. Nothing by default.
+        """
+        pass
+
+
+    @abc.abstractmethod
+    def write_comment(self, text:str):
+        """
+        Writes a comment line, e.g. for a repository or bundle left out.
+        """
+
+
+    @abc.abstractmethod
+    def write_unit(self, name:str, commands:list, guards:dict=None):
+        """
+        Writes the commands of a repository. The commands run in order and stop at the first failure.
+
+        Parameters
+        ----------
+            name : str
+                repository configuration name(s)
+            commands : list
+                list of git command argument lists
+            guards : dict
+                key = index of a command in commands, value = git command argument list printing
+                a number of commits (see git rev-list --count). The command runs only if the number isn't 0.
+                No command is guarded if None.
+        """
+
+
+class batemitter(scriptemitter):
+    """
+    Windows batch file emitter. Commands run in sequence.
+
+    Timing lines hold the start and end time of each command (%TIME%, to the centisecond).
+    """
+
+    EXTENSION = 'bat'
+
+    def write_header(self):
+        self._fw.write('set PATH={0};%PATH%\n'.format(self._git_path))
+
+
+    def write_comment(self, text:str):
+        self._fw.write('@rem ### {0} \n\n'.format(text))
+
+
+    def write_unit(self, name:str, commands:list, guards:dict=None):
+        guards = guards or {}
+        self._fw.write('@rem ### git bundle commands for {0} \n'.format(name))
+        for index, command in enumerate(commands):
+            guarded = index in guards
+            if guarded:
+                self._fw.write('set GITBUNDLE_COUNT=\n')
+                self._fw.write("for /f %%c in ('{0}') do set GITBUNDLE_COUNT=%%c\n".format(' '.join(guards[index])))
+            if self._timing:
+                self._fw.write('set GITBUNDLE_START=%TIME: =0%\n')
+            self._fw.write('{0}{1} \n'.format('if not "%GITBUNDLE_COUNT%"=="0" ' if guarded else '', ' '.join(command)))
+            if self._timing:
+                # Redirection first, as a digit right before >> would be taken as the handle to redirect
+                self._fw.write('>> "%~dp0{3}_timing.log" echo {0} {1} {2} %GITBUNDLE_START% %TIME: =0% %ERRORLEVEL%\n'.format(
+                               name.replace(' ', '_'), index + 1, self.command_name(command), self._script_name))
+        self._fw.write('\n')
+
+
+class shemitter(scriptemitter):
+    """
+    POSIX shell script emitter.
+
+    Each unit is a shell function run in the background, and a FIFO holding one token per job
+    slot limits the number of units running concurrently. The output of each unit goes to
+    <script name>_log/<unit name>.log next to the script, and the timing log to
+    <script name>_log/timing.log. When all units are done, the failed
+    ones are listed and the script exits with 1 if any has failed.
+
+    Timing lines hold the start time of each command (yyyymmddHHMMSS) and its duration in
+    milliseconds, measured with date +%s%N. Where date has no %N (e.g. BSD date), the duration
+    is measured to the second.
+    """
+
+    EXTENSION = 'sh'
+
+    def newline(self) -> str:
+        return '\n'
+
+
+    def write_header(self):
+        self._fw.write('#!/bin/sh\n'
+                       'PATH={0}:"$PATH"\n'
+                       'export PATH\n'
+                       '\n'
+                       'JOBS={1}\n'
+                       'LOG_DIR="$(dirname "$0")/{2}_log"\n'
+                       'STATUS_DIR="$(mktemp -d)"\n'
+                       'mkdir -p "$LOG_DIR"\n'
+                       'trap \'rm -rf "$STATUS_DIR"\' EXIT\n'
+                       '\n'
+                       '# FIFO semaphore holding one token per job slot\n'
+                       'mkfifo "$STATUS_DIR/semaphore"\n'
+                       'exec 3<>"$STATUS_DIR/semaphore"\n'
+                       'i=0\n'
+                       'while [ "$i" -lt "$JOBS" ]; do echo >&3; i=$((i + 1)); done\n'
+                       '\n'
+                       '# Prints the time in nanoseconds, to the second where date has no %N\n'
+                       'now_ns() {{\n'
+                       '    ns=$(date +%s%N)\n'
+                       '    case $ns in\n'
+                       '        *[!0-9]*) echo "$(date +%s)000000000" ;;\n'
+                       '        *) echo "$ns" ;;\n'
+                       '    esac\n'
+                       '}}\n'
+                       '\n'
+                       '# Runs a command and appends its duration in ms to the timing log: timed <index> <name> <command...>\n'
+                       'timed() {{\n'
+                       '    index=$1 name=$2\n'
+                       '    shift 2\n'
+                       '    start=$(date +%Y%m%d%H%M%S)\n'
+                       '    start_ns=$(now_ns)\n'
+                       '    "$@"\n'
+                       '    status=$?\n'
+                       '    elapsed=$(( ($(now_ns) - start_ns) / 1000000 ))\n'
+                       '    echo "$UNIT $index $name $start $elapsed $status" >> "$LOG_DIR/timing.log"\n'
+                       '    return $status\n'
+                       '}}\n'
+                       '\n'
+                       '# Runs a unit in the background once a job slot is free: run_unit <function> <log name>\n'
+                       'run_unit() {{\n'
+                       '    read -r _ <&3\n'
+                       '    (\n'
+                       '        UNIT=$2\n'
+                       '        "$1" > "$LOG_DIR/$2.log" 2>&1\n'
+                       '        echo $? > "$STATUS_DIR/$2.status"\n'
+                       '        echo >&3\n'
+                       '    ) &\n'
+                       '}}\n'
+                       '\n'.format(shlex.quote(self._git_path), self._jobs, self._script_name))
+
+
+    def write_footer(self):
+        self._fw.write('wait\n'
+                       '\n'
+                       'FAILED=0\n'
+                       'for name in {0}; do\n'
+                       '    status=$(cat "$STATUS_DIR/$name.status" 2>/dev/null || echo 255)\n'
+                       '    if [ "$status" != 0 ]; then\n'
+                       '        echo "$name: failed ($status), see $LOG_DIR/$name.log" >&2\n'
+                       '        FAILED=1\n'
+                       '    fi\n'
+                       'done\n'
+                       'exit $FAILED\n'.format(' '.join(self._units)))
+        os.chmod(self._fw.name, 0o755)
+
+
+    def write_comment(self, text:str):
+        self._fw.write('# ### {0}\n\n'.format(text))
+
+
+    def write_unit(self, name:str, commands:list, guards:dict=None):
+        # Unit names are used as function and log file names
+        unit_name = re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+        while unit_name in self._units:
+            unit_name += '_'
+        self._units.append(unit_name)
+
+        function_name = 'unit_{0}'.format(len(self._units))
+        self._fw.write('# ### git bundle commands for {0}\n'.format(name))
+        self._fw.write('{0}() {{\n'.format(function_name))
+        lines = []
+        for index, command in enumerate(commands or [[':']]):
+            line = ' '.join(shlex.quote(arg) for arg in command)
+            if self._timing:
+                line = 'timed {0} {1} {2}'.format(index + 1, shlex.quote(self.command_name(command) or ':'), line)
+            if (guards is not None) and (index in guards):
+                line = 'if [ "$({0})" = 0 ]; then echo {1}; else {2}; fi'.format(
+                       ' '.join(shlex.quote(arg) for arg in guards[index]),
+                       shlex.quote('nothing new, {0} skipped'.format(self.command_name(command))), line)
+            lines.append('    ' + line)
+        self._fw.write(' &&\n'.join(lines))
+        self._fw.write('\n}\n')
+        self._fw.write('run_unit {0} {1}\n\n'.format(function_name, unit_name))
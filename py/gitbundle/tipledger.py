@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+#
+# gitbundle/tipledger.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# ======================================================================================
+# Copyright (c) 2021 Makoto Maeda
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense,and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# ======================================================================================
+
+
+import gitbundle
+
+class tipledger:
+    """
+    Tip ledger module.
+
+    Keeps the tip commit ID (SHA-1) exported by the most recent bundle of each repository
+    and branch in a small json state file. The recorded tips are used as the prerequisite
+    of the next incremental (range) bundle.
+    """
+
+    def __init__(self, ledger_file:str):
+        """
+        Parameters
+        ----------
+            ledger_file : str
+                path to the ledger file. The ledger starts empty if the file doesn't exist.
+        """
+        # A broken ledger reads as empty. Bundles fall back to full bundles.
+        self._store       = gitbundle.jsonstate(ledger_file)
+        self._ledger      = self._store.load()
+        self._modified    = False
+
+
+    def get_entry(self, repository_name:str, branch_name:str) -> dict:
+        """
+        Retrieves the ledger entry of the specified repository and branch.
+
+        Returns
+        ----------
+            entry : dict
+                key = 'tip' (commit id), 'bundle_datetime' (yyyymmddHHMMSS), 'file_name'
+                None if nothing has been recorded for the repository and branch.
+        """
+        return self._ledger.get(repository_name, {}).get(branch_name)
+
+
+    def get_tip(self, repository_name:str, branch_name:str) -> str:
+        """
+        Retrieves the tip commit ID last exported for the specified repository and branch.
+
+        Returns
+        ----------
+            tip : str
+                Commit ID (SHA-1 HASH). Empty string if nothing has been recorded.
+        """
+        entry = self.get_entry(repository_name, branch_name)
+        if entry is None:
+            return ''
+
+        return entry['tip']
+
+
+    def record(self, repository_name:str, branch_name:str, tip:str, bundle_datetime:str, file_name:str):
+        """
+        Records the tip commit ID exported by a bundle.
+        Entries older than the recorded one are ignored.
+
+        Parameters
+        ----------
+            repository_name : str
+                name of repository
+            branch_name : str
+                name of branch
+            tip : str
+                Commit ID (SHA-1 HASH) of the branch in the bundle
+            bundle_datetime : str
+                date and time of bundle generation (yyyymmddHHMMSS)
+            file_name : str
+                bundle file name
+        """
+        entry = self.get_entry(repository_name, branch_name)
+        if (entry is not None) and (entry['bundle_datetime'] >= bundle_datetime):
+            return
+
+        self._ledger.setdefault(repository_name, {})[branch_name] = {
+            'tip'             : tip,
+            'bundle_datetime' : bundle_datetime,
+            'file_name'       : file_name
+        }
+        self._modified = True
+
+
+    def save(self):
+        """
+        Writes the ledger back to the ledger file if modified.
+        """
+        if not(self._modified):
+            return
+
+        self._store.save(self._ledger)
+        self._modified = False
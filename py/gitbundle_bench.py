@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+#
+# gitbundle_bench.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# ======================================================================================
+# Copyright (c) 2021 Makoto Maeda
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software 
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute, 
+# sublicense,and/or sell copies of the Software, and to permit persons to whom the Software is 
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or 
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING 
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, 
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# ======================================================================================
+#
+# Benchmark of the gitbundle module on synthetic repositories and bundle inboxes.
+# Everything is generated locally under the work directory, no network access is needed.
+#
+# usage: python gitbundle_bench.py [--repos=1,4,16] [--inbox=100,1000,5000] [--commits=200]
+#                                  [--branches=4] [--reflog=100] [--repeat=3]
+#                                  [--work=<directory>] [--output=<json file>]
+
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import gitbundle
+
+def git(*args, cwd=None, stdin=None):
+    return subprocess.run(['git'] + list(args), cwd=cwd, input=stdin, check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout.decode()
+
+
+def make_repository(repo_path, commits, branches, reflog):
+    """ 
+    Creates a repository with commits on master and branches forked from it, 
+    each branch with a reflog of the specified length.
+    """
+    git('init', '-q', '-b', 'master', repo_path)
+
+    # git fast-import creates the history in a single process
+    stream = []
+    for i in range(commits):
+        message = 'c{0}'.format(i)
+        data    = 'line {0}\n'.format(i)
+        stream.append('commit refs/heads/master\n'
+                      'mark :{0}\n'
+                      'committer bench <bench@localhost> {1} +0000\n'
+                      'data {2}\n{3}\n'
+                      'M 644 inline file.txt\n'
+                      'data {4}\n{5}\n'.format(i + 1, 1600000000 + i, len(message), message, len(data), data))
+    for b in range(branches):
+        stream.append('reset refs/heads/branch{0}\nfrom :{1}\n\n'.format(b, (b * commits) // max(1, branches) + 1))
+    git('fast-import', '--quiet', cwd=repo_path, stdin=''.join(stream).encode())
+
+    # Reflogs starting with the branch creation like "git branch" writes them
+    for b in range(branches):
+        tip = git('rev-parse', 'refs/heads/branch{0}'.format(b), cwd=repo_path).strip()
+        log_dir = os.path.join(repo_path, '.git', 'logs', 'refs', 'heads')
+        os.makedirs(log_dir, exist_ok=True)
+        with open(os.path.join(log_dir, 'branch{0}'.format(b)), 'w') as fw:
+            fw.write('{0} {1} bench <bench@localhost> 1600000000 +0000\tbranch: Created from master\n'.format('0' * 40, tip))
+            for i in range(reflog - 1):
+                fw.write('{0} {0} bench <bench@localhost> {1} +0000\tcommit: c{2}\n'.format(tip, 1600000001 + i, i))
+
+    git('bundle', 'create', repo_path + '.bundle', '--all', cwd=repo_path)
+
+
+def make_inbox(inbox_dir, repo_names, branches, files):
+    """
+    Fills an inbox with correctly named bundle files, hard links of the repository bundles.
+    """
+    os.makedirs(inbox_dir)
+    start = datetime.datetime(2021, 1, 1)
+    for i in range(files):
+        repo_name = repo_names[i % len(repo_names)]
+        file_name = '{0}@branch{1}@NOORIGIN@{2}.bundle'.format(
+                        repo_name, (i // len(repo_names)) % branches,
+                        (start + datetime.timedelta(minutes=i)).strftime('%Y%m%d%H%M%S'))
+        source = os.path.join(os.path.dirname(inbox_dir), 'repos', repo_name + '.bundle')
+        try:
+            os.link(source, os.path.join(inbox_dir, file_name))
+        except OSError:
+            shutil.copyfile(source, os.path.join(inbox_dir, file_name))
+
+
+def make_config(work_dir, repo_names, branches, inbox_dir):
+    cfg = {
+        'config_common': {
+            'batch_output'  : os.path.join(work_dir, 'bat_out'),
+            'my_repo'       : '',
+            'git_path'      : os.path.dirname(shutil.which('git')),
+            'git_option'    : '-C',
+            'bundle_output' : os.path.join(work_dir, 'bundle_out'),
+            'bundle_option' : '--tags',
+            'merge_input'   : inbox_dir,
+            'merge_option'  : ''
+        },
+        'config_detail': {}
+    }
+    for repo_name in repo_names:
+        cfg['config_detail'][repo_name] = {
+            'path'            : os.path.join(work_dir, 'repos', repo_name),
+            'repository_name' : repo_name,
+            'target_branch'   : ['branch{0}'.format(b) for b in range(branches)],
+            'branch_origin'   : ''
+        }
+
+    cfg_file = os.path.join(work_dir, 'config_{0}_{1}.json'.format(len(repo_names), os.path.basename(inbox_dir)))
+    with open(cfg_file, 'w') as fw:
+        json.dump(cfg, fw, indent=1)
+
+    return cfg_file
+
+
+def measure(repeat, func):
+    """ Returns the best wall-clock time of repeated calls in seconds. """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if (best is None) or (elapsed < best) else best
+    return best
+
+
+def resolve_branches(repo_paths, branches):
+    with gitbundle.gitrepo() as gbr:
+        for repo_path in repo_paths:
+            for b in range(branches):
+                gbr.find_branch(repo_path, 'branch{0}'.format(b))
+                gbr.find_branch_origin(repo_path, 'branch{0}'.format(b))
+
+
+def parse_headers(gbm, inbox_dir):
+    with os.scandir(inbox_dir) as it:
+        for entry in it:
+            gbm.get_branch_name_in_bundle(entry.path)
+
+
+def main():
+    args = {'repos': '1,4,16', 'inbox': '100,1000,5000', 'commits': '200', 'branches': '4',
+            'reflog': '100', 'repeat': '3', 'work': '', 'output': ''}
+    for arg in sys.argv[1:]:
+        key, _, value = arg.lstrip('-').partition('=')
+        if not(key in args):
+            sys.exit('Unknown option: {0}'.format(arg))
+        args[key] = value
+
+    repo_counts  = [int(n) for n in args['repos'].split(',')]
+    inbox_sizes  = [int(n) for n in args['inbox'].split(',')]
+    commits      = int(args['commits'])
+    branches     = int(args['branches'])
+    reflog       = int(args['reflog'])
+    repeat       = int(args['repeat'])
+    work_dir     = args['work'] or tempfile.mkdtemp(prefix='gitbundle-bench-')
+
+    # Keep git away from the user and system configuration
+    os.environ['GIT_CONFIG_NOSYSTEM'] = '1'
+    os.environ['GIT_CONFIG_GLOBAL']   = os.devnull
+    os.environ['GIT_TERMINAL_PROMPT'] = '0'
+
+    report = {
+        'version'    : gitbundle.__version__,
+        'python'     : platform.python_version(),
+        'git'        : git('--version').strip(),
+        'platform'   : platform.platform(),
+        'parameters' : {'repos': repo_counts, 'inbox': inbox_sizes, 'commits': commits,
+                        'branches': branches, 'reflog': reflog, 'repeat': repeat},
+        'setup'      : {},
+        'results'    : []
+    }
+
+    repo_names = ['repo{0:04d}'.format(i) for i in range(max(repo_counts))]
+    start = time.perf_counter()
+    for repo_name in repo_names:
+        make_repository(os.path.join(work_dir, 'repos', repo_name), commits, branches, reflog)
+    report['setup']['repositories_seconds'] = time.perf_counter() - start
+
+    for inbox_size in inbox_sizes:
+        start = time.perf_counter()
+        make_inbox(os.path.join(work_dir, 'inbox_{0}'.format(inbox_size)), repo_names, branches, inbox_size)
+        report['setup']['inbox_{0}_seconds'.format(inbox_size)] = time.perf_counter() - start
+
+    for repo_count in repo_counts:
+        for inbox_size in inbox_sizes:
+            inbox_dir = os.path.join(work_dir, 'inbox_{0}'.format(inbox_size))
+            gbm       = gitbundle.gitbundlemng(make_config(work_dir, repo_names[:repo_count], branches, inbox_dir))
+            repo_paths = [os.path.join(work_dir, 'repos', repo_name) for repo_name in repo_names[:repo_count]]
+
+            timings = {
+                'create_batch'       : measure(repeat, gbm.create_batch),
+                'get_bundle_list'    : measure(repeat, lambda: gbm.get_bundle_list(inbox_dir)),
+                'header_parsing'     : measure(repeat, lambda: parse_headers(gbm, inbox_dir)),
+                'branch_resolution'  : measure(repeat, lambda: resolve_branches(repo_paths, branches))
+            }
+            for benchmark, seconds in timings.items():
+                report['results'].append({'benchmark': benchmark, 'repos': repo_count,
+                                          'inbox': inbox_size, 'seconds': seconds})
+                print('{0:<18} repos={1:<5} inbox={2:<7} {3:.4f}s'.format(benchmark, repo_count, inbox_size, seconds),
+                      file=sys.stderr)
+
+    if args['output']:
+        with open(args['output'], 'w') as fw:
+            json.dump(report, fw, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+
+    if not(args['work']):
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__=='__main__':
+   main()
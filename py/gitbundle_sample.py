@@ -32,6 +32,31 @@ def main():
 
     if(sys.argv[2] == "--mode=genbat"):
        gbm.create_batch()
+    elif(sys.argv[2] == "--mode=plan"):
+       gbm.estimate_export()
+    elif(sys.argv[2] == "--mode=manifest"):
+       gbm.write_manifest()
+    elif(sys.argv[2] == "--mode=split"):
+       gbm.split_bundles()
+    elif(sys.argv[2] == "--mode=assemble"):
+       if gbm.assemble_bundles():
+           sys.exit(1)
+    elif(sys.argv[2] == "--mode=prune"):
+       gbm.prune_bundles("--dry-run" in sys.argv[3:])
+    elif(sys.argv[2] in ("--mode=run", "--mode=import", "--mode=watch")):
+       workers = 0
+       for arg in sys.argv[3:]:
+           if arg.startswith("--workers="):
+               workers = int(arg.replace("--workers=", ""))
+       if(sys.argv[2] == "--mode=watch"):
+           gbm.watch_import(workers)
+           return
+       if(sys.argv[2] == "--mode=run"):
+           results = gbm.run_export(workers)
+       else:
+           results = gbm.run_import(workers)
+       if any(result['returncode'] != 0 for result in results.values()):
+           sys.exit(1)
 
 
 if __name__=='__main__':
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#
+# tests/conftest.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Shared helpers of the gitbundle tests. The tests run offline on temporary repositories.
+
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'py'))
+
+import gitbundle
+
+
+# Keep the user's git configuration out of the test repositories
+GIT_ENV = dict(os.environ,
+               GIT_AUTHOR_NAME='gitbundle', GIT_AUTHOR_EMAIL='gitbundle@example.com',
+               GIT_COMMITTER_NAME='gitbundle', GIT_COMMITTER_EMAIL='gitbundle@example.com',
+               GIT_CONFIG_GLOBAL=os.devnull, GIT_CONFIG_NOSYSTEM='1')
+
+
+def git(*args) -> str:
+    """
+    Runs git and returns its stdout without the trailing newline.
+    """
+    proc = subprocess.run(['git'] + list(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=GIT_ENV, check=True)
+    return proc.stdout.decode().strip()
+
+
+def commit(repo_path, message) -> str:
+    """
+    Commits a new file to the current branch of a repository and returns the commit ID.
+    """
+    with open(os.path.join(repo_path, message + '.txt'), 'w') as fw:
+        fw.write(message + '\n')
+    git('-C', repo_path, 'add', message + '.txt')
+    git('-C', repo_path, 'commit', '-q', '-m', message)
+
+    return git('-C', repo_path, 'rev-parse', 'HEAD')
+
+
+def clone(tmp_path, name) -> tuple:
+    """
+    Creates a bare origin repository with one commit on master and a clone of it tracking master.
+    Returns the paths to the origin and the clone.
+    """
+    origin_path = str(tmp_path / (name + '.git'))
+    clone_path  = str(tmp_path / name)
+    seed_path   = str(tmp_path / (name + '_seed'))
+
+    git('init', '-q', '--bare', '-b', 'master', origin_path)
+    git('init', '-q', '-b', 'master', seed_path)
+    commit(seed_path, 'c1')
+    git('-C', seed_path, 'push', '-q', origin_path, 'master')
+    git('clone', '-q', origin_path, clone_path)
+
+    return origin_path, clone_path
+
+
+@pytest.fixture(autouse=True)
+def git_env(monkeypatch):
+    """
+    Runs the git commands of gitbundle with the test identity and configuration.
+    """
+    for key in ('GIT_AUTHOR_NAME', 'GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_NAME', 'GIT_COMMITTER_EMAIL',
+                'GIT_CONFIG_GLOBAL', 'GIT_CONFIG_NOSYSTEM'):
+        monkeypatch.setenv(key, GIT_ENV[key])
+
+
+@pytest.fixture
+def make_manager(tmp_path):
+    """
+    Returns a function creating a gitbundlemng from config_detail and config_common overrides.
+    """
+    def make(config_detail, **config_common):
+        config = {
+            'config_common': dict({
+                'batch_output'  : str(tmp_path / 'bat_out'),
+                'my_repo'       : 'repo1',
+                'git_path'      : shutil.which('git'),
+                'git_option'    : '-C',
+                'bundle_output' : str(tmp_path / 'out'),
+                'bundle_option' : '',
+                'merge_input'   : str(tmp_path / 'in'),
+                'merge_option'  : ''
+            }, **config_common),
+            'config_detail': config_detail
+        }
+        cfg_file = tmp_path / 'gitbundle_config.json'
+        with open(cfg_file, 'w') as fw:
+            json.dump(config, fw, indent=1)
+
+        return gitbundle.gitbundlemng(str(cfg_file))
+
+    return make
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_bundlecatalog.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of bundlecatalog lookups, its on-disk index and the bundles it leaves out.
+
+
+import json
+import os
+
+import pytest
+
+import gitbundle
+
+
+@pytest.fixture
+def catalog_dir(tmp_path, make_manager):
+    """
+    Bundle directory and a bundle name parser counting the names it parses.
+    """
+    manager = make_manager({})
+    bundle_dir = tmp_path / 'bundles'
+    bundle_dir.mkdir()
+    parsed = []
+
+    def parse(bundle_name):
+        parsed.append(bundle_name)
+        return manager.parse_bundle_name(bundle_name)
+
+    return {'dir': str(bundle_dir), 'parse': parse, 'parsed': parsed, 'index': str(tmp_path / 'index.json')}
+
+
+def write(catalog_dir, file_name, size=10) -> str:
+    bundle_file = os.path.join(catalog_dir['dir'], file_name)
+    with open(bundle_file, 'wb') as fwb:
+        fwb.write(bytes(size))
+
+    return bundle_file
+
+
+def make_catalog(catalog_dir) -> gitbundle.bundlecatalog:
+    return gitbundle.bundlecatalog(catalog_dir['dir'], catalog_dir['parse'], catalog_dir['index'])
+
+
+def test_lookups(catalog_dir):
+    for file_name in ('repo@master@NOORIGIN@20260102000000.bundle', 'repo@master@NOORIGIN@20260101000000.bundle',
+                      'repo@dev,master@NOORIGIN@20260103000000@INC.bundle', 'not_a_bundle.bundle'):
+        write(catalog_dir, file_name)
+
+    catalog = make_catalog(catalog_dir)
+
+    assert [bundle_info['file_name'] for bundle_info in catalog.find_all('repo', 'master')] == \
+           ['repo@master@NOORIGIN@20260101000000.bundle', 'repo@master@NOORIGIN@20260102000000.bundle',
+            'repo@dev,master@NOORIGIN@20260103000000@INC.bundle']
+    assert [bundle_info['branch_name'] for bundle_info in catalog.find_repository('repo')] == ['dev', 'master']
+    assert catalog.find('repo', 'other') is None
+
+
+def test_index_refreshed_on_mtime(catalog_dir):
+    old_file = write(catalog_dir, 'repo@master@NOORIGIN@20260101000000.bundle')
+    make_catalog(catalog_dir)
+    del catalog_dir['parsed'][:]
+
+    # Only the new file and the modified one are parsed again
+    write(catalog_dir, 'repo@master@NOORIGIN@20260102000000.bundle')
+    catalog = make_catalog(catalog_dir)
+    assert catalog_dir['parsed'] == ['repo@master@NOORIGIN@20260102000000.bundle']
+
+    del catalog_dir['parsed'][:]
+    os.utime(old_file, (1, 1))
+    catalog.refresh()
+    assert catalog_dir['parsed'] == ['repo@master@NOORIGIN@20260101000000.bundle']
+    with open(catalog_dir['index'], 'r') as fr:
+        assert json.load(fr)['files']['repo@master@NOORIGIN@20260101000000.bundle']['mtime'] == 1
+
+
+def test_incomplete_chunked_bundle_skipped(catalog_dir):
+    complete   = 'repo@master@NOORIGIN@20260101000000.bundle'
+    incomplete = 'repo@dev@NOORIGIN@20260101000000.bundle'
+    for file_name in (complete, incomplete):
+        write(catalog_dir, file_name, 10)
+        with open(os.path.join(catalog_dir['dir'], file_name + '.chunks.json'), 'w') as fw:
+            json.dump({'file_name': file_name, 'size': 10 if file_name == complete else 20}, fw)
+
+    catalog = make_catalog(catalog_dir)
+
+    assert [bundle_info['file_name'] for bundle_info in catalog.get_file_list()] == [complete]
+
+    write(catalog_dir, incomplete, 20)
+    catalog.refresh()
+    assert sorted(bundle_info['file_name'] for bundle_info in catalog.get_file_list()) == [incomplete, complete]
+
+
+def test_index_of_other_version_rebuilt(catalog_dir):
+    bundle_file = write(catalog_dir, 'repo@master@NOORIGIN@20260101000000.bundle')
+    mtime       = os.stat(bundle_file).st_mtime
+    with open(catalog_dir['index'], 'w') as fw:
+        json.dump({'version': gitbundle.bundlecatalog.INDEX_VERSION + 1, 'bundle_dir': catalog_dir['dir'],
+                   'files': {os.path.basename(bundle_file): {'mtime': mtime, 'info': {'repository_name': 'stale'}}}}, fw)
+
+    catalog = make_catalog(catalog_dir)
+
+    assert catalog_dir['parsed'] == [os.path.basename(bundle_file)]
+    assert catalog.find('repo', 'master')['file_name'] == os.path.basename(bundle_file)
+    with open(catalog_dir['index'], 'r') as fr:
+        assert json.load(fr)['version'] == gitbundle.bundlecatalog.INDEX_VERSION
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_bundlechunk.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of bundlechunk.split() and assemble(), including the resume after broken chunks.
+
+
+import json
+import os
+
+import pytest
+
+import gitbundle
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    for name in ('out', 'chunk', 'in'):
+        (tmp_path / name).mkdir()
+
+    return {name: str(tmp_path / name) for name in ('out', 'chunk', 'in')}
+
+
+def write_bundle(bundle_dir, size) -> str:
+    bundle_file = os.path.join(bundle_dir, 'repo@master@NOORIGIN@20260101000000.bundle')
+    with open(bundle_file, 'wb') as fwb:
+        fwb.write(os.urandom(size))
+
+    return bundle_file
+
+
+def read(path) -> bytes:
+    with open(path, 'rb') as frb:
+        return frb.read()
+
+
+@pytest.mark.parametrize('size, chunk_count', [(2500, 3), (2000, 2), (999, 1), (0, 1)])
+def test_split_and_assemble(dirs, size, chunk_count):
+    bundle_file = write_bundle(dirs['out'], size)
+
+    manifest_file = gitbundle.bundlechunk(1000).split(bundle_file, dirs['chunk'])
+
+    with open(manifest_file, 'r') as fr:
+        manifest = json.load(fr)
+    assert manifest['size'] == size
+    assert [chunk['size'] for chunk in manifest['chunks']] == [min(1000, size - index * 1000) for index in range(chunk_count)]
+    assert sorted(os.listdir(dirs['chunk'])) == sorted([chunk['file_name'] for chunk in manifest['chunks']] +
+                                                       [os.path.basename(manifest_file)])
+
+    assert gitbundle.bundlechunk(1000).assemble(manifest_file, dirs['in']) == []
+    assert read(os.path.join(dirs['in'], os.path.basename(bundle_file))) == read(bundle_file)
+    assert os.listdir(dirs['in']) == [os.path.basename(bundle_file)]
+
+
+def test_assemble_resumes_after_bad_chunks(dirs):
+    bundle_file   = write_bundle(dirs['out'], 3500)
+    chunker       = gitbundle.bundlechunk(1000)
+    manifest_file = chunker.split(bundle_file, dirs['chunk'])
+    part2 = os.path.join(dirs['chunk'], os.path.basename(bundle_file) + '.part0002')
+    part4 = os.path.join(dirs['chunk'], os.path.basename(bundle_file) + '.part0004')
+    good2 = read(part2)
+    good4 = read(part4)
+
+    # Broken content of the same size, and a missing chunk
+    with open(part2, 'wb') as fwb:
+        fwb.write(bytes(len(good2)))
+    os.remove(part4)
+
+    assert chunker.assemble(manifest_file, dirs['in']) == [os.path.basename(part2), os.path.basename(part4)]
+    assert not(os.path.isfile(os.path.join(dirs['in'], os.path.basename(bundle_file))))
+
+    # The verified chunks are not read again
+    os.remove(os.path.join(dirs['chunk'], os.path.basename(bundle_file) + '.part0001'))
+    with open(part2, 'wb') as fwb:
+        fwb.write(good2)
+    with open(part4, 'wb') as fwb:
+        fwb.write(good4)
+
+    assert chunker.assemble(manifest_file, dirs['in']) == []
+    assert read(os.path.join(dirs['in'], os.path.basename(bundle_file))) == read(bundle_file)
+    assert os.listdir(dirs['in']) == [os.path.basename(bundle_file)]
+
+
+def test_assemble_dir_reports_bad_chunks(dirs):
+    bundle_file = write_bundle(dirs['out'], 1500)
+    chunker     = gitbundle.bundlechunk(1000)
+    chunker.split_dir(dirs['out'], dirs['chunk'])
+    os.remove(os.path.join(dirs['chunk'], os.path.basename(bundle_file) + '.part0001'))
+
+    assert chunker.assemble_dir(dirs['chunk'], dirs['in']) == {os.path.basename(bundle_file): [os.path.basename(bundle_file) + '.part0001']}
+    assert chunker.split_dir(dirs['out'], dirs['chunk']) == []
+
+
+def test_assemble_replaces_different_bundle(dirs):
+    # A bundle of the same name and size left over, e.g. by an interrupted copy
+    bundle_file   = write_bundle(dirs['out'], 1500)
+    manifest_file = gitbundle.bundlechunk(1000).split(bundle_file, dirs['chunk'])
+    write_bundle(dirs['in'], 1500)
+
+    assert gitbundle.bundlechunk().assemble(manifest_file, dirs['in']) == []
+    assert read(os.path.join(dirs['in'], os.path.basename(bundle_file))) == read(bundle_file)
+
+
+def test_assemble_checks_whole_bundle(dirs):
+    bundle_file   = write_bundle(dirs['out'], 2500)
+    chunker       = gitbundle.bundlechunk(1000)
+    manifest_file = chunker.split(bundle_file, dirs['chunk'])
+    part3 = os.path.join(dirs['chunk'], os.path.basename(bundle_file) + '.part0003')
+    good3 = read(part3)
+    os.remove(part3)
+    chunker.assemble(manifest_file, dirs['in'])
+
+    # A verified chunk overwritten in the partial file before the resume
+    partial_file = os.path.join(dirs['in'], os.path.basename(bundle_file) + '.partial')
+    with open(partial_file, 'r+b') as fwb:
+        fwb.write(bytes(10))
+    with open(part3, 'wb') as fwb:
+        fwb.write(good3)
+
+    assert len(chunker.assemble(manifest_file, dirs['in'])) == 3
+    assert os.listdir(dirs['in']) == []
+
+    assert chunker.assemble(manifest_file, dirs['in']) == []
+    assert read(os.path.join(dirs['in'], os.path.basename(bundle_file))) == read(bundle_file)
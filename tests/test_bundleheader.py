@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_bundleheader.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of bundleheader.read() against bundles written by git and hand-made headers.
+
+
+import pytest
+
+import gitbundle
+
+from conftest import commit, git
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo_path = str(tmp_path / 'repo')
+    git('init', '-q', '-b', 'master', repo_path)
+
+    return repo_path
+
+
+def write_bundle(path, data:bytes) -> str:
+    with open(path, 'wb') as fwb:
+        fwb.write(data)
+
+    return str(path)
+
+
+def test_read_full_bundle(repo, tmp_path):
+    commit(repo, 'c1')
+    tip = commit(repo, 'c2')
+    bundle_file = str(tmp_path / 'full.bundle')
+    git('-C', repo, 'bundle', 'create', '-q', bundle_file, 'master')
+
+    header = gitbundle.bundleheader().read(bundle_file)
+
+    assert header['version'] in (2, 3)
+    assert header['prerequisites'] == []
+    assert header['refs'] == [[tip, 'refs/heads/master']]
+    with open(bundle_file, 'rb') as frb:
+        frb.seek(header['pack_offset'])
+        assert frb.read(4) == b'PACK'
+
+
+def test_read_incremental_bundle(repo, tmp_path):
+    base = commit(repo, 'c1')
+    commit(repo, 'c2')
+    tip = commit(repo, 'c3')
+    bundle_file = str(tmp_path / 'inc.bundle')
+    git('-C', repo, 'bundle', 'create', '-q', bundle_file, base + '..master')
+
+    header = gitbundle.bundleheader().read(bundle_file)
+
+    assert [prerequisite[0] for prerequisite in header['prerequisites']] == [base]
+    assert header['refs'] == [[tip, 'refs/heads/master']]
+
+
+def test_read_v3_capabilities(tmp_path):
+    data = (b'# v3 git bundle\n'
+            b'@object-format=sha1\n'
+            b'-' + b'1' * 40 + b' base commit\n' +
+            b'2' * 40 + b' refs/heads/master\n'
+            b'\n'
+            b'PACK')
+    bundle_file = write_bundle(tmp_path / 'v3.bundle', data)
+
+    header = gitbundle.bundleheader().read(bundle_file)
+
+    assert header['version'] == 3
+    assert header['capabilities'] == {'object-format': 'sha1'}
+    assert header['prerequisites'] == [['1' * 40, 'base commit']]
+    assert header['refs'] == [['2' * 40, 'refs/heads/master']]
+    assert header['pack_offset'] == data.index(b'PACK')
+
+
+@pytest.mark.parametrize('data', [
+    b'not a bundle\n\nPACK',                                   # signature
+    b'# v2 git bundle\n' + b'2' * 40 + b' refs/heads/master',  # truncated before the blank line
+    b'# v2 git bundle\n' + b'2' * 40 + b'\n\nPACK',            # ref without name
+])
+def test_read_broken_header(tmp_path, data):
+    bundle_file = write_bundle(tmp_path / 'broken.bundle', data)
+
+    with pytest.raises(ValueError):
+        gitbundle.bundleheader().read(bundle_file)
+
+
+def test_read_header_too_large(tmp_path):
+    bundle_file = write_bundle(tmp_path / 'large.bundle',
+                               b'# v2 git bundle\n' + (b'2' * 40 + b' refs/heads/master\n') * 100 + b'\nPACK')
+
+    with pytest.raises(ValueError):
+        gitbundle.bundleheader(max_header_bytes=1024).read(bundle_file)
+
+
+def test_read_files_broken_is_none(repo, tmp_path):
+    commit(repo, 'c1')
+    bundle_file = str(tmp_path / 'full.bundle')
+    git('-C', repo, 'bundle', 'create', '-q', bundle_file, 'master')
+    broken_file = write_bundle(tmp_path / 'broken.bundle', b'not a bundle\n')
+    missing_file = str(tmp_path / 'missing.bundle')
+
+    headers = gitbundle.bundleheader().read_files([bundle_file, broken_file, missing_file])
+
+    assert headers[bundle_file]['refs'][0][1] == 'refs/heads/master'
+    assert headers[broken_file] is None
+    assert headers[missing_file] is None
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_bundlemanifest.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of bundlemanifest.write() and verify(), including bundles of earlier drops.
+
+
+import os
+import shutil
+
+import pytest
+
+import gitbundle
+from conftest import commit, git
+
+
+@pytest.fixture
+def drops(tmp_path):
+    """
+    Returns a function exporting the next drop of bundles into out, after removing the previous drop,
+    and writing its manifest. The bundles and the manifest are copied to in, as on the media.
+    """
+    src_path = str(tmp_path / 'src')
+    dirs     = {name: str(tmp_path / name) for name in ('out', 'in')}
+    for dir_path in dirs.values():
+        os.makedirs(dir_path)
+    git('init', '-q', '-b', 'master', src_path)
+
+    def make(names):
+        for file_name in os.listdir(dirs['out']):
+            os.remove(os.path.join(dirs['out'], file_name))
+        for name in names:
+            commit(src_path, name)
+            git('-C', src_path, 'bundle', 'create', '-q', os.path.join(dirs['out'], name + '.bundle'), 'master')
+
+        gitbundle.bundlemanifest().write(dirs['out'], os.path.join(dirs['out'], 'manifest.json'))
+        for file_name in os.listdir(dirs['out']):
+            shutil.copy2(os.path.join(dirs['out'], file_name), dirs['in'])
+
+        return [name + '.bundle' for name in names]
+
+    dirs['make'] = make
+    dirs['cache'] = str(tmp_path / 'verify_cache.json')
+
+    return dirs
+
+
+def verify(drops, file_names, cache=True) -> dict:
+    return gitbundle.bundlemanifest().verify(drops['in'], os.path.join(drops['in'], 'manifest.json'),
+                                             file_names, drops['cache'] if cache else '')
+
+
+def test_write(drops):
+    file_names = drops['make'](['a', 'b'])
+    manifest = gitbundle.jsonstate(os.path.join(drops['out'], 'manifest.json')).load()
+
+    assert sorted(manifest) == file_names
+    assert manifest['a.bundle']['sha256'] == gitbundle.bundlemanifest().hash_file(os.path.join(drops['out'], 'a.bundle'))
+    assert manifest['a.bundle']['refs'] == gitbundle.bundleheader().read(os.path.join(drops['out'], 'a.bundle'))['refs']
+
+
+def test_verify(drops):
+    file_names = drops['make'](['a', 'b'])
+
+    assert verify(drops, file_names) == {}
+    assert sorted(gitbundle.jsonstate(drops['cache']).load()) == file_names
+
+
+def test_verify_failures(drops):
+    drops['make'](['a', 'b'])
+    with open(os.path.join(drops['in'], 'a.bundle'), 'r+b') as fwb:
+        fwb.seek(-1, os.SEEK_END)
+        last = fwb.read(1)
+        fwb.seek(-1, os.SEEK_END)
+        fwb.write(bytes([last[0] ^ 0xff]))
+    with open(os.path.join(drops['in'], 'b.bundle'), 'ab') as fwb:
+        fwb.write(b'\0')
+    shutil.copy2(os.path.join(drops['in'], 'b.bundle'), os.path.join(drops['in'], 'c.bundle'))
+
+    failures = verify(drops, ['a.bundle', 'b.bundle', 'c.bundle', 'd.bundle'])
+
+    assert failures['a.bundle'] == 'content hash mismatch'
+    assert failures['b.bundle'].startswith('size mismatch')
+    assert failures['c.bundle'] == 'not listed in the manifest'
+    assert failures['d.bundle'] == 'not found'
+    assert gitbundle.jsonstate(drops['cache']).load() == {}
+
+
+def test_earlier_drop_stays_verified(drops):
+    # The manifest of the next drop replaces the one the first bundle was verified against
+    first = drops['make'](['a'])
+    assert verify(drops, first) == {}
+    second = drops['make'](['b'])
+
+    assert verify(drops, first + second) == {}
+    # Without the verified cache, nothing tells that the first bundle has been verified
+    assert verify(drops, first, cache=False) == {'a.bundle': 'not listed in the manifest'}
+
+
+def test_modified_earlier_drop_fails(drops):
+    first = drops['make'](['a'])
+    verify(drops, first)
+    drops['make'](['b'])
+    with open(os.path.join(drops['in'], 'a.bundle'), 'ab') as fwb:
+        fwb.write(b'\0')
+
+    assert verify(drops, first) == {'a.bundle': 'not listed in the manifest'}
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_bundleretention.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of bundleretention.find_chains() and select() on catalogs of empty bundle files,
+# and of the inbox bundles gitbundlemng.prune_bundles() keeps.
+
+
+import datetime
+import os
+
+import pytest
+
+import gitbundle
+from conftest import commit, git
+
+
+JST = datetime.timezone(datetime.timedelta(hours=9))
+NOW = datetime.datetime(2026, 3, 1, 0, 0, 0, tzinfo=JST)
+
+
+@pytest.fixture
+def make_catalog(tmp_path, make_manager):
+    """
+    Returns a function writing bundle files of (name, size) and cataloging them.
+    """
+    manager    = make_manager({})
+    bundle_dir = tmp_path / 'bundles'
+    bundle_dir.mkdir()
+
+    def make(bundles):
+        for file_name, size in bundles:
+            (bundle_dir / file_name).write_bytes(bytes(size))
+
+        return gitbundle.bundlecatalog(str(bundle_dir), manager.parse_bundle_name)
+
+    return make
+
+
+def bundle(day, branch='master', prerequisite='', repository='repo') -> str:
+    name = '{0}@{1}@NOORIGIN@202602{2:02d}000000'.format(repository, branch, day)
+
+    return name + ('@' + prerequisite if prerequisite else '') + '.bundle'
+
+
+def test_select_keep_count(make_catalog):
+    catalog = make_catalog([(bundle(1), 10), (bundle(2), 10), (bundle(3), 10),
+                            (bundle(1, 'dev'), 10), (bundle(2, 'dev'), 10)])
+
+    pruned = gitbundle.bundleretention(keep_count=2).select(catalog, {}, NOW)
+
+    assert sorted(pruned) == [bundle(1)]
+
+
+def test_select_keep_count_multiple_branches(make_catalog):
+    # A bundle of both branches is kept while it is among the newest of either
+    catalog = make_catalog([(bundle(1, 'dev,master'), 10), (bundle(2), 10), (bundle(3), 10)])
+
+    assert gitbundle.bundleretention(keep_count=1).select(catalog, {}, NOW) == {bundle(2): 'beyond the newest 1 of the branch'}
+
+
+def test_select_max_age(make_catalog):
+    catalog = make_catalog([(bundle(1), 10), (bundle(15), 10), (bundle(28), 10)])
+
+    pruned = gitbundle.bundleretention(max_age_days=20).select(catalog, {}, NOW)
+
+    assert sorted(pruned) == [bundle(1)]
+
+
+def test_select_max_bytes_prunes_oldest_first(make_catalog):
+    catalog = make_catalog([(bundle(1), 100), (bundle(2), 100), (bundle(3), 100), (bundle(4), 100)])
+
+    pruned = gitbundle.bundleretention(max_bytes=250).select(catalog, {bundle(1): 'protected'}, NOW)
+
+    # The protected bundle counts toward the budget but is never pruned
+    assert sorted(pruned) == [bundle(2), bundle(3)]
+
+
+def test_select_never_prunes_protected(make_catalog):
+    catalog = make_catalog([(bundle(1), 10), (bundle(2), 10), (bundle(3), 10)])
+
+    pruned = gitbundle.bundleretention(keep_count=1, max_age_days=1).select(catalog, {bundle(1): 'protected'}, NOW)
+
+    assert sorted(pruned) == [bundle(2), bundle(3)]
+
+
+def test_find_chains_whole_chain(make_catalog):
+    catalog = make_catalog([(bundle(1), 10), (bundle(2, prerequisite='a' * 40), 10),
+                            (bundle(3, prerequisite='b' * 40), 10), (bundle(4, prerequisite='c' * 40), 10)])
+
+    assert sorted(gitbundle.bundleretention(keep_count=1).find_chains(catalog)) == \
+           [bundle(1), bundle(2, prerequisite='a' * 40), bundle(3, prerequisite='b' * 40), bundle(4, prerequisite='c' * 40)]
+
+
+def test_find_chains_stops_at_full_bundle(make_catalog):
+    catalog = make_catalog([(bundle(1), 10), (bundle(2), 10), (bundle(3, prerequisite='a' * 40), 10)])
+
+    assert sorted(gitbundle.bundleretention(keep_count=5).find_chains(catalog)) == \
+           [bundle(2), bundle(3, prerequisite='a' * 40)]
+
+
+@pytest.mark.parametrize('policy', [{'keep_count': 1}, {'max_age_days': 1}, {'max_bytes': 15}])
+def test_chain_kept_whatever_policy(make_catalog, policy):
+    # The bundles before the most recent full bundle go, the links of the chain stay
+    catalog   = make_catalog([(bundle(1), 10), (bundle(2), 10), (bundle(3, prerequisite='a' * 40), 10),
+                              (bundle(4, prerequisite='b' * 40), 10)])
+    retention = gitbundle.bundleretention(**policy)
+
+    assert sorted(retention.select(catalog, retention.find_chains(catalog), NOW)) == [bundle(1)]
+
+
+# merge_input shared with bundle_output is recognized whatever its spelling, e.g. with a trailing separator
+@pytest.mark.parametrize('suffix', ['', os.sep])
+def test_prune_inbox_keeps_bundles_not_merged(tmp_path, make_manager, suffix):
+    src_path   = str(tmp_path / 'src')
+    other_path = str(tmp_path / 'other')
+    in_path    = tmp_path / 'in'
+    in_path.mkdir()
+    git('init', '-q', '-b', 'master', src_path)
+    commit(src_path, 'c1')
+    merged = 'repo@master@NOORIGIN@20260201000000.bundle'
+    git('-C', src_path, 'bundle', 'create', '-q', str(in_path / merged), 'master')
+    commit(src_path, 'c2')
+
+    git('clone', '-q', src_path, other_path)
+    git('-C', other_path, 'checkout', '-q', '-b', 'dev')
+    commit(other_path, 'd1')
+    to_import = 'repo@dev@NOORIGIN@20260203000000.bundle'
+    git('-C', other_path, 'bundle', 'create', '-q', str(in_path / to_import), 'dev')
+    # Still being copied
+    copying = 'repo@dev@NOORIGIN@20260202000000.bundle'
+    (in_path / copying).write_bytes((in_path / to_import).read_bytes()[:16])
+
+    manager = make_manager({'repo1': {'path': src_path, 'repository_name': 'repo',
+                                      'target_branch': 'master', 'branch_origin': ''}},
+                           bundle_output=str(in_path), merge_input=str(in_path) + suffix, retention_days=1)
+
+    pruned = manager.prune_bundles(dry_run=True)
+
+    assert [os.path.basename(bundle_prune['path']) for bundle_prune in pruned] == [merged]
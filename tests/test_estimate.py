@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_estimate.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of the bundle estimates and of the largest-first order of the exports.
+
+
+import os
+
+import pytest
+
+from conftest import commit, git
+
+
+@pytest.fixture
+def manager(tmp_path, make_manager):
+    """
+    Manager of a small repository configured before a large one.
+    """
+    config_detail = {}
+    for name, size in (('small', 1), ('large', 64)):
+        repo_path = str(tmp_path / name)
+        git('init', '-q', '-b', 'master', repo_path)
+        with open(os.path.join(repo_path, 'data.bin'), 'wb') as fwb:
+            fwb.write(os.urandom(size * 1024))
+        git('-C', repo_path, 'add', 'data.bin')
+        commit(repo_path, 'c1')
+        config_detail[name] = {'path': repo_path, 'repository_name': name,
+                               'target_branch': 'master', 'branch_origin': 'NOORIGIN'}
+
+    return make_manager(config_detail, estimate_cost=True, script_format='sh')
+
+
+def test_estimate_export(manager):
+    schedule = manager.estimate_export()
+
+    assert [export['name'] for export in schedule] == ['large', 'small']
+    assert schedule[0]['estimate']['bytes'] > 64 * 1024 > schedule[1]['estimate']['bytes'] > 0
+    assert schedule[1]['estimate']['objects'] == 4
+
+
+def test_script_largest_first(tmp_path, manager):
+    manager.create_batch()
+
+    with open(str(tmp_path / 'bat_out' / 'git_bundle_out.sh'), 'r') as fr:
+        units = [line.split()[-1] for line in fr if line.startswith('# ### git bundle commands for ')]
+
+    assert units == ['large', 'small']
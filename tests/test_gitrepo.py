@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_gitrepo.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of the repository handles of gitrepo and the object lookups through their cat-file process.
+
+
+import pytest
+
+import gitbundle
+from conftest import commit, git
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo_path = str(tmp_path / 'repo')
+    git('init', '-q', '-b', 'master', repo_path)
+    commit_ids = [commit(repo_path, 'c{0}'.format(i)) for i in range(5)]
+
+    return {'path': repo_path, 'commits': commit_ids}
+
+
+def catfile(gbr, repo_path):
+    return gbr._handles[repo_path]['catfile']
+
+
+def test_find_commit_ids(repo):
+    missing = ['0' * 40, 'f' * 40]
+    with gitbundle.gitrepo() as gbr:
+        # Looked up over several round-trips
+        gbr.CATFILE_CHUNK = 2
+
+        assert gbr.find_commit_ids(repo['path'], repo['commits'] + missing) == set(repo['commits'])
+        assert gbr.find_commit_ids(repo['path'], []) == set()
+
+
+def test_catfile_process_reused(repo):
+    with gitbundle.gitrepo() as gbr:
+        gbr.find_commit_ids(repo['path'], repo['commits'][:1])
+        process = catfile(gbr, repo['path'])
+        gbr.find_commit_ids(repo['path'], repo['commits'][1:])
+
+        assert catfile(gbr, repo['path']) is process
+        assert process.poll() is None
+
+
+def test_catfile_process_restarted(repo):
+    with gitbundle.gitrepo() as gbr:
+        gbr.find_commit_ids(repo['path'], repo['commits'][:1])
+        process = catfile(gbr, repo['path'])
+        process.kill()
+        process.wait()
+
+        assert gbr.find_commit_ids(repo['path'], repo['commits']) == set(repo['commits'])
+        assert catfile(gbr, repo['path']) is not process
+
+
+def test_close_ends_catfile_processes(repo):
+    gbr = gitbundle.gitrepo()
+    gbr.find_commit_ids(repo['path'], repo['commits'])
+    process = catfile(gbr, repo['path'])
+    gbr.close()
+
+    assert process.poll() is not None
+
+
+def test_least_recently_used_handle_closed(tmp_path, repo):
+    other_path = str(tmp_path / 'other')
+    git('init', '-q', '-b', 'master', other_path)
+    other_commit = commit(other_path, 'o1')
+
+    with gitbundle.gitrepo(max_repos=1) as gbr:
+        gbr.find_commit_ids(repo['path'], repo['commits'])
+        process = catfile(gbr, repo['path'])
+
+        assert gbr.find_commit_ids(other_path, [other_commit]) == {other_commit}
+        assert process.poll() is not None
+        assert list(gbr._handles) == [other_path]
+
+
+def test_handle_in_use_kept(tmp_path, repo):
+    other_path = str(tmp_path / 'other')
+    git('init', '-q', '-b', 'master', other_path)
+    other_commit = commit(other_path, 'o1')
+
+    with gitbundle.gitrepo(max_repos=1) as gbr:
+        # As a worker thread using the repository while the others move on
+        with gbr._gitrepo__use(repo['path']):
+            gbr.find_commit_ids(repo['path'], repo['commits'])
+            process = catfile(gbr, repo['path'])
+
+            # The other handle is the one closed, once the lookup is over
+            assert gbr.find_commit_ids(other_path, [other_commit]) == {other_commit}
+            assert process.poll() is None
+            assert list(gbr._handles) == [repo['path']]
+
+        assert gbr.find_commit_ids(other_path, [other_commit]) == {other_commit}
+        assert process.poll() is not None
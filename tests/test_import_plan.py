@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_import_plan.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of the bundle chains planned by gitbundlemng.plan_import() on temporary repositories.
+
+
+import os
+
+import pytest
+
+from conftest import commit, git
+
+
+@pytest.fixture
+def history(tmp_path):
+    """
+    Source repository with commits c1 .. c4 exported as a full bundle (c1) and two incremental
+    bundles (c1..c3, c3..c4), and a branch at each exported tip.
+    """
+    src_path  = str(tmp_path / 'src')
+    out_path  = str(tmp_path / 'out')
+    os.makedirs(out_path)
+    git('init', '-q', '-b', 'master', src_path)
+
+    commits = {}
+    bundles = {}
+    commits['c1'] = commit(src_path, 'c1')
+    bundles['full'] = 'repo@master@NOORIGIN@20260201000000.bundle'
+    git('-C', src_path, 'bundle', 'create', '-q', os.path.join(out_path, bundles['full']), 'master')
+
+    commits['c2'] = commit(src_path, 'c2')
+    commits['c3'] = commit(src_path, 'c3')
+    bundles['inc1'] = 'repo@master@NOORIGIN@20260202000000@{0}.bundle'.format(commits['c1'])
+    git('-C', src_path, 'bundle', 'create', '-q', os.path.join(out_path, bundles['inc1']), commits['c1'] + '..master')
+
+    commits['c4'] = commit(src_path, 'c4')
+    bundles['inc2'] = 'repo@master@NOORIGIN@20260203000000@{0}.bundle'.format(commits['c3'])
+    git('-C', src_path, 'bundle', 'create', '-q', os.path.join(out_path, bundles['inc2']), commits['c3'] + '..master')
+
+    for name, commit_id in commits.items():
+        git('-C', src_path, 'branch', 'at_' + name, commit_id)
+
+    return {'src': src_path, 'out': out_path, 'commits': commits, 'bundles': bundles}
+
+
+@pytest.fixture
+def plan(tmp_path, history, make_manager):
+    """
+    Returns a function copying bundles to merge_input (truncating those in broken, as bundles
+    still being copied), creating the peer repository at a commit of the source (empty if None)
+    and planning the import into it.
+    """
+    def make_plan(bundle_keys, peer_at=None, broken=()):
+        in_path   = str(tmp_path / 'in')
+        peer_path = str(tmp_path / 'peer')
+        os.makedirs(in_path)
+        for key in bundle_keys:
+            with open(os.path.join(history['out'], history['bundles'][key]), 'rb') as frb, \
+                 open(os.path.join(in_path, history['bundles'][key]), 'wb') as fwb:
+                fwb.write(frb.read(16) if key in broken else frb.read())
+
+        git('init', '-q', '-b', 'master', peer_path)
+        if peer_at is not None:
+            git('-C', peer_path, 'pull', '-q', '--ff-only', history['src'], 'at_' + peer_at)
+
+        manager = make_manager({'repo1': {'path': peer_path, 'repository_name': 'repo',
+                                          'target_branch': 'master', 'branch_origin': ''}})
+
+        return {history['bundles'][key]: entry
+                for entry in manager.plan_import()
+                for key in history['bundles'] if entry['bundle_info']['file_name'] == history['bundles'][key]}
+
+    return make_plan
+
+
+def summary(import_plan, history) -> dict:
+    keys = {file_name: key for key, file_name in history['bundles'].items()}
+
+    return {keys[file_name]: (entry['status'], entry['merge']) for file_name, entry in import_plan.items()}
+
+
+def test_chain_into_empty_repository(tmp_path, plan, history):
+    import_plan = plan(['full', 'inc1', 'inc2'])
+
+    assert summary(import_plan, history) == {'full': ('import', False), 'inc1': ('import', False), 'inc2': ('import', True)}
+    # Only the last bundle of the chain is merged. The missing branch is created at the fetched tip.
+    commands = import_plan[history['bundles']['inc2']]['commands']
+    assert [command[3] for command in commands] == ['fetch', 'checkout', 'push']
+    assert commands[1][4:] == ['-b', 'master', 'refs/gitbundle/master']
+    assert commands[2][4:] == ['origin', 'refs/heads/master:refs/heads/master']
+
+    # The planned commands work in the empty repository
+    origin_path = str(tmp_path / 'origin.git')
+    git('init', '-q', '--bare', origin_path)
+    git('-C', str(tmp_path / 'peer'), 'remote', 'add', 'origin', origin_path)
+    for entry in import_plan.values():
+        for command in entry['commands']:
+            git(*command[1:])
+
+    assert git('-C', str(tmp_path / 'peer'), 'rev-parse', 'master') == history['commits']['c4']
+    assert git('-C', origin_path, 'rev-parse', 'master') == history['commits']['c4']
+
+
+def test_tag_named_as_missing_branch(tmp_path, history, make_manager):
+    in_path   = tmp_path / 'in'
+    peer_path = str(tmp_path / 'peer')
+    in_path.mkdir()
+    bundle_name = 'repo@dev@NOORIGIN@20260201000000.bundle'
+    git('-C', history['src'], 'branch', 'dev', 'at_c4')
+    git('-C', history['src'], 'bundle', 'create', '-q', str(in_path / bundle_name), 'dev')
+    git('init', '-q', '-b', 'master', peer_path)
+    git('-C', peer_path, 'pull', '-q', history['src'], 'at_c1')
+    git('-C', peer_path, 'tag', 'dev')
+
+    manager = make_manager({'repo1': {'path': peer_path, 'repository_name': 'repo',
+                                      'target_branch': 'dev', 'branch_origin': ''}})
+    commands = manager.plan_import()[0]['commands']
+
+    assert commands[1][3:] == ['checkout', '-b', 'dev', 'refs/gitbundle/dev']
+
+
+def test_older_bundles_covered(plan, history):
+    import_plan = plan(['full', 'inc1', 'inc2'], peer_at='c3')
+
+    assert summary(import_plan, history) == {'full': ('noop', False), 'inc1': ('noop', False), 'inc2': ('import', True)}
+    assert import_plan[history['bundles']['full']]['reason'] == 'covered by ' + history['bundles']['inc2']
+
+
+def test_chain_already_merged(plan, history):
+    import_plan = plan(['full', 'inc1', 'inc2'], peer_at='c4')
+
+    assert summary(import_plan, history) == {'full': ('noop', False), 'inc1': ('noop', False), 'inc2': ('noop', False)}
+    assert import_plan[history['bundles']['inc2']]['reason'] == 'already merged'
+
+
+def test_missing_link(plan, history):
+    import_plan = plan(['full', 'inc2'])
+
+    assert summary(import_plan, history) == {'full': ('import', True), 'inc2': ('unusable', False)}
+    assert import_plan[history['bundles']['inc2']]['missing'] == [history['commits']['c3']]
+
+
+def test_missing_link_arrives(plan, history):
+    # The prerequisite of the last bundle is in the repository: the chain restarts from it
+    import_plan = plan(['full', 'inc2'], peer_at='c3')
+
+    assert summary(import_plan, history) == {'full': ('noop', False), 'inc2': ('import', True)}
+
+
+def test_broken_bundle(plan, history):
+    import_plan = plan(['full', 'inc1'], broken=['inc1'])
+
+    assert summary(import_plan, history) == {'full': ('import', True), 'inc1': ('unusable', False)}
+    assert import_plan[history['bundles']['inc1']]['reason'] == 'bundle header is broken'
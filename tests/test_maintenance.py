@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_maintenance.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of the maintenance plan_export() puts before bundle creation.
+
+
+import os
+
+import pytest
+
+from conftest import commit, git
+
+
+@pytest.fixture
+def repo(tmp_path, make_manager):
+    repo_path = str(tmp_path / 'repo')
+    git('init', '-q', '-b', 'master', repo_path)
+    commit(repo_path, 'c1')
+    manager = make_manager({'repo1': {'path': repo_path, 'repository_name': 'repo',
+                                      'target_branch': 'master', 'branch_origin': 'NOORIGIN'}},
+                           maintenance=True, maintenance_objects=3)
+
+    return {'path': repo_path, 'manager': manager}
+
+
+def maintenance_commands(manager) -> list:
+    export = manager.plan_export()[0]
+
+    return [command[3] for command in export['commands'] if command[3] in ('repack', 'commit-graph')]
+
+
+def maintain(repo_path):
+    git('-C', repo_path, 'repack', '-a', '-d', '-q', '--write-bitmap-index')
+    git('-C', repo_path, 'commit-graph', 'write', '--reachable', '--split')
+
+
+def test_never_maintained(repo):
+    assert maintenance_commands(repo['manager']) == ['repack', 'commit-graph']
+
+
+def test_up_to_date(repo):
+    maintain(repo['path'])
+
+    assert maintenance_commands(repo['manager']) == []
+
+
+def test_refs_moved(repo):
+    # One commit adds 3 objects, too few for a bitmap with maintenance_objects 4
+    repo['manager']._cfg['config_common']['maintenance_objects'] = 4
+    maintain(repo['path'])
+    commit(repo['path'], 'c2')
+
+    assert maintenance_commands(repo['manager']) == ['commit-graph']
+
+
+def test_objects_added(repo):
+    # Objects added without moving any ref only need the bitmap
+    maintain(repo['path'])
+    for i in range(3):
+        object_file = os.path.join(repo['path'], 'object{0}.txt'.format(i))
+        with open(object_file, 'w') as fw:
+            fw.write('object {0}\n'.format(i))
+        git('-C', repo['path'], 'hash-object', '-w', object_file)
+
+    assert maintenance_commands(repo['manager']) == ['repack']
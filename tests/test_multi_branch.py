@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_multi_branch.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of bundles holding multiple branches: their names, their export and the generated import script.
+
+
+import os
+import subprocess
+
+import pytest
+
+from conftest import GIT_ENV, clone, commit, git
+
+
+def test_bundle_name(make_manager):
+    manager = make_manager({})
+    bundle_name = manager.make_bundlename('repo', ['feature/a', 'master'], 'NOORIGIN', manager.INCREMENTAL_MARKER)
+
+    assert bundle_name.startswith('repo@feature+a,master@NOORIGIN@')
+    assert bundle_name.endswith('@INC.bundle')
+
+    bundle_info = manager.parse_bundle_name(bundle_name)
+    assert bundle_info['branch_names'] == ['feature/a', 'master']
+    assert bundle_info['branch_name'] == 'feature/a'
+    assert bundle_info['prerequisite'] == 'INC'
+
+
+def test_separator_in_branch_name(make_manager):
+    # Would be read back as two branches
+    manager = make_manager({'repo1': {'path': '.', 'repository_name': 'repo',
+                                      'target_branch': ['a,b', 'master'], 'branch_origin': ''}})
+
+    with pytest.raises(ValueError, match='branch=a,b'):
+        manager.plan_export()
+    with pytest.raises(ValueError):
+        manager.make_bundlename('repo', 'a@b', 'NOORIGIN')
+
+
+@pytest.fixture
+def repos(tmp_path, make_manager):
+    """
+    Source repository with master and dev exporting into one bundle, and a peer without dev
+    importing it. Both are clones of origin.
+    """
+    origin_path, src_path = clone(tmp_path, 'src')
+    git('-C', src_path, 'checkout', '-q', '-b', 'dev')
+    commit(src_path, 'd1')
+    git('-C', src_path, 'push', '-q', '-u', 'origin', 'dev')
+    git('-C', src_path, 'checkout', '-q', 'master')
+    commit(src_path, 'c2')
+    git('-C', src_path, 'push', '-q', 'origin', 'master')
+
+    peer_origin = str(tmp_path / 'peer.git')
+    peer_path   = str(tmp_path / 'peer')
+    git('clone', '-q', '--bare', '--single-branch', '-b', 'master', origin_path, peer_origin)
+    git('-C', peer_origin, 'update-ref', 'refs/heads/master', 'refs/heads/master~1')
+    git('clone', '-q', peer_origin, peer_path)
+
+    return {'src': src_path, 'peer': peer_path, 'peer_origin': peer_origin, 'tmp_path': tmp_path,
+            'make_manager': make_manager}
+
+
+def test_export_one_bundle(repos):
+    manager = repos['make_manager']({'repo1': {'path': repos['src'], 'repository_name': 'repo',
+                                               'target_branch': ['dev', 'master'], 'branch_origin': ''}})
+
+    assert manager.run_export(1)['repo1']['returncode'] == 0
+
+    bundles = os.listdir(str(repos['tmp_path'] / 'out'))
+    assert [manager.parse_bundle_name(file_name)['branch_names'] for file_name in bundles] == [['dev', 'master']]
+    refs = manager.get_branch_name_in_bundle(str(repos['tmp_path'] / 'out' / bundles[0]))
+    assert sorted(ref[1] for ref in refs) == ['refs/heads/dev', 'refs/heads/master']
+
+
+def test_import_script_creates_branch(repos):
+    in_path = str(repos['tmp_path'] / 'in')
+    os.makedirs(in_path)
+    git('-C', repos['src'], 'bundle', 'create', '-q',
+        os.path.join(in_path, 'repo@dev,master@NOORIGIN@20260301000000.bundle'), 'dev', 'master')
+
+    manager = repos['make_manager']({'repo1': {'path': repos['peer'], 'repository_name': 'repo',
+                                               'target_branch': ['dev', 'master'], 'branch_origin': ''}},
+                                    script_format='sh')
+    manager.create_batch()
+
+    proc = subprocess.run(['sh', str(repos['tmp_path'] / 'bat_out' / 'git_bundle_in.sh')],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=GIT_ENV)
+
+    assert proc.returncode == 0, proc.stderr.decode()
+    # The new branch has no upstream. It is pushed to push_remote by name.
+    for branch_name in ('dev', 'master'):
+        assert git('-C', repos['peer_origin'], 'rev-parse', branch_name) == git('-C', repos['src'], 'rev-parse', branch_name)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_origincache.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of origincache and of the branch origins plan_export() takes from it.
+
+
+import pytest
+
+import gitbundle
+from conftest import commit, git
+
+
+def test_record_and_reload(tmp_path):
+    cache_file = str(tmp_path / 'origins.json')
+    origins = gitbundle.origincache(cache_file)
+    origins.record('repo', 'feature', 'a' * 40)
+    origins.record('repo', 'other', 'NOORIGIN')
+    origins.save()
+
+    origins = gitbundle.origincache(cache_file)
+
+    assert origins.get_origin('repo', 'feature') == 'a' * 40
+    assert origins.get_origin('repo', 'other') == ''
+
+
+def test_noorigin_drops_cached_origin(tmp_path):
+    origins = gitbundle.origincache(str(tmp_path / 'origins.json'))
+    origins.record('repo', 'feature', 'a' * 40)
+    origins.record('repo', 'feature', 'NOORIGIN')
+
+    assert origins.get_origin('repo', 'feature') == ''
+
+
+@pytest.fixture
+def repo(tmp_path, make_manager):
+    repo_path = str(tmp_path / 'repo')
+    git('init', '-q', '-b', 'master', repo_path)
+    commits = [commit(repo_path, 'c1'), commit(repo_path, 'c2')]
+    manager = make_manager({'repo1': {'path': repo_path, 'repository_name': 'repo',
+                                      'target_branch': 'feature', 'branch_origin': ''}},
+                           origin_cache=str(tmp_path / 'origins.json'))
+
+    return {'path': repo_path, 'commits': commits, 'manager': manager}
+
+
+def planned_origin(manager) -> str:
+    bundle_name = manager.plan_export()[0]['bundle_name']
+
+    return manager.parse_bundle_name(bundle_name)['branch_origin']
+
+
+def test_origin_cached(repo):
+    git('-C', repo['path'], 'branch', 'feature', repo['commits'][1])
+    assert planned_origin(repo['manager']) == repo['commits'][1]
+
+    # Expired reflog. The origin comes from the cache.
+    git('-C', repo['path'], 'reflog', 'expire', '--expire=all', '--all')
+    assert planned_origin(repo['manager']) == repo['commits'][1]
+
+
+def test_recreated_branch_resolved_again(repo):
+    git('-C', repo['path'], 'branch', 'feature', repo['commits'][1])
+    planned_origin(repo['manager'])
+
+    git('-C', repo['path'], 'branch', '-D', 'feature')
+    git('-C', repo['path'], 'branch', 'feature', repo['commits'][0])
+
+    assert planned_origin(repo['manager']) == repo['commits'][0]
+
+
+def test_merge_base_cached(repo, monkeypatch):
+    # feature is forked from c1 and master has moved on. Without a reflog, the origin is the merge base.
+    git('-C', repo['path'], 'branch', 'feature', repo['commits'][0])
+    git('-C', repo['path'], 'reflog', 'expire', '--expire=all', '--all')
+    repo['manager']._cfg['config_common']['origin_base'] = 'master'
+    assert planned_origin(repo['manager']) == repo['commits'][0]
+
+    # Taken from the cache without starting git
+    def no_git(self, repo_path):
+        raise AssertionError('git started for ' + repo_path)
+    monkeypatch.setattr(gitbundle.gitrepo, '_gitrepo__repo', no_git)
+
+    assert planned_origin(repo['manager']) == repo['commits'][0]
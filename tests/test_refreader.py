@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_refreader.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of refreader against git on loose refs, packed-refs and worktrees.
+
+
+import os
+
+import pytest
+
+import gitbundle
+from conftest import commit, git
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """
+    Repository with master and dev, tag v1 (annotated) and v2 (lightweight), all packed,
+    and dev then moved past its packed entry as a loose ref.
+    """
+    repo_path = str(tmp_path / 'repo')
+    git('init', '-q', '-b', 'master', repo_path)
+    commit(repo_path, 'c1')
+    git('-C', repo_path, 'tag', '-a', '-m', 'v1', 'v1')
+    git('-C', repo_path, 'branch', 'dev')
+    commit(repo_path, 'c2')
+    git('-C', repo_path, 'tag', 'v2')
+    git('-C', repo_path, 'pack-refs', '--all')
+
+    git('-C', repo_path, 'checkout', '-q', 'dev')
+    commit(repo_path, 'd1')
+    git('-C', repo_path, 'checkout', '-q', 'master')
+
+    return repo_path
+
+
+def for_each_ref(repo_path, *patterns) -> dict:
+    refs = {}
+    for line in git('-C', repo_path, 'for-each-ref', '--format=%(objectname) %(refname)', *patterns).splitlines():
+        commit_id, ref_name = line.split()
+        refs[ref_name] = commit_id
+
+    return refs
+
+
+@pytest.mark.parametrize('ref_name', ['HEAD', 'master', 'dev', 'refs/heads/dev', 'v1', 'v2', 'refs/tags/v1'])
+def test_resolve(repo, ref_name):
+    expected = git('-C', repo, 'rev-parse', ref_name)
+
+    assert gitbundle.refreader().resolve(repo, ref_name) == expected
+
+
+def test_resolve_missing(repo):
+    assert gitbundle.refreader().resolve(repo, 'nothing') is None
+
+
+def test_list_refs(repo):
+    reader = gitbundle.refreader()
+
+    assert reader.list_refs(repo, ['refs/heads', 'refs/tags']) == for_each_ref(repo, 'refs/heads', 'refs/tags')
+    assert reader.list_refs(repo, ['refs/heads/m*']) == for_each_ref(repo, 'refs/heads/master')
+
+
+def test_packed_refs_reread(repo):
+    reader = gitbundle.refreader()
+    reader.resolve(repo, 'master')
+    commit(repo, 'c3')
+    git('-C', repo, 'pack-refs', '--all')
+
+    assert reader.resolve(repo, 'master') == git('-C', repo, 'rev-parse', 'master')
+    assert not(os.path.exists(os.path.join(repo, '.git', 'refs', 'heads', 'master')))
+
+
+def test_worktree(tmp_path, repo):
+    worktree_path = str(tmp_path / 'wt')
+    git('-C', repo, 'worktree', 'add', '-q', worktree_path, 'dev')
+    reader = gitbundle.refreader()
+
+    assert reader.resolve(worktree_path, 'HEAD') == git('-C', repo, 'rev-parse', 'dev')
+    assert reader.resolve(worktree_path, 'master') == git('-C', repo, 'rev-parse', 'master')
+    assert os.path.samefile(reader.get_common_dir(worktree_path), os.path.join(repo, '.git'))
+
+
+def test_iter_reflog(repo):
+    entries = list(gitbundle.refreader().iter_reflog(repo, 'refs/heads/dev'))
+
+    assert entries[-1][1] == git('-C', repo, 'rev-parse', 'dev')
+    assert entries[0][0] == '0' * 40
+    assert list(gitbundle.refreader().iter_reflog(repo, 'refs/heads/nothing')) == []
+
+
+def test_not_a_repository(tmp_path):
+    with pytest.raises(ValueError):
+        gitbundle.refreader().resolve(str(tmp_path), 'master')
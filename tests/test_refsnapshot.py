@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_refsnapshot.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of refsnapshot and of the repositories run_export() skips as unchanged.
+
+
+import os
+import time
+
+import pytest
+
+import gitbundle
+from conftest import clone, commit, git
+
+
+def test_snapshot_round_trip(tmp_path):
+    snapshot_file = str(tmp_path / 'snapshot.json')
+    refs = {'refs/heads/master': 'a' * 40}
+    snapshot = gitbundle.refsnapshot(snapshot_file)
+    snapshot.update('repo1', refs, 'repo.bundle')
+    snapshot.save()
+
+    snapshot = gitbundle.refsnapshot(snapshot_file)
+
+    assert snapshot.is_unchanged('repo1', refs)
+    assert not(snapshot.is_unchanged('repo1', {'refs/heads/master': 'b' * 40}))
+    assert not(snapshot.is_unchanged('repo2', refs))
+    assert snapshot.get_file_name('repo1') == 'repo.bundle'
+
+
+def test_update_keeps_file_name(tmp_path):
+    snapshot = gitbundle.refsnapshot(str(tmp_path / 'snapshot.json'))
+    snapshot.update('repo1', {}, 'repo.bundle')
+    snapshot.update('repo1', {'refs/heads/master': 'a' * 40})
+
+    assert snapshot.get_file_name('repo1') == 'repo.bundle'
+
+
+@pytest.fixture
+def exporter(tmp_path, make_manager):
+    origin_path, repo_path = clone(tmp_path, 'repo')
+    manager = make_manager({'repo1': {'path': repo_path, 'repository_name': 'repo',
+                                      'target_branch': 'master', 'branch_origin': 'NOORIGIN'}},
+                           ref_snapshot=str(tmp_path / 'snapshot.json'))
+
+    return {'origin': origin_path, 'path': repo_path, 'manager': manager, 'out': str(tmp_path / 'out'),
+            'tmp_path': tmp_path}
+
+
+def export(exporter) -> dict:
+    # Bundle names are stamped to the second
+    time.sleep(1.1)
+
+    return exporter['manager'].run_export(1)['repo1']
+
+
+def test_unchanged_repository_skipped(exporter):
+    assert not(export(exporter)['skipped'])
+    bundles = os.listdir(exporter['out'])
+
+    assert export(exporter)['skipped']
+    assert os.listdir(exporter['out']) == bundles
+
+
+def test_local_commit_exported(exporter):
+    export(exporter)
+    commit(exporter['path'], 'c2')
+
+    assert not(export(exporter)['skipped'])
+    assert len(os.listdir(exporter['out'])) == 2
+
+
+def test_upstream_commit_exported(exporter):
+    # Commits pushed upstream are fetched before the refs are compared
+    export(exporter)
+    other_path = str(exporter['tmp_path'] / 'other')
+    git('clone', '-q', exporter['origin'], other_path)
+    upstream_tip = commit(other_path, 'c2')
+    git('-C', other_path, 'push', '-q', 'origin', 'master')
+
+    assert not(export(exporter)['skipped'])
+    assert git('-C', exporter['path'], 'rev-parse', 'master') == upstream_tip
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_repodiscovery.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of repodiscovery and of the config_detail entries gitbundlemng expands from "discover_root".
+
+
+import os
+
+import pytest
+
+import gitbundle
+from conftest import git
+
+
+@pytest.fixture
+def root(tmp_path):
+    """
+    Root directory holding team_a/one (working tree), team_a/two.git (bare), team_b/three
+    (working tree with a nested repository) and a plain directory.
+    """
+    root_dir = tmp_path / 'root'
+    (root_dir / 'plain' / 'dir').mkdir(parents=True)
+    git('init', '-q', str(root_dir / 'team_a' / 'one'))
+    git('init', '-q', '--bare', str(root_dir / 'team_a' / 'two.git'))
+    git('init', '-q', str(root_dir / 'team_b' / 'three'))
+    git('init', '-q', str(root_dir / 'team_b' / 'three' / 'nested'))
+
+    return str(root_dir)
+
+
+def test_discover(root):
+    # The walk stops at each repository, so nested repositories aren't reported
+    assert gitbundle.repodiscovery(workers=4).discover(root) == ['team_a/one', 'team_a/two.git', 'team_b/three']
+
+
+def test_discover_missing_root(tmp_path):
+    assert gitbundle.repodiscovery().discover(str(tmp_path / 'nothing')) == []
+
+
+def test_cache(tmp_path, root):
+    cache_file = str(tmp_path / 'discover.json')
+    discovery = gitbundle.repodiscovery(cache_file)
+    discovery.discover(root)
+    discovery.save()
+
+    # A repository deeper in the tree isn't seen until a top-level directory changes
+    git('init', '-q', os.path.join(root, 'plain', 'dir', 'four'))
+    assert gitbundle.repodiscovery(cache_file).discover(root) == ['team_a/one', 'team_a/two.git', 'team_b/three']
+
+    os.makedirs(os.path.join(root, 'team_c'))
+    assert gitbundle.repodiscovery(cache_file).discover(root) == ['plain/dir/four', 'team_a/one', 'team_a/two.git', 'team_b/three']
+
+
+def test_expand_config(root, make_manager):
+    explicit_path = os.path.join(root, 'team_a', 'one')
+    manager = make_manager({
+        'explicit': {'path': explicit_path, 'repository_name': 'one', 'target_branch': 'master', 'branch_origin': ''},
+        'a': {'discover_root': root + '/team_a', 'repository_name': 'a', 'target_branch': 'master', 'branch_origin': ''},
+        # Overlaps the first entry
+        'all': {'discover_root': root, 'discover_pattern': 'team_*/*', 'target_branch': 'dev', 'branch_origin': ''}
+    })
+
+    config_detail = manager.get_config()
+
+    assert sorted(config_detail) == ['a/two.git', 'all/team_b/three', 'explicit']
+    assert config_detail['a/two.git'] == {'path': root + '/team_a/two.git', 'repository_name': 'a+two.git',
+                                          'target_branch': 'master', 'branch_origin': ''}
+    assert config_detail['all/team_b/three']['repository_name'] == 'team_b+three'
+    assert config_detail['all/team_b/three']['target_branch'] == 'dev'
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_run_export.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of the bundles run_export() creates with a bounded pool of workers.
+
+
+import os
+import shutil
+import stat
+
+import pytest
+
+from conftest import clone
+
+
+@pytest.fixture
+def exporter(tmp_path, make_manager):
+    """
+    Manager of three clones and a configuration whose branch doesn't exist, running git through
+    a wrapper in git_path that logs when each command starts and ends.
+    """
+    config_detail = {}
+    for name in ('a', 'b', 'c'):
+        _, repo_path = clone(tmp_path, name)
+        config_detail[name] = {'path': repo_path, 'repository_name': name,
+                               'target_branch': 'master', 'branch_origin': 'NOORIGIN'}
+    config_detail['bad'] = dict(config_detail['c'], repository_name='bad', target_branch='missing')
+
+    wrapper_dir = tmp_path / 'wrapper'
+    wrapper_dir.mkdir()
+    log_file = str(tmp_path / 'git.log')
+    with open(str(wrapper_dir / 'git'), 'w') as fw:
+        fw.write('#!/bin/sh\n'
+                 'echo start >> {0}\n'
+                 'sleep 0.2\n'
+                 '{1} "$@"\n'
+                 'status=$?\n'
+                 'echo end >> {0}\n'
+                 'exit $status\n'.format(log_file, shutil.which('git')))
+    os.chmod(str(wrapper_dir / 'git'), stat.S_IRWXU)
+
+    manager = make_manager(config_detail, git_path=str(wrapper_dir))
+
+    return {'manager': manager, 'log': log_file, 'out': str(tmp_path / 'out')}
+
+
+def max_concurrency(log_file) -> int:
+    running = 0
+    peak    = 0
+    with open(log_file, 'r') as fr:
+        for line in fr:
+            running += 1 if line.strip() == 'start' else -1
+            peak     = max(peak, running)
+
+    return peak
+
+
+def test_failure_isolated(exporter):
+    results = exporter['manager'].run_export(2)
+
+    assert results['bad']['returncode'] != 0
+    assert results['bad']['command'][3:] == ['checkout', 'missing']
+    for name in ('a', 'b', 'c'):
+        assert results[name]['returncode'] == 0
+    assert sorted(bundle_name.split('@')[0] for bundle_name in os.listdir(exporter['out'])) == ['a', 'b', 'c']
+
+
+def test_workers(exporter):
+    exporter['manager'].run_export(2)
+
+    # git of git_path ran the commands, two repositories at a time
+    assert max_concurrency(exporter['log']) == 2
+
+
+def test_run_workers(exporter):
+    exporter['manager']._cfg['config_common']['run_workers'] = 1
+    exporter['manager'].run_export()
+
+    assert max_concurrency(exporter['log']) == 1
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_run_import.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of the bundles run_import() fetches, merges and pushes without checking out branches.
+
+
+import os
+
+import pytest
+
+from conftest import clone, commit, git
+
+
+@pytest.fixture
+def repos(tmp_path, make_manager):
+    """
+    Peer repository (a clone of origin on master) importing the bundles of another clone of origin.
+    """
+    origin_path, peer_path = clone(tmp_path, 'peer')
+    src_path = str(tmp_path / 'src')
+    git('clone', '-q', origin_path, src_path)
+    os.makedirs(str(tmp_path / 'in'))
+
+    manager = make_manager({'repo1': {'path': peer_path, 'repository_name': 'repo',
+                                      'target_branch': 'master', 'branch_origin': ''}})
+
+    return {'origin': origin_path, 'peer': peer_path, 'src': src_path, 'in': str(tmp_path / 'in'),
+            'manager': manager}
+
+
+def export(repos, branch_name, day=1):
+    git('-C', repos['src'], 'bundle', 'create', '-q',
+        os.path.join(repos['in'], 'repo@{0}@NOORIGIN@202603{1:02d}000000.bundle'.format(branch_name, day)),
+        branch_name)
+
+
+def test_fast_forward_checked_out_branch(repos):
+    tip = commit(repos['src'], 'c2')
+    export(repos, 'master')
+
+    assert repos['manager'].run_import(1)['repo1']['returncode'] == 0
+    assert git('-C', repos['peer'], 'rev-parse', 'master') == tip
+    assert git('-C', repos['origin'], 'rev-parse', 'master') == tip
+    # The working tree of the checked out branch follows
+    assert os.path.isfile(os.path.join(repos['peer'], 'c2.txt'))
+    assert git('-C', repos['peer'], 'status', '--porcelain') == ''
+
+
+def test_new_branch(repos):
+    git('-C', repos['src'], 'checkout', '-q', '-b', 'dev')
+    tip = commit(repos['src'], 'd1')
+    export(repos, 'dev')
+
+    assert repos['manager'].run_import(1)['repo1']['returncode'] == 0
+    assert git('-C', repos['peer'], 'rev-parse', 'dev') == tip
+    assert git('-C', repos['origin'], 'rev-parse', 'dev') == tip
+    assert git('-C', repos['peer'], 'symbolic-ref', 'HEAD') == 'refs/heads/master'
+
+
+def test_merge_branch_not_checked_out(repos):
+    git('-C', repos['peer'], 'checkout', '-q', '-b', 'dev')
+    local_tip = commit(repos['peer'], 'p1')
+    git('-C', repos['peer'], 'push', '-q', 'origin', 'dev')
+    git('-C', repos['peer'], 'checkout', '-q', 'master')
+
+    git('-C', repos['src'], 'checkout', '-q', '-b', 'dev')
+    fetched_tip = commit(repos['src'], 's1')
+    export(repos, 'dev')
+
+    assert repos['manager'].run_import(1)['repo1']['returncode'] == 0
+    assert sorted(git('-C', repos['peer'], 'rev-parse', 'dev^1', 'dev^2').split()) == sorted([local_tip, fetched_tip])
+    assert git('-C', repos['origin'], 'rev-parse', 'dev') == git('-C', repos['peer'], 'rev-parse', 'dev')
+    # Merged in a temporary worktree, removed afterwards
+    assert git('-C', repos['peer'], 'symbolic-ref', 'HEAD') == 'refs/heads/master'
+    assert len(git('-C', repos['peer'], 'worktree', 'list').splitlines()) == 1
+
+
+def test_already_merged(repos):
+    export(repos, 'master')
+    tip = git('-C', repos['peer'], 'rev-parse', 'master')
+
+    assert repos['manager'].run_import(1) == {}
+    assert git('-C', repos['peer'], 'rev-parse', 'master') == tip
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_runmetrics.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of the metrics files written by the runs with "metrics_output" set.
+
+
+import json
+import os
+
+import pytest
+
+from conftest import clone, commit, git
+
+
+def load_metrics(metrics_dir, mode) -> dict:
+    # The latest metrics file of a mode
+    file_names = sorted(file_name for file_name in os.listdir(metrics_dir) if file_name.startswith('metrics_' + mode))
+    with open(os.path.join(metrics_dir, file_names[-1]), 'r') as fr:
+        return json.load(fr)
+
+
+def test_import_metrics(tmp_path, make_manager, capsys):
+    origin_path, peer_path = clone(tmp_path, 'peer')
+    src_path = str(tmp_path / 'src')
+    git('clone', '-q', origin_path, src_path)
+    commit(src_path, 'c2')
+    git('-C', src_path, 'checkout', '-q', '-b', 'dev')
+    commit(src_path, 'd1')
+    os.makedirs(str(tmp_path / 'in'))
+    bundle_name = 'repo@dev,master@NOORIGIN@20260301000000.bundle'
+    git('-C', src_path, 'bundle', 'create', '-q', str(tmp_path / 'in' / bundle_name), 'dev', 'master')
+
+    metrics_dir = str(tmp_path / 'metrics')
+    manager = make_manager({'repo1': {'path': peer_path, 'repository_name': 'repo',
+                                      'target_branch': ['dev', 'master'], 'branch_origin': ''}},
+                           metrics_output=metrics_dir)
+
+    assert manager.run_import(1)['repo1']['returncode'] == 0
+    # One file name per bundle, whatever the number of branches it holds
+    assert 'repo1: imported {0}\n'.format(bundle_name) in capsys.readouterr().out
+
+    metrics = load_metrics(metrics_dir, 'import')
+    assert metrics['counters'] == {'repositories_imported': 1, 'bundles_imported': 2}
+    assert metrics['bundles'][bundle_name]['bytes_read'] == os.path.getsize(str(tmp_path / 'in' / bundle_name))
+    for stage in ('plan_import', 'fetch', 'merge'):
+        assert metrics['stages'][stage]['count'] == 1
+        assert metrics['stages'][stage]['seconds'] > 0
+    assert metrics['stages']['fetch']['repositories'] == {peer_path: metrics['stages']['fetch']['seconds']}
+    assert [command['command'].split()[3] for command in metrics['commands']] == ['fetch', 'update-ref', 'push',
+                                                                                  'merge', 'push']
+    assert all((command['returncode'] == 0) and (command['seconds'] > 0) for command in metrics['commands'])
+
+
+def test_export_metrics(tmp_path, make_manager):
+    origin_path, repo_path = clone(tmp_path, 'repo')
+    metrics_dir = str(tmp_path / 'metrics')
+    manager = make_manager({'repo1': {'path': repo_path, 'repository_name': 'repo',
+                                      'target_branch': 'master', 'branch_origin': 'NOORIGIN'}},
+                           bundle_mode='incremental', tip_ledger=str(tmp_path / 'tips.json'),
+                           metrics_output=metrics_dir)
+
+    manager.run_export(1)
+    metrics = load_metrics(metrics_dir, 'export')
+    assert metrics['counters'] == {'repositories_exported': 1}
+    assert [command['command'].split()[3] for command in metrics['commands']] == ['checkout', 'pull', 'bundle']
+
+    # Nothing new since the first bundle. The guard counting the new commits is timed as well.
+    assert manager.run_export(1)['repo1']['skipped']
+    metrics = load_metrics(metrics_dir, 'export')
+    assert metrics['counters'] == {'repositories_skipped': 1}
+    assert [command['command'].split()[3] for command in metrics['commands']] == ['checkout', 'pull', 'rev-list']
+    assert all(command['seconds'] > 0 for command in metrics['commands'])
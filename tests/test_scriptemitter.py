@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_scriptemitter.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of the scripts written by batemitter and shemitter. The shell scripts are run.
+
+
+import os
+import subprocess
+
+import pytest
+
+import gitbundle
+
+
+def run(script_file) -> subprocess.CompletedProcess:
+    return subprocess.run(['sh', script_file], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def test_abstract_emitter():
+    with pytest.raises(TypeError):
+        gitbundle.scriptemitter('/usr/bin')
+
+
+def test_sh_units(tmp_path):
+    marks = {name: str(tmp_path / name) for name in ('a1', 'a2', 'b1', 'b2', 'c1')}
+    with gitbundle.shemitter('/usr/bin', 2) as emitter:
+        script_file = emitter.open(str(tmp_path), 'units')
+        emitter.write_unit('a', [['touch', marks['a1']], ['touch', marks['a2']]])
+        emitter.write_unit('b', [['touch', marks['b1']], ['false'], ['touch', marks['b2']]])
+        emitter.write_comment('c is unchanged')
+        emitter.write_unit('c', [['touch', marks['c1']]])
+
+    proc = run(script_file)
+
+    # A failing unit stops at the failed command and doesn't stop the others
+    assert proc.returncode == 1
+    assert sorted(name for name, path in marks.items() if os.path.exists(path)) == ['a1', 'a2', 'b1', 'c1']
+    assert proc.stderr.decode().startswith('b: failed (1)')
+    assert sorted(os.listdir(str(tmp_path / 'units_log'))) == ['a.log', 'b.log', 'c.log']
+
+
+def test_sh_guard(tmp_path):
+    marks = {name: str(tmp_path / name) for name in ('skipped', 'run')}
+    with gitbundle.shemitter('/usr/bin') as emitter:
+        script_file = emitter.open(str(tmp_path), 'guards')
+        emitter.write_unit('a', [['touch', marks['skipped']]], {0: ['echo', '0']})
+        emitter.write_unit('b', [['touch', marks['run']]], {0: ['echo', '2']})
+
+    assert run(script_file).returncode == 0
+    assert [os.path.exists(marks['skipped']), os.path.exists(marks['run'])] == [False, True]
+
+
+def test_sh_unit_names(tmp_path):
+    with gitbundle.shemitter('/usr/bin') as emitter:
+        script_file = emitter.open(str(tmp_path), 'names')
+        emitter.write_unit('team/a b', [['true']])
+        emitter.write_unit('team/a_b', [['true']])
+
+    assert run(script_file).returncode == 0
+    assert sorted(os.listdir(str(tmp_path / 'names_log'))) == ['team_a_b.log', 'team_a_b_.log']
+
+
+def test_bat_unit(tmp_path):
+    with gitbundle.batemitter('C:/git/bin') as emitter:
+        script_file = emitter.open(str(tmp_path), 'units')
+        emitter.write_unit('a', [['git', '-C', 'C:/a', 'pull'], ['git', '-C', 'C:/a', 'bundle', 'create', 'x']],
+                           {1: ['git', '-C', 'C:/a', 'rev-list', '--count', 'master']})
+
+    with open(script_file, 'r') as fr:
+        lines = fr.read().splitlines()
+
+    assert lines[0] == 'set PATH=C:/git/bin;%PATH%'
+    assert 'git -C C:/a pull ' in lines
+    assert "for /f %%c in ('git -C C:/a rev-list --count master') do set GITBUNDLE_COUNT=%%c" in lines
+    assert 'if not "%GITBUNDLE_COUNT%"=="0" git -C C:/a bundle create x ' in lines
+
+
+def test_sh_timing(tmp_path):
+    with gitbundle.shemitter('/usr/bin', timing=True) as emitter:
+        script_file = emitter.open(str(tmp_path), 'timing')
+        # Shaped like git <git_option> <path> <command> for the command name
+        emitter.write_unit('a', [['env', 'A=1', 'B=1', 'sleep', '0.2'], ['env', 'A=1', 'B=1', 'false']])
+
+    assert run(script_file).returncode == 1
+
+    with open(str(tmp_path / 'timing_log' / 'timing.log'), 'r') as fr:
+        lines = [line.split() for line in fr]
+
+    assert [line[:3] + line[5:] for line in lines] == [['a', '1', 'sleep', '0'], ['a', '2', 'false', '1']]
+    assert len(lines[0][3]) == 14
+    # Measured in milliseconds, not to the second
+    assert 150 <= int(lines[0][4]) < 1000
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_tipledger.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of tipledger and of the incremental bundles run_export() creates from it.
+
+
+import os
+import time
+
+import pytest
+
+import gitbundle
+from conftest import clone, commit, git
+
+
+def test_record_keeps_newest(tmp_path):
+    ledger_file = str(tmp_path / 'state' / 'ledger.json')
+    ledger = gitbundle.tipledger(ledger_file)
+    ledger.record('repo', 'master', 'a' * 40, '20260202000000', 'new.bundle')
+    ledger.record('repo', 'master', 'b' * 40, '20260201000000', 'old.bundle')
+    ledger.save()
+
+    ledger = gitbundle.tipledger(ledger_file)
+
+    assert ledger.get_tip('repo', 'master') == 'a' * 40
+    assert ledger.get_entry('repo', 'master')['file_name'] == 'new.bundle'
+    assert ledger.get_tip('repo', 'dev') == ''
+
+
+def test_broken_ledger_reads_empty(tmp_path):
+    ledger_file = tmp_path / 'ledger.json'
+    ledger_file.write_text('{"repo": ')
+
+    assert gitbundle.tipledger(str(ledger_file)).get_tip('repo', 'master') == ''
+
+
+@pytest.fixture
+def exporter(tmp_path, make_manager):
+    _, repo_path = clone(tmp_path, 'repo')
+    manager = make_manager({'repo1': {'path': repo_path, 'repository_name': 'repo',
+                                      'target_branch': 'master', 'branch_origin': 'NOORIGIN'}},
+                           bundle_mode='incremental', tip_ledger=str(tmp_path / 'ledger.json'))
+
+    return {'path': repo_path, 'manager': manager, 'out': str(tmp_path / 'out')}
+
+
+def export(exporter) -> dict:
+    # Bundle names are stamped to the second
+    time.sleep(1.1)
+
+    return exporter['manager'].run_export(1)['repo1']
+
+
+def test_incremental_export(exporter):
+    first_tip = git('-C', exporter['path'], 'rev-parse', 'master')
+    assert export(exporter)['returncode'] == 0
+    full_bundles = os.listdir(exporter['out'])
+    assert [file_name.count('@') for file_name in full_bundles] == [3]
+
+    commit(exporter['path'], 'c2')
+    assert export(exporter)['returncode'] == 0
+    incremental = [file_name for file_name in os.listdir(exporter['out']) if not(file_name in full_bundles)]
+
+    # The incremental bundle requires the tip of the full bundle
+    assert [file_name.endswith('@{0}.bundle'.format(first_tip)) for file_name in incremental] == [True]
+    header = gitbundle.bundleheader().read(os.path.join(exporter['out'], incremental[0]))
+    assert [prerequisite[0] for prerequisite in header['prerequisites']] == [first_tip]
+
+    ledger = gitbundle.tipledger(exporter['manager']._cfg['config_common']['tip_ledger'])
+    assert ledger.get_tip('repo', 'master') == git('-C', exporter['path'], 'rev-parse', 'master')
+
+
+def test_incremental_export_without_new_commits(exporter):
+    export(exporter)
+    bundles = os.listdir(exporter['out'])
+
+    result = export(exporter)
+
+    assert (result['returncode'], result['skipped']) == (0, True)
+    assert os.listdir(exporter['out']) == bundles
+
+
+def test_rewritten_tip_falls_back_to_full(exporter):
+    export(exporter)
+    git('-C', exporter['path'], 'commit', '-q', '--amend', '-m', 'rewritten')
+    git('-C', exporter['path'], 'push', '-q', '-f', 'origin', 'master')
+    bundles = os.listdir(exporter['out'])
+
+    assert export(exporter)['returncode'] == 0
+    assert [file_name.count('@') for file_name in os.listdir(exporter['out']) if not(file_name in bundles)] == [3]
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#
+# tests/test_watch_import.py
+# (https://github.com/makotoon/git_bundle_manager)
+#
+# Tests of watch_import() on a temporary inbox, polled a bounded number of times on a fake clock.
+
+
+import os
+import sys
+import time
+
+import pytest
+
+import gitbundle
+from conftest import clone, commit, git
+
+
+class clock:
+    """
+    Stands in for the time module of gitbundlemng. Each sleep() runs the next step and moves
+    the clock forward. The watch is interrupted once there is no step left.
+    """
+
+    def __init__(self, steps):
+        self._steps       = list(steps)
+        self._now         = 0.0
+        self.perf_counter = time.perf_counter
+
+    def sleep(self, seconds):
+        if self._steps == []:
+            raise KeyboardInterrupt
+        self._steps.pop(0)()
+        self._now += seconds
+
+    def monotonic(self):
+        return self._now
+
+
+@pytest.fixture
+def repos(tmp_path, make_manager):
+    """
+    Peer repository (a clone of origin at c1) and two incremental bundles of another clone,
+    c1..c2 and c2..c3, to drop into the inbox.
+    """
+    origin_path, peer_path = clone(tmp_path, 'peer')
+    src_path = str(tmp_path / 'src')
+    out_path = str(tmp_path / 'bundles')
+    git('clone', '-q', origin_path, src_path)
+    os.makedirs(out_path)
+
+    commits = {'c1': git('-C', peer_path, 'rev-parse', 'master')}
+    bundles = {}
+    for day, name in enumerate(('c2', 'c3'), 1):
+        previous      = commits['c{0}'.format(day)]
+        commits[name] = commit(src_path, name)
+        bundles[name] = 'repo@master@NOORIGIN@202603{0:02d}000000@{1}.bundle'.format(day, previous)
+        git('-C', src_path, 'bundle', 'create', '-q', os.path.join(out_path, bundles[name]), previous + '..master')
+
+    manager = make_manager({'repo1': {'path': peer_path, 'repository_name': 'repo',
+                                      'target_branch': 'master', 'branch_origin': ''}},
+                           watch_interval=1, watch_settle=2)
+    os.makedirs(manager._cfg['config_common']['merge_input'])
+
+    return {'peer': peer_path, 'out': out_path, 'in': manager._cfg['config_common']['merge_input'],
+            'commits': commits, 'bundles': bundles, 'manager': manager}
+
+
+def drop(repos, name, size=None):
+    # Copies a bundle into the inbox, only its first size bytes to stand for a copy in progress
+    with open(os.path.join(repos['out'], repos['bundles'][name]), 'rb') as frb, \
+         open(os.path.join(repos['in'], repos['bundles'][name]), 'wb') as fwb:
+        fwb.write(frb.read(size) if size is not None else frb.read())
+
+
+def watch(repos, monkeypatch, steps):
+    monkeypatch.setattr(sys.modules['gitbundle.gitbundlemng'], 'time', clock(steps))
+    repos['manager'].watch_import(1)
+
+
+def assert_tip(repos, name):
+    assert git('-C', repos['peer'], 'rev-parse', 'master') == repos['commits'][name]
+
+
+def test_settle_and_retry(repos, monkeypatch):
+    watch(repos, monkeypatch, [
+        # c2..c3 arrives first. Imported once settled, it lacks c2 and is unusable.
+        lambda: drop(repos, 'c3'),
+        lambda: None,
+        lambda: assert_tip(repos, 'c1'),
+        # c1..c2 is copied over two polls. Not imported while its size changes.
+        lambda: drop(repos, 'c2', 16),
+        lambda: drop(repos, 'c2'),
+        lambda: assert_tip(repos, 'c1'),
+        # Settled. c2..c3 is retried together with it.
+        lambda: assert_tip(repos, 'c1'),
+        lambda: assert_tip(repos, 'c3')
+    ])
+
+    assert_tip(repos, 'c3')
+
+
+def test_retry_on_manifest(repos, monkeypatch):
+    # A bundle arriving before the manifest it is listed in fails verification until the manifest arrives
+    repos['manager']._cfg['config_common']['bundle_manifest'] = 'manifest.json'
+    os.remove(os.path.join(repos['out'], repos['bundles']['c3']))
+    gitbundle.bundlemanifest().write(repos['out'], os.path.join(repos['out'], 'manifest.json'))
+
+    def drop_manifest():
+        with open(os.path.join(repos['out'], 'manifest.json'), 'rb') as frb, \
+             open(os.path.join(repos['in'], 'manifest.json'), 'wb') as fwb:
+            fwb.write(frb.read())
+
+    watch(repos, monkeypatch, [
+        lambda: drop(repos, 'c2'),
+        lambda: None,
+        lambda: assert_tip(repos, 'c1'),
+        # Nothing but the manifest has changed. The unusable bundle is retried.
+        drop_manifest,
+        lambda: None,
+        lambda: assert_tip(repos, 'c1')
+    ])
+
+    assert_tip(repos, 'c2')